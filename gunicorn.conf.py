@@ -0,0 +1,39 @@
+"""
+gunicorn settings for the Docker image.
+
+SERVER_MODE=wsgi (default) runs the WSGI app on threaded workers;
+SERVER_MODE=asgi runs the ASGI app (async views under /api/async/) on
+uvicorn workers. WEB_CONCURRENCY and WEB_THREADS size the pool.
+"""
+import multiprocessing
+import os
+import shutil
+
+SERVER_MODE = os.getenv("SERVER_MODE", "wsgi")
+
+bind = os.getenv("BIND", "0.0.0.0:8000")
+workers = int(os.getenv("WEB_CONCURRENCY", multiprocessing.cpu_count() * 2 + 1))
+
+if SERVER_MODE == "asgi":
+    wsgi_app = "inventory_management.asgi:application"
+    worker_class = "uvicorn.workers.UvicornWorker"
+else:
+    wsgi_app = "inventory_management.wsgi:application"
+    worker_class = "gthread"
+    threads = int(os.getenv("WEB_THREADS", "4"))
+
+# Recycle workers now and then so a slow leak can't grow forever
+max_requests = 5000
+max_requests_jitter = 500
+timeout = 60
+graceful_timeout = 30
+keepalive = 5
+
+accesslog = "-"
+errorlog = "-"
+
+
+def on_starting(server):
+    # Workers sum their /metrics totals from files in METRICS_DIR (see
+    # settings_production); start counting from zero with the server
+    shutil.rmtree(os.getenv("METRICS_DIR", "/tmp/location-metrics"), ignore_errors=True)
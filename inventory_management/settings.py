@@ -49,11 +49,14 @@ INSTALLED_APPS = [
 ]
 
 MIDDLEWARE = [
+    # First, so its timings cover every other middleware
+    'location.instrumentation.QueryInstrumentationMiddleware',
     'django.middleware.security.SecurityMiddleware',
     'django.contrib.sessions.middleware.SessionMiddleware',
     'django.middleware.common.CommonMiddleware',
     'django.middleware.csrf.CsrfViewMiddleware',
     'django.contrib.auth.middleware.AuthenticationMiddleware',
+    'location.middleware.CurrentUserMiddleware',
     'django.contrib.messages.middleware.MessageMiddleware',
     'django.middleware.clickjacking.XFrameOptionsMiddleware',
 ]
@@ -99,6 +102,71 @@ DATABASES = {
 
 
 
+# Set by the production profile when DATABASE_URL goes through pgbouncer in
+# transaction pooling mode (see settings_production)
+DB_PGBOUNCER = False
+
+# Connection that exports and sitemaps read through server-side cursors;
+# the production profile points it past pgbouncer, which can't keep them
+DB_STREAMING_ALIAS = 'default'
+
+# Adds a sleep to every query, to load test the WSGI and ASGI paths under
+# slow-database conditions (see the load_test command). Never set in production.
+DB_SIMULATED_LATENCY_MS = float(os.getenv("DB_SIMULATED_LATENCY_MS", "0"))
+
+
+# Cache
+# CACHE_URL picks the backend shared by all processes:
+#   redis://host:6379/0          Redis (or any Redis-compatible server)
+#   file:///var/tmp/django_cache  files on disk, for single-host setups
+#   unset                        per-process memory, used by the tests
+
+CACHE_URL = os.getenv("CACHE_URL", "")
+cache_url = urlparse(CACHE_URL)
+
+if cache_url.scheme in ('redis', 'rediss'):
+    CACHES = {
+        'default': {
+            'BACKEND': 'django.core.cache.backends.redis.RedisCache',
+            'LOCATION': CACHE_URL,
+            'KEY_PREFIX': 'inventory',
+        }
+    }
+elif cache_url.scheme == 'file':
+    CACHES = {
+        'default': {
+            'BACKEND': 'django.core.cache.backends.filebased.FileBasedCache',
+            'LOCATION': cache_url.path,
+        }
+    }
+else:
+    CACHES = {
+        'default': {
+            'BACKEND': 'django.core.cache.backends.locmem.LocMemCache',
+            'OPTIONS': {'MAX_ENTRIES': 10000},
+        }
+    }
+
+# Cache alias used by location.cache
+LOCATION_CACHE_ALIAS = 'default'
+
+# Requests running more queries than this log their slowest statements
+QUERY_COUNT_WARNING = int(os.getenv("QUERY_COUNT_WARNING", "50"))
+# Addresses allowed to scrape /metrics without a staff login
+METRICS_ALLOWED_IPS = os.getenv("METRICS_ALLOWED_IPS", "127.0.0.1,::1").split(",")
+# Directory where every server process writes its /metrics totals, so any
+# of them can report the sum; unset keeps them per process
+METRICS_DIR = os.getenv("METRICS_DIR") or None
+
+# Localized accommodation content: languages tried after the requested one,
+# before LOCALIZATION_DEFAULT_LANGUAGE
+LOCALIZATION_DEFAULT_LANGUAGE = 'en'
+LOCALIZATION_FALLBACKS = {
+    'fr': ['en'],
+    'de': ['en'],
+}
+
+
 # Password validation
 # https://docs.djangoproject.com/en/5.1/ref/settings/#auth-password-validators
 
@@ -146,4 +214,11 @@ DEFAULT_AUTO_FIELD = 'django.db.models.BigAutoField'
 GIS_ENABLED = True
 
 MEDIA_URL = '/media/'
-MEDIA_ROOT = os.path.join(BASE_DIR, 'media')
\ No newline at end of file
+MEDIA_ROOT = os.path.join(BASE_DIR, 'media')
+
+# Accommodation image renditions (location.images)
+IMAGE_URL = '/images/'
+IMAGE_WORKERS = int(os.getenv("IMAGE_WORKERS", "2"))
+# nginx internal location over MEDIA_ROOT, e.g. /protected-media/; unset
+# serves the files from Django
+IMAGE_ACCEL_REDIRECT = os.getenv("IMAGE_ACCEL_REDIRECT") or None
@@ -0,0 +1,106 @@
+"""
+Production profile. Select it with
+DJANGO_SETTINGS_MODULE=inventory_management.settings_production
+(the Docker image does). Everything not overridden here comes from
+settings.py.
+
+Environment:
+  DJANGO_SECRET_KEY          required
+  DJANGO_ALLOWED_HOSTS       comma separated
+  DB_CONN_MAX_AGE            seconds a connection is reused (default 600;
+                             use 0 under ASGI and let pgbouncer pool)
+  DB_STATEMENT_TIMEOUT_MS    cancel queries running longer (default 30000;
+                             0 for long bulk loads run as commands)
+  DB_PGBOUNCER               1 when DATABASE_URL points at pgbouncer in
+                             transaction pooling mode
+  DATABASE_DIRECT_URL        PostgreSQL itself, bypassing pgbouncer; used for
+                             the server-side cursors of exports and by
+                             processes started with DB_DIRECT=1
+  DB_DIRECT                  1 for processes that need a session of their
+                             own: the job worker and the feed loaders, whose
+                             staging tables live across transactions
+  METRICS_DIR                where server processes share their /metrics
+                             totals (default /tmp/location-metrics)
+  IMAGE_ACCEL_REDIRECT       nginx internal location over MEDIA_ROOT (default
+                             /protected-media/; empty serves images from
+                             Django)
+"""
+
+import copy
+import os
+from urllib.parse import urlparse
+
+from .settings import *  # noqa: F401,F403
+from .settings import DATABASES
+
+# A copy, so importing this module never changes the dev settings' dict
+DATABASES = copy.deepcopy(DATABASES)
+
+DEBUG = False
+
+SECRET_KEY = os.environ["DJANGO_SECRET_KEY"]
+
+ALLOWED_HOSTS = [host for host in os.getenv("DJANGO_ALLOWED_HOSTS", "").split(",") if host]
+
+DB_SIMULATED_LATENCY_MS = 0
+
+DB_STATEMENT_TIMEOUT_MS = int(os.getenv("DB_STATEMENT_TIMEOUT_MS", "30000"))
+DB_PGBOUNCER = os.getenv("DB_PGBOUNCER", "") in ("1", "true", "yes")
+DATABASE_DIRECT_URL = os.getenv("DATABASE_DIRECT_URL")
+
+
+def _direct_database():
+    url = urlparse(DATABASE_DIRECT_URL)
+    return dict(DATABASES["default"], **{
+        'NAME': url.path[1:],
+        'USER': url.username,
+        'PASSWORD': url.password,
+        'HOST': url.hostname,
+        'PORT': url.port,
+    })
+
+
+if DATABASE_DIRECT_URL and os.getenv("DB_DIRECT", "") in ("1", "true", "yes"):
+    # The whole process talks to PostgreSQL directly
+    DATABASES["default"] = _direct_database()
+    DB_PGBOUNCER = False
+
+DATABASES["default"].update({
+    # Keep connections open between requests instead of reconnecting every
+    # time, and check them before reuse so a restarted server doesn't turn
+    # into failed requests
+    'CONN_MAX_AGE': int(os.getenv("DB_CONN_MAX_AGE", "600")),
+    'CONN_HEALTH_CHECKS': True,
+})
+
+if DB_PGBOUNCER:
+    # Transaction pooling hands each transaction a different server
+    # connection, so cursors can't outlive one and session settings must
+    # not be sent at startup; set the timeout on the role instead:
+    #   ALTER ROLE <user> SET statement_timeout = '30s';
+    DATABASES["default"]["DISABLE_SERVER_SIDE_CURSORS"] = True
+    if DATABASE_DIRECT_URL:
+        # Exports keep a server-side cursor open for the whole response; a
+        # connection per request, not held between them
+        DATABASES["streaming"] = dict(_direct_database(), CONN_MAX_AGE=0, OPTIONS={
+            'options': f"-c statement_timeout={DB_STATEMENT_TIMEOUT_MS}",
+        })
+        DB_STREAMING_ALIAS = "streaming"
+else:
+    DATABASES["default"]["OPTIONS"] = {
+        'options': f"-c statement_timeout={DB_STATEMENT_TIMEOUT_MS}",
+    }
+
+STATIC_ROOT = os.getenv("DJANGO_STATIC_ROOT", "/app/staticfiles")
+
+# gunicorn workers add up their /metrics totals here; gunicorn.conf.py
+# empties it when the server starts
+METRICS_DIR = os.getenv("METRICS_DIR", "/tmp/location-metrics")
+
+# Image renditions are sent by nginx (nginx.conf); set it empty to serve
+# them from Django when nothing sits in front of gunicorn
+IMAGE_ACCEL_REDIRECT = os.getenv("IMAGE_ACCEL_REDIRECT", "/protected-media/") or None
+
+SECURE_PROXY_SSL_HEADER = ('HTTP_X_FORWARDED_PROTO', 'https')
+SESSION_COOKIE_SECURE = os.getenv("DJANGO_SECURE_COOKIES", "1") in ("1", "true", "yes")
+CSRF_COOKIE_SECURE = SESSION_COOKIE_SECURE
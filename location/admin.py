@@ -1,8 +1,27 @@
-from django.contrib import admin
+import re
+import uuid
+from django.contrib import admin, messages
 from django.contrib.gis.admin import OSMGeoAdmin
-from .models import Location, Accommodation, LocalizeAccommodation
+from django.core.exceptions import PermissionDenied
+from .models import (
+    Location, Accommodation, AccommodationListing, ChangeRecord, ImageRendition, Job,
+    LocalizeAccommodation, LocationStats, PriceHistory,
+)
+from .cache import cached_payload
+from .forms import BulkImportForm
+from .jobs import enqueue
+from .listings import refresh_listings
+from .pagination import EstimatedCountPaginator
+from .roles import request_roles
+from .partitions import ACCOMMODATION_TABLE, list_partitions
+from django.core.files.storage import default_storage
 from django.db import connection
+from django.db.models import Q
 from django.http import HttpResponse
+from django.shortcuts import redirect
+from django.template.response import TemplateResponse
+from django.urls import path
+from django.utils import timezone
 from import_export import resources
 from import_export.admin import ImportMixin
 
@@ -22,6 +41,110 @@ class LocationAdmin(ImportMixin, OSMGeoAdmin):
     list_filter = ('location_type', 'country_code', 'state_abbr')
     search_fields = ('title', 'country_code', 'state_abbr', 'city')
     readonly_fields = ('created_at', 'updated_at')
+    import_export_change_list_template = "admin/location/location/change_list_bulk_import.html"
+
+    def get_urls(self):
+        urls = [
+            path('bulk-import/', self.admin_site.admin_view(self.bulk_import_view),
+                 name='location_location_bulk_import'),
+        ]
+        return urls + super().get_urls()
+
+    def bulk_import_view(self, request):
+        # COPY-based import for large files, run by the job worker so the
+        # request returns at once; ImportMixin stays for small edits
+        if not (self.has_add_permission(request) and self.has_change_permission(request)):
+            raise PermissionDenied
+
+        form = BulkImportForm(request.POST or None, request.FILES or None)
+        if request.method == "POST" and form.is_valid():
+            upload = form.cleaned_data['csv_file']
+            path = default_storage.save(f"job_uploads/locations-{uuid.uuid4().hex}.csv", upload)
+            job = enqueue('import_locations', {'path': path, 'filename': upload.name})
+            self.message_user(
+                request,
+                f"Import of {upload.name} queued as job #{job.pk}; "
+                f"follow its progress under Jobs.",
+                messages.SUCCESS,
+            )
+            return redirect('admin:location_location_changelist')
+
+        context = {
+            **self.admin_site.each_context(request),
+            'opts': self.model._meta,
+            'form': form,
+            'title': 'Bulk import locations',
+        }
+        return TemplateResponse(request, "admin/location/location/bulk_import.html", context)
+
+
+FEED_BOUND_RE = re.compile(r"FOR VALUES IN \((\d+)\)")
+
+
+@cached_payload(Location, timeout=60 * 60)
+def country_choices():
+    # From the country locations rather than a DISTINCT over accommodations
+    return list(
+        Location.objects.filter(parent_id__isnull=True)
+        .order_by('country_code')
+        .values_list('country_code', 'title')
+        .distinct()
+    )
+
+
+class CountryCodeFilter(admin.SimpleListFilter):
+    title = 'country'
+    parameter_name = 'country_code'
+
+    def lookups(self, request, model_admin):
+        return [(code, f"{title} ({code})") for code, title in country_choices()]
+
+    def queryset(self, request, queryset):
+        if self.value():
+            return queryset.filter(country_code=self.value())
+        return queryset
+
+
+class BedroomCountFilter(admin.SimpleListFilter):
+    title = 'bedroom count'
+    parameter_name = 'bedrooms'
+    max_listed = 5
+
+    def lookups(self, request, model_admin):
+        choices = [(str(count), str(count)) for count in range(1, self.max_listed + 1)]
+        return choices + [(f"{self.max_listed + 1}+", f"{self.max_listed + 1}+")]
+
+    def queryset(self, request, queryset):
+        value = self.value()
+        if not value:
+            return queryset
+        if value.endswith('+') and value[:-1].isdigit():
+            return queryset.filter(bedroom_count__gte=int(value[:-1]))
+        if value.isdigit():
+            return queryset.filter(bedroom_count=int(value))
+        return queryset
+
+
+class FeedFilter(admin.SimpleListFilter):
+    """
+    One choice per feed partition, read from the catalog. Selecting a feed
+    filters on a constant so the planner only touches that partition.
+    """
+    title = 'feed'
+    parameter_name = 'feed'
+
+    def lookups(self, request, model_admin):
+        feeds = []
+        for _name, bound in list_partitions(ACCOMMODATION_TABLE):
+            match = FEED_BOUND_RE.search(bound)
+            if match:
+                feeds.append(int(match[1]))
+        return [(str(feed), f"Feed {feed}") for feed in sorted(feeds)]
+
+    def queryset(self, request, queryset):
+        if self.value() and self.value().isdigit():
+            return queryset.filter(feed=int(self.value()))
+        return queryset
 
 
 @admin.register(Accommodation)
@@ -37,9 +160,22 @@ class AccommodationAdmin(OSMGeoAdmin):
         "published",
         "created_at",
     )
-    list_filter = ("country_code", "bedroom_count", "published", "feed")
-    search_fields = ("title", "country_code", "review_score", "amenities")
+    # None of these run a DISTINCT over the accommodations
+    list_filter = (FeedFilter, CountryCodeFilter, BedroomCountFilter, "published")
+    search_fields = ("id", "title", "amenities")
+    search_help_text = "Matches the id, part of the title or an exact amenity."
     readonly_fields = ("created_at", "updated_at", "user_id")
+    # COUNT(*) over every partition is the slowest part of the changelist
+    paginator = EstimatedCountPaginator
+    show_full_result_count = False
+
+    def get_search_results(self, request, queryset, search_term):
+        # Each term is answered by the primary key, the trigram index on the
+        # title or the GIN index on amenities (see migration 0009)
+        for term in search_term.split():
+            queryset = queryset.filter(
+                Q(id=term) | Q(title__icontains=term) | Q(amenities__contains=[term]))
+        return queryset, False
 
     def get_queryset(self, request):
         qs = super().get_queryset(request)
@@ -47,26 +183,169 @@ class AccommodationAdmin(OSMGeoAdmin):
         if request.user.is_superuser:
             return qs
 
-        # Show filtered queryset to a property owner
-        elif request.user.groups.filter(name="Property Owners").exists():
-            return qs.filter(user_id=request.user)
+        # Show filtered queryset to a property owner; membership is cached
+        # and resolved once per request (see location.roles)
+        elif request_roles(request).is_property_owner:
+            return qs.filter(user_id=request.user.pk)
 
         return qs.none()
 
     def save_model(self, request, obj, form, change):
         # Ensure the user is set during saving
-        if not obj.user_id:
+        if obj.user_id_id is None:
             obj.user_id = request.user
         obj.save()
 
     def has_change_permission(self, request, obj=None):
-        if obj and obj.user_id != request.user:
+        if obj and not request_roles(request).owns(obj):
             return False
         return super().has_change_permission(request, obj)
 
 
+@admin.register(AccommodationListing)
+class AccommodationListingAdmin(admin.ModelAdmin):
+    # Read-only view of the read model maintained by location.listings
+    list_display = ('accommodation_id', 'feed', 'title', 'breadcrumb_display', 'usd_rate',
+                    'published', 'created_at', 'refreshed_at')
+    list_filter = (FeedFilter, 'published', 'country_code')
+    search_fields = ('=accommodation_id', '^title')
+    ordering = ('-created_at', '-accommodation_id', '-feed')
+    paginator = EstimatedCountPaginator
+    show_full_result_count = False
+    actions = ['refresh']
+
+    @admin.display(description='location')
+    def breadcrumb_display(self, obj):
+        return ' › '.join(obj.breadcrumb)
+
+    @admin.action(description="Refresh selected listings from their accommodations")
+    def refresh(self, request, queryset):
+        result = refresh_listings(queryset.values_list('accommodation_id', 'feed'))
+        self.message_user(request, f"{result['written']} listings rewritten, {result['deleted']} removed.")
+
+    def get_queryset(self, request):
+        qs = super().get_queryset(request)
+        if request.user.is_superuser:
+            return qs
+        elif request_roles(request).is_property_owner:
+            return qs.filter(user_id=request.user.pk)
+        return qs.none()
+
+    def has_add_permission(self, request):
+        return False
+
+    def has_change_permission(self, request, obj=None):
+        return False
+
+    def has_delete_permission(self, request, obj=None):
+        return False
+
+
 @admin.register(LocalizeAccommodation)
 class LocalizeAccommodationAdmin(admin.ModelAdmin):
-    list_display = ('id', 'property_id', 'language')
+    list_display = ('id', 'property_id', 'feed', 'language')
     list_filter = ('language',)
     search_fields = ('property_id__title', 'language')
+
+
+@admin.register(LocationStats)
+class LocationStatsAdmin(admin.ModelAdmin):
+    # Read-only view of the rollup table maintained by refresh_location_stats
+    list_display = ('location_id', 'accommodation_count', 'published_count',
+                    'avg_usd_rate', 'avg_review_score', 'published_ratio', 'updated_at')
+    list_filter = ('location_id__location_type', 'location_id__country_code')
+    list_select_related = ('location_id',)
+    search_fields = ('location_id__title',)
+    ordering = ('-accommodation_count',)
+
+    def has_add_permission(self, request):
+        return False
+
+    def has_change_permission(self, request, obj=None):
+        return False
+
+    def has_delete_permission(self, request, obj=None):
+        return False
+
+
+@admin.register(ImageRendition)
+class ImageRenditionAdmin(admin.ModelAdmin):
+    # Written by location.images only
+    list_display = ('source', 'rendition', 'width', 'height', 'size', 'created_at')
+    list_filter = ('rendition',)
+    search_fields = ('source', 'source_hash')
+
+    def has_add_permission(self, request):
+        return False
+
+    def has_change_permission(self, request, obj=None):
+        return False
+
+
+@admin.register(Job)
+class JobAdmin(admin.ModelAdmin):
+    # Jobs are created by enqueue() and updated by the run_jobs worker
+    list_display = ('id', 'kind', 'status', 'progress', 'message', 'attempts',
+                    'created_at', 'started_at', 'finished_at')
+    list_filter = ('status', 'kind')
+    readonly_fields = [field.name for field in Job._meta.fields]
+    ordering = ('-id',)
+    actions = ['requeue']
+
+    @admin.display(description='progress')
+    def progress(self, obj):
+        if obj.progress_total:
+            return f"{obj.progress_done}/{obj.progress_total} ({obj.progress_done / obj.progress_total:.0%})"
+        return obj.progress_done or '-'
+
+    @admin.action(description="Run selected failed jobs again")
+    def requeue(self, request, queryset):
+        count = queryset.filter(status=Job.FAILED).update(
+            status=Job.QUEUED, attempts=0, run_after=timezone.now(), finished_at=None)
+        self.message_user(request, f"Requeued {count} jobs.", messages.SUCCESS)
+
+    def has_add_permission(self, request):
+        return False
+
+    def has_change_permission(self, request, obj=None):
+        return False
+
+
+@admin.register(ChangeRecord)
+class ChangeRecordAdmin(admin.ModelAdmin):
+    # Appended by location.changes, read through the change feed
+    list_display = ('id', 'txid', 'model', 'object_id', 'feed', 'language', 'operation', 'created_at')
+    list_filter = ('model', 'operation')
+    search_fields = ('=object_id',)
+    ordering = ('-txid', '-id')
+    paginator = EstimatedCountPaginator
+    show_full_result_count = False
+
+    def has_add_permission(self, request):
+        return False
+
+    def has_change_permission(self, request, obj=None):
+        return False
+
+    def has_delete_permission(self, request, obj=None):
+        return False
+
+
+@admin.register(PriceHistory)
+class PriceHistoryAdmin(admin.ModelAdmin):
+    # Appended by location.prices; one row per rate or availability change
+    list_display = ('accommodation_id', 'feed', 'usd_rate', 'published', 'location_id', 'changed_at')
+    list_filter = (FeedFilter, 'published')
+    search_fields = ('=accommodation_id', '=location_id')
+    ordering = ('-changed_at', '-id')
+    paginator = EstimatedCountPaginator
+    show_full_result_count = False
+
+    def has_add_permission(self, request):
+        return False
+
+    def has_change_permission(self, request, obj=None):
+        return False
+
+    def has_delete_permission(self, request, obj=None):
+        return False
@@ -0,0 +1,443 @@
+import csv
+import os
+import random
+import statistics
+import subprocess
+import tempfile
+import time
+
+from django.contrib import admin
+from django.contrib.auth.models import User
+from django.db import connection
+from django.test import RequestFactory
+from django.urls import reverse
+from django.utils import timezone
+
+from .cache import bump_version
+from .changes import LOCALIZATION, record_sql
+from .feeds import ingest_feed
+from .geo import nearby, radius_bbox, within_bbox
+from .importers import bulk_import_locations
+from .instrumentation import recording
+from .listings import refresh_feed_listings
+from .models import Accommodation, LocalizeAccommodation, Location
+from .partitions import ACCOMMODATION_TABLE, LOCALIZE_TABLE, ensure_language_partition, next_month
+from .prices import monthly_prices, price_history
+from .rollups import refresh_location_stats
+from .search import search_accommodations
+from .sitemap import write_sitemap
+
+# Ids of generated rows start with this, so they can be told apart from
+# (and cleared without touching) real data
+PREFIX = "syn-"
+
+LOCATION_COLUMNS = ('id', 'title', 'center', 'parent_id', 'location_type', 'country_code',
+                    'state_abbr', 'city')
+
+TITLE_WORDS = (
+    ('Cozy', 'Sunny', 'Quiet', 'Modern', 'Rustic', 'Spacious', 'Charming', 'Central',
+     'Bright', 'Historic', 'Luxury', 'Family'),
+    ('Loft', 'Cottage', 'Apartment', 'Villa', 'Studio', 'Cabin', 'Townhouse', 'Suite',
+     'Bungalow', 'Chalet', 'Penthouse', 'Farmhouse'),
+)
+# Per language, so each partition is indexed with its own text search config
+DESCRIPTION_WORDS = {
+    'en': ['beach', 'garden', 'kitchen', 'balcony', 'view', 'pool', 'quiet', 'walk', 'station',
+           'market', 'terrace', 'fireplace', 'mountain', 'river', 'parking', 'family', 'bright',
+           'spacious', 'historic', 'center'],
+    'fr': ['plage', 'jardin', 'cuisine', 'balcon', 'vue', 'piscine', 'calme', 'gare', 'marché',
+           'terrasse', 'cheminée', 'montagne', 'rivière', 'parking', 'famille', 'lumineux',
+           'spacieux', 'historique', 'centre', 'village'],
+    'de': ['Strand', 'Garten', 'Küche', 'Balkon', 'Aussicht', 'Pool', 'ruhig', 'Bahnhof', 'Markt',
+           'Terrasse', 'Kamin', 'Berge', 'Fluss', 'Parkplatz', 'Familie', 'hell', 'geräumig',
+           'historisch', 'Zentrum', 'Altstadt'],
+}
+AMENITIES = ('wifi', 'kitchen', 'parking', 'pool', 'air_conditioning', 'washer', 'heating',
+             'workspace', 'tv', 'pets_allowed')
+
+# Deterministic per (row, language): the same seed always localizes the same
+# rows with the same text. hashtext() is stable across PostgreSQL versions.
+LOCALIZE_SQL = f"""
+    WITH written AS (
+        INSERT INTO {LOCALIZE_TABLE} (property_id, feed, language, description, policy)
+        SELECT a.id, a.feed, %(language)s,
+               array_to_string(ARRAY(
+                   SELECT (%(words)s::text[])[1 + abs(hashtext(a.id || %(salt)s || g)) %% %(word_count)s]
+                   FROM generate_series(1, 12) g), ' '),
+               '{{}}'::jsonb
+        FROM {ACCOMMODATION_TABLE} a
+        WHERE a.feed = %(feed)s AND a.id LIKE %(prefix)s
+          AND abs(hashtext(a.id || %(salt)s)) %% 1000 < %(per_mille)s
+        ON CONFLICT (property_id, feed, language) DO NOTHING
+        RETURNING property_id, feed, language
+    )
+    {record_sql(LOCALIZATION, 'written', "'c'", object_id='property_id', language='language')}
+"""
+
+CLEAR_SQL = (
+    "DELETE FROM location_locationstats WHERE location_id LIKE %s",
+    "DELETE FROM location_pendinglocationstats WHERE location_id LIKE %s",
+    "DELETE FROM location_accommodationlisting WHERE accommodation_id LIKE %s",
+    "DELETE FROM location_pricehistory WHERE accommodation_id LIKE %s",
+    # Accommodations and their localizations go with their location (ON DELETE CASCADE)
+    "DELETE FROM location_location WHERE id LIKE %s",
+)
+
+BENCHMARKS = {}
+
+
+def _point(lon, lat):
+    return f"POINT({max(-180.0, min(180.0, lon)):.5f} {max(-85.0, min(85.0, lat)):.5f})"
+
+
+def _country_code(index):
+    return chr(65 + index // 26 % 26) + chr(65 + index % 26)
+
+
+def synthetic_locations(countries, states, cities, seed=0):
+    """
+    Yield a countries → states → cities hierarchy as dicts in the
+    ``example_location.csv`` format, parents first. States cluster around
+    their country and cities around their state, so geo queries hit dense
+    and empty areas the way real data does.
+    """
+    rng = random.Random(seed)
+    for c in range(countries):
+        country_id = f"{PREFIX}c{c}"
+        code = _country_code(c)
+        lon, lat = rng.uniform(-170, 170), rng.uniform(-55, 70)
+        yield {'id': country_id, 'title': f"Country {code}", 'center': _point(lon, lat),
+               'parent_id': '', 'location_type': 'country', 'country_code': code,
+               'state_abbr': '', 'city': ''}
+        for s in range(states):
+            state_id = f"{country_id}-s{s}"
+            state_lon, state_lat = lon + rng.uniform(-8, 8), lat + rng.uniform(-5, 5)
+            abbr = f"S{s}"[:3]
+            yield {'id': state_id, 'title': f"State {code}-{s}", 'center': _point(state_lon, state_lat),
+                   'parent_id': country_id, 'location_type': 'state', 'country_code': code,
+                   'state_abbr': abbr, 'city': ''}
+            for k in range(cities):
+                city = f"City {code}-{s}-{k}"
+                yield {'id': f"{state_id}-{k}", 'title': city,
+                       'center': _point(state_lon + rng.uniform(-1.5, 1.5),
+                                        state_lat + rng.uniform(-1, 1)),
+                       'parent_id': state_id, 'location_type': 'city', 'country_code': code,
+                       'state_abbr': abbr, 'city': city}
+
+
+def synthetic_accommodations(cities, count, feed, seed=0):
+    """
+    Yield ``count`` accommodation dicts for ``ingest_feed``, spread over
+    ``cities`` (``(id, country_code, center)`` tuples) with a skew towards
+    the first ones, as real listings crowd into a few popular cities.
+    """
+    rng = random.Random(f"{seed}:{feed}")
+    weights = [1 / (rank + 1) ** 0.8 for rank in range(len(cities))]
+    for n, (location_id, country_code, center) in enumerate(
+            rng.choices(cities, weights=weights, k=count)):
+        lon, lat = center
+        yield {
+            'id': f"{PREFIX}{feed}-{n}",
+            'title': f"{rng.choice(TITLE_WORDS[0])} {rng.choice(TITLE_WORDS[1])} {n}",
+            'country_code': country_code,
+            'bedroom_count': rng.choice((1, 1, 2, 2, 2, 3, 3, 4, 5)),
+            'review_score': f"{rng.uniform(2.5, 5):.1f}" if rng.random() < 0.8 else None,
+            'usd_rate': f"{rng.lognormvariate(4.7, 0.5):.2f}",
+            'center': _point(lon + rng.gauss(0, 0.05), lat + rng.gauss(0, 0.05)),
+            'location_id': location_id,
+            'amenities': rng.sample(AMENITIES, rng.randint(1, 6)),
+            'images': [],
+            'published': rng.random() < 0.85,
+        }
+
+
+def localize(feed, languages, ratio=0.5, seed=0):
+    """
+    Add a description in each of ``languages`` to about ``ratio`` of the
+    generated accommodations of ``feed``, written by PostgreSQL in one
+    statement per language. Returns the number of rows added.
+    """
+    added = 0
+    with connection.cursor() as cursor:
+        for language in languages:
+            ensure_language_partition(language)
+            words = DESCRIPTION_WORDS.get(language, DESCRIPTION_WORDS['en'])
+            cursor.execute(LOCALIZE_SQL, {
+                'language': language, 'words': words, 'word_count': len(words),
+                'salt': f"{seed}:{language}", 'feed': feed, 'prefix': f"{PREFIX}%",
+                'per_mille': int(ratio * 1000),
+            })
+            added += cursor.rowcount
+    if added:
+        bump_version(LocalizeAccommodation)
+        refresh_feed_listings(feed)
+    return added
+
+
+def generate(countries=20, states=10, cities=20, accommodations=100000, feeds=1,
+             languages=('en', 'fr', 'de'), localized=0.5, seed=0, progress=None):
+    """
+    Load a synthetic data set through the production import paths (the
+    bulk location importer and ``ingest_feed``) and return their results,
+    so generating the data doubles as the import benchmark.
+    ``accommodations`` is split evenly over feeds ``0 .. feeds - 1``.
+    ``progress(message)`` is called after each step.
+    """
+    report = progress or (lambda message: None)
+    results = {}
+    cities_by_id = []
+    with tempfile.TemporaryFile('w+', encoding='utf-8', newline='') as f:
+        writer = csv.DictWriter(f, fieldnames=LOCATION_COLUMNS)
+        writer.writeheader()
+        for row in synthetic_locations(countries, states, cities, seed):
+            writer.writerow(row)
+            if row['location_type'] == 'city':
+                lon, lat = (float(value) for value in row['center'][6:-1].split())
+                cities_by_id.append((row['id'], row['country_code'], (lon, lat)))
+        f.seek(0)
+        results['locations'] = bulk_import_locations(f)
+    report(f"Imported {results['locations']['rows']} locations "
+           f"in {results['locations']['elapsed']:.1f} s")
+
+    results['feeds'] = {}
+    for feed in range(feeds):
+        count = accommodations // feeds + (feed < accommodations % feeds)
+        result = ingest_feed(feed, synthetic_accommodations(cities_by_id, count, feed, seed))
+        results['feeds'][feed] = result
+        report(f"Feed {feed}: ingested {result['rows']} accommodations in {result['elapsed']:.1f} s")
+
+    started = time.perf_counter()
+    results['localizations'] = sum(localize(feed, languages, localized, seed) for feed in range(feeds))
+    results['localize_elapsed'] = time.perf_counter() - started
+    report(f"Added {results['localizations']} localizations in {results['localize_elapsed']:.1f} s")
+
+    started = time.perf_counter()
+    refresh_location_stats()
+    with connection.cursor() as cursor:
+        # Fresh statistics, so plans match those of a settled database
+        cursor.execute(f"ANALYZE location_location, {ACCOMMODATION_TABLE}, {LOCALIZE_TABLE}")
+    results['stats_elapsed'] = time.perf_counter() - started
+    report(f"Refreshed stats in {results['stats_elapsed']:.1f} s")
+    return results
+
+
+def clear():
+    """Delete every generated location, accommodation and localization."""
+    with connection.cursor() as cursor:
+        for sql in CLEAR_SQL:
+            cursor.execute(sql, [f"{PREFIX}%"])
+    for model in (Location, Accommodation, LocalizeAccommodation):
+        bump_version(model)
+
+
+def summarize(timings):
+    """``p50_ms``/``p99_ms``-style statistics of ``timings`` in milliseconds."""
+    timings = sorted(timings)
+    return {
+        'rounds': len(timings),
+        'min_ms': round(timings[0], 3),
+        'mean_ms': round(statistics.mean(timings), 3),
+        'p50_ms': round(statistics.median(timings), 3),
+        'p99_ms': round(timings[min(len(timings) - 1, int(len(timings) * 0.99))], 3),
+        'max_ms': round(timings[-1], 3),
+    }
+
+
+def measure(func, rounds=10, warmup=1, args=()):
+    """
+    Call ``func`` ``warmup`` times untimed, then ``rounds`` times, and
+    return ``summarize`` of the timed calls plus the queries per call.
+    ``args``, when given, is a callable returning the arguments of each
+    call, e.g. a random query point, so building them isn't timed.
+    """
+    make_args = args if callable(args) else (lambda: args)
+    for _ in range(warmup):
+        func(*make_args())
+    timings = []
+    queries = 0
+    for _ in range(rounds):
+        call_args = make_args()
+        with recording() as recorder:
+            started = time.perf_counter()
+            func(*call_args)
+            timings.append((time.perf_counter() - started) * 1000)
+        queries += recorder.count
+    return {**summarize(timings), 'queries': round(queries / rounds, 1)}
+
+
+def geo_extent(model):
+    """``(rows, west, south, east, north)`` of the centers in ``model``'s table."""
+    with connection.cursor() as cursor:
+        cursor.execute(
+            f"SELECT COUNT(*), ST_XMin(ST_Extent(center)), ST_YMin(ST_Extent(center)), "
+            f"ST_XMax(ST_Extent(center)), ST_YMax(ST_Extent(center)) FROM {model._meta.db_table}")
+        return cursor.fetchone()
+
+
+def geo_benchmarks(model, queries=200, km=10, limit=50, seed=0):
+    """
+    Time ``nearby`` and ``within_bbox`` at random points inside the extent
+    of ``model``'s rows. Returns ``{label: stats}``, or None if the table is
+    empty.
+    """
+    rows, west, south, east, north = geo_extent(model)
+    if not rows:
+        return None
+    rng = random.Random(seed)
+    queryset = model.objects.only("id", "center")
+
+    def point():
+        return rng.uniform(south, north), rng.uniform(west, east)
+
+    return {
+        f"nearby {km:g} km": measure(
+            lambda lat, lon: list(nearby(queryset, lat, lon, km)[:limit]),
+            rounds=queries, args=point),
+        f"bbox {km:g} km": measure(
+            lambda lat, lon: list(within_bbox(queryset, *radius_bbox(lat, lon, km))[:limit]),
+            rounds=queries, args=point),
+    }
+
+
+def benchmark(name):
+    """
+    Register the decorated ``case(options)`` under ``name``. It returns
+    stats from ``measure``, or ``{label: stats}`` for several.
+    """
+    def decorator(func):
+        BENCHMARKS[name] = func
+        return func
+    return decorator
+
+
+@benchmark('sitemap')
+def sitemap_benchmark(options):
+    with open(os.devnull, 'w', encoding='utf-8') as f:
+        return measure(lambda: write_sitemap(f), rounds=options['rounds'])
+
+
+def _admin_user():
+    user = User.objects.filter(is_superuser=True, is_active=True).order_by('pk').first()
+    if user is None:
+        user = User.objects.create_superuser(username="benchmark", password=None)
+    return user
+
+
+@benchmark('admin_changelist')
+def admin_changelist_benchmark(options):
+    # Called on the view itself: no host, session or CSRF checks in the way
+    model_admin = admin.site._registry[Accommodation]
+    user = _admin_user()
+    url = reverse('admin:location_accommodation_changelist')
+    factory = RequestFactory()
+
+    def changelist(params):
+        request = factory.get(url, params)
+        request.user = user
+        return model_admin.changelist_view(request).render()
+
+    return {
+        'first page': measure(changelist, rounds=options['rounds'], args=({},)),
+        'search': measure(changelist, rounds=options['rounds'], args=({'q': 'Cozy'},)),
+    }
+
+
+@benchmark('search')
+def search_benchmark(options):
+    rng = random.Random(options['seed'])
+    languages = [language for language in DESCRIPTION_WORDS]
+
+    def query():
+        language = rng.choice(languages)
+        words = DESCRIPTION_WORDS[language]
+        return f"{rng.choice(words)} {rng.choice(words)}", language
+
+    return measure(
+        lambda q, language: list(search_accommodations(Accommodation.objects.all(), q, language)[:20]),
+        rounds=options['queries'], args=query)
+
+
+@benchmark('geo')
+def geo_benchmark(options):
+    return geo_benchmarks(Accommodation, queries=options['queries'], km=options['km'],
+                          limit=options['limit'], seed=options['seed'])
+
+
+@benchmark('prices')
+def prices_benchmark(options):
+    rng = random.Random(options['seed'])
+    keys = list(Accommodation.objects.values_list('id', 'feed').order_by()[:1000])
+    countries = list(Location.objects.filter(location_type='country').values_list('id', flat=True))
+    if not keys or not countries:
+        return None
+    end = timezone.now().date().replace(day=1)
+    start = end.replace(year=end.year - 1)
+    return {
+        'property history': measure(
+            lambda key: price_history(*key, start, next_month(end)),
+            rounds=options['queries'], args=lambda: (rng.choice(keys),)),
+        'country by month': measure(
+            lambda country: monthly_prices(country, start, end),
+            rounds=options['rounds'], args=lambda: (rng.choice(countries),)),
+    }
+
+
+def _git_commit():
+    try:
+        return subprocess.run(
+            ['git', 'rev-parse', '--short', 'HEAD'], capture_output=True, text=True, check=True,
+            cwd=os.path.dirname(os.path.abspath(__file__))).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+
+def environment():
+    """Commit, PostgreSQL version and table sizes the results were measured on."""
+    with connection.cursor() as cursor:
+        cursor.execute("SHOW server_version")
+        version = cursor.fetchone()[0]
+        counts = {}
+        for label, table in (('locations', 'location_location'),
+                             ('accommodations', ACCOMMODATION_TABLE),
+                             ('localizations', LOCALIZE_TABLE)):
+            cursor.execute(f"SELECT COUNT(*) FROM {table}")
+            counts[label] = cursor.fetchone()[0]
+    return {
+        'commit': _git_commit(),
+        'created_at': timezone.now().isoformat(),
+        'postgres': version,
+        'rows': counts,
+    }
+
+
+def run_benchmarks(names=None, rounds=5, queries=100, km=10, limit=50, seed=0):
+    """
+    Run the registered benchmarks (all, or ``names``) and return
+    ``{name: stats}``, flattening cases with several labels to
+    ``"name: label"``.
+    """
+    options = {'rounds': rounds, 'queries': queries, 'km': km, 'limit': limit, 'seed': seed}
+    results = {}
+    for name in names or BENCHMARKS:
+        outcome = BENCHMARKS[name](options)
+        if outcome is None:
+            continue
+        if 'p50_ms' in outcome:
+            results[name] = outcome
+        else:
+            results.update((f"{name}: {label}", stats) for label, stats in outcome.items())
+    return results
+
+
+def compare(previous, current):
+    """
+    ``(name, previous_p50, current_p50, ratio)`` for the benchmarks in both
+    result dicts; a ratio above 1 is a slowdown.
+    """
+    rows = []
+    for name, stats in current.items():
+        before = previous.get(name)
+        if not before or not before.get('p50_ms'):
+            continue
+        rows.append((name, before['p50_ms'], stats['p50_ms'], stats['p50_ms'] / before['p50_ms']))
+    return rows
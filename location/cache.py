@@ -0,0 +1,182 @@
+import hashlib
+import math
+import threading
+import time
+from collections import OrderedDict
+from functools import wraps
+
+from django.conf import settings
+from django.core.cache import caches
+from django.db import transaction
+
+DEFAULT_TIMEOUT = 300
+# Keys written by this process that are remembered to tell evictions from
+# plain misses
+TRACKED_KEYS = 10000
+
+_MISS = object()
+_lock = threading.Lock()
+_counters = {'hits': 0, 'misses': 0, 'sets': 0, 'evictions': 0, 'invalidations': 0}
+_written = OrderedDict()
+
+
+def get_cache():
+    """The cache backend of the location app (``LOCATION_CACHE_ALIAS``, default ``default``)."""
+    return caches[getattr(settings, 'LOCATION_CACHE_ALIAS', 'default')]
+
+
+def _count(name, amount=1):
+    with _lock:
+        _counters[name] += amount
+
+
+def cache_get(key, default=None):
+    value = get_cache().get(key, _MISS)
+    if value is not _MISS:
+        _count('hits')
+        return value
+    with _lock:
+        _counters['misses'] += 1
+        # Written here and not expired yet: the backend dropped it
+        expires = _written.pop(key, None)
+        if expires is not None and expires > time.monotonic():
+            _counters['evictions'] += 1
+    return default
+
+
+def cache_get_many(keys):
+    """``{key: value}`` for those of ``keys`` that are cached, in one round trip."""
+    values = get_cache().get_many(keys)
+    now = time.monotonic()
+    with _lock:
+        _counters['hits'] += len(values)
+        for key in keys:
+            if key in values:
+                continue
+            _counters['misses'] += 1
+            expires = _written.pop(key, None)
+            if expires is not None and expires > now:
+                _counters['evictions'] += 1
+    return values
+
+
+def _remember(keys, timeout):
+    expires = time.monotonic() + timeout if timeout is not None else math.inf
+    with _lock:
+        for key in keys:
+            _counters['sets'] += 1
+            _written[key] = expires
+            _written.move_to_end(key)
+        while len(_written) > TRACKED_KEYS:
+            _written.popitem(last=False)
+
+
+def cache_set(key, value, timeout=DEFAULT_TIMEOUT):
+    get_cache().set(key, value, timeout)
+    _remember([key], timeout)
+
+
+def cache_set_many(values, timeout=DEFAULT_TIMEOUT):
+    """Store every ``{key: value}`` of ``values`` in one round trip."""
+    get_cache().set_many(values, timeout)
+    _remember(values, timeout)
+
+
+def cache_delete(key):
+    get_cache().delete(key)
+    with _lock:
+        _written.pop(key, None)
+
+
+def get_or_compute(key, compute, timeout=DEFAULT_TIMEOUT):
+    """Cached value of ``key``, computing and storing it with ``compute()`` on a miss."""
+    value = cache_get(key, _MISS)
+    if value is _MISS:
+        value = compute()
+        cache_set(key, value, timeout)
+    return value
+
+
+def _version_key(model):
+    return f"location:version:{model._meta.label_lower}"
+
+
+def model_version(model):
+    # Versions never expire, or an old version number could come back
+    return get_cache().get_or_set(_version_key(model), 1, None)
+
+
+def bump_version(*models):
+    """Invalidate every cached payload that depends on ``models``."""
+    for model in models:
+        try:
+            get_cache().incr(_version_key(model))
+        except ValueError:
+            get_cache().set(_version_key(model), 2, None)
+        _count('invalidations')
+
+
+def bump_version_on_commit(*models):
+    """
+    ``bump_version`` now, so reads later in this transaction miss, and again
+    once the transaction commits, since another process may have cached
+    the old rows under the first new version in the meantime.
+    """
+    bump_version(*models)
+    transaction.on_commit(lambda: bump_version(*models))
+
+
+def versioned_key(prefix, models, *parts):
+    versions = '.'.join(str(model_version(model)) for model in models)
+    digest = hashlib.md5(repr(parts).encode()).hexdigest()
+    return f"{prefix}:{versions}:{digest}"
+
+
+def cached_payload(*models, timeout=DEFAULT_TIMEOUT):
+    """
+    Cache the return value of the decorated function per arguments until
+    one of ``models`` changes. The value must be picklable, so return
+    serialized data rather than model instances or querysets.
+    """
+    def decorator(func):
+        prefix = f"location:payload:{func.__module__}.{func.__qualname__}"
+
+        @wraps(func)
+        def wrapper(*args, **kwargs):
+            key = versioned_key(prefix, models, args, sorted(kwargs.items()))
+            return get_or_compute(key, lambda: func(*args, **kwargs), timeout)
+        return wrapper
+    return decorator
+
+
+def cached_queryset(queryset, *models, timeout=DEFAULT_TIMEOUT):
+    """
+    Rows of ``queryset`` as a list, cached until its model or one of the
+    extra ``models`` (e.g. those it joins) changes.
+    """
+    sql, params = queryset.query.sql_with_params()
+    key = versioned_key("location:queryset", (queryset.model, *models), sql, params)
+    return get_or_compute(key, lambda: list(queryset), timeout)
+
+
+def _backend_stats(backend):
+    # Server-side counters cover every process, not only this one
+    if type(backend).__name__ != 'RedisCache':
+        return None
+    try:
+        info = backend._cache.get_client().info('stats')
+    except Exception:  # Monitoring must not fail because the server is down
+        return None
+    return {name: info.get(name) for name in ('keyspace_hits', 'keyspace_misses', 'evicted_keys')}
+
+
+def metrics():
+    """Hit/miss/eviction counters of this process, plus the server's own where available."""
+    with _lock:
+        counters = dict(_counters)
+    lookups = counters['hits'] + counters['misses']
+    counters['hit_rate'] = round(counters['hits'] / lookups, 4) if lookups else None
+    backend = get_cache()
+    counters['backend'] = type(backend).__name__
+    counters['server'] = _backend_stats(backend)
+    return counters
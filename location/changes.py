@@ -0,0 +1,138 @@
+from django.db import connection
+
+CHANGES_TABLE = "location_changerecord"
+
+ACCOMMODATION = 'accommodation'
+LOCALIZATION = 'localization'
+LOCATION = 'location'
+MODELS = (ACCOMMODATION, LOCALIZATION, LOCATION)
+
+CREATED, UPDATED, DELETED = 'c', 'u', 'd'
+
+# Id of the writing transaction. Records are read in (txid, id) order and
+# only once every transaction up to theirs has finished: ids come from a
+# sequence and can commit out of order, so an id cursor alone would skip
+# records of a transaction that was still running when it was read.
+TXID = "pg_current_xact_id()::text::bigint"
+
+RECORD_SQL = f"""
+    INSERT INTO {CHANGES_TABLE} (txid, model, object_id, feed, language, operation, created_at)
+    SELECT {TXID}, %s, k.object_id, k.feed, k.language, %s, NOW()
+    FROM unnest(%s::varchar[], %s::smallint[], %s::varchar[]) AS k(object_id, feed, language)
+"""
+
+# Records after the cursor of transactions older than every one still
+# running. Not even the reading transaction's own: a cursor past them could
+# skip an older transaction that commits later.
+READ_SQL = f"""
+    SELECT txid, id, model, object_id, feed, language, operation, created_at
+    FROM {CHANGES_TABLE}
+    WHERE (txid, id) > (%s, %s)
+      AND txid < pg_snapshot_xmin(pg_current_snapshot())::text::bigint
+      {{models}}
+    ORDER BY txid, id
+    LIMIT %s
+"""
+
+LATEST_SQL = f"""
+    SELECT txid, id FROM {CHANGES_TABLE}
+    WHERE txid < pg_snapshot_xmin(pg_current_snapshot())::text::bigint
+    ORDER BY txid DESC, id DESC
+    LIMIT 1
+"""
+
+START = "0:0"
+
+
+class ChangeFeedError(Exception):
+    pass
+
+
+def record_sql(model, source, operation, object_id='id', feed='feed', language="''"):
+    """
+    ``INSERT`` recording a change of ``model`` for every row of ``source``
+    (a table or CTE name), for bulk statements to run in a CTE of their
+    own. ``operation``, ``object_id``, ``feed`` and ``language`` are SQL
+    expressions over ``source``.
+    """
+    return (f"INSERT INTO {CHANGES_TABLE} (txid, model, object_id, feed, language, operation, created_at) "
+            f"SELECT {TXID}, '{model}', {object_id}, {feed}, {language}, {operation}, NOW() "
+            f"FROM {source}")
+
+
+def record_changes(model, operation, keys):
+    """
+    Append a change record of ``model`` per ``(object_id, feed, language)``
+    of ``keys``; ``feed`` is None for locations and ``language`` empty for
+    anything but localizations. Rolled back together with the change.
+    """
+    keys = list(keys)
+    if not keys:
+        return
+    object_ids, feeds, languages = (list(values) for values in zip(*keys))
+    with connection.cursor() as cursor:
+        cursor.execute(RECORD_SQL, [model, operation, object_ids, feeds, languages])
+
+
+def parse_cursor(cursor):
+    """``(txid, id)`` of a cursor returned by ``read_changes``."""
+    try:
+        txid, id = (int(part) for part in (cursor or START).split(':'))
+    except ValueError:
+        raise ChangeFeedError(f"Invalid cursor: {cursor!r}")
+    if txid < 0 or id < 0:
+        raise ChangeFeedError(f"Invalid cursor: {cursor!r}")
+    return txid, id
+
+
+def latest_cursor():
+    """Cursor after every finished change, for consumers that start from now."""
+    with connection.cursor() as cursor:
+        cursor.execute(LATEST_SQL)
+        row = cursor.fetchone()
+    return f"{row[0]}:{row[1]}" if row else START
+
+
+def compact(changes):
+    """Keep only the last change of each object, in order."""
+    last = {}
+    for change in changes:
+        key = (change['model'], change['object_id'], change['feed'], change['language'])
+        last.pop(key, None)
+        last[key] = change
+    return list(last.values())
+
+
+def read_changes(cursor=None, limit=500, models=None):
+    """
+    Up to ``limit`` changes after ``cursor`` (from the start if None), of
+    ``models`` only if given, and the cursor to continue from, which stays
+    put when there is nothing new. Accommodations pruned by a feed load
+    take their localizations with them without separate records.
+    """
+    txid, id = parse_cursor(cursor)
+    where, params = "", [txid, id]
+    if models:
+        unknown = set(models) - set(MODELS)
+        if unknown:
+            raise ChangeFeedError(f"Unknown models: {', '.join(sorted(unknown))}")
+        where = "AND model = ANY(%s)"
+        params.append(list(models))
+    params.append(limit)
+    with connection.cursor() as db_cursor:
+        db_cursor.execute(READ_SQL.format(models=where), params)
+        rows = db_cursor.fetchall()
+    changes = [
+        {'model': model, 'object_id': object_id, 'feed': feed, 'language': language or None,
+         'operation': operation, 'at': created_at.isoformat()}
+        for _txid, _id, model, object_id, feed, language, operation, created_at in rows
+    ]
+    next_cursor = f"{rows[-1][0]}:{rows[-1][1]}" if rows else f"{txid}:{id}"
+    return changes, next_cursor
+
+
+def prune_changes(before):
+    """Delete change records written before the datetime ``before``. Returns the count."""
+    with connection.cursor() as cursor:
+        cursor.execute(f"DELETE FROM {CHANGES_TABLE} WHERE created_at < %s", [before])
+        return cursor.rowcount
@@ -0,0 +1,114 @@
+import csv
+import io
+import re
+import time
+from contextlib import contextmanager
+
+from django.conf import settings
+from django.core.exceptions import ImproperlyConfigured
+from django.db import connections
+
+POINT_RE = re.compile(
+    r"^\s*(?:SRID=(?P<srid>\d+)\s*;\s*)?POINT\s*\(\s*"
+    r"(?P<x>[-+]?[\d.]+(?:[eE][-+]?\d+)?)\s+"
+    r"(?P<y>[-+]?[\d.]+(?:[eE][-+]?\d+)?)\s*\)\s*$",
+    re.IGNORECASE,
+)
+
+
+@contextmanager
+def streaming_cursor():
+    """
+    Yield a cursor that fetches rows from the server in batches instead of
+    buffering the whole result set in memory, on the ``DB_STREAMING_ALIAS``
+    connection. Falls back to a regular cursor when server-side cursors are
+    disabled for that connection.
+    """
+    connection = connections[settings.DB_STREAMING_ALIAS]
+    if connection.settings_dict.get("DISABLE_SERVER_SIDE_CURSORS"):
+        cursor = connection.cursor()
+    else:
+        cursor = connection.chunked_cursor()
+    try:
+        yield cursor
+    finally:
+        cursor.close()
+
+
+def require_session():
+    """
+    Raise ``ImproperlyConfigured`` when the connection goes through pgbouncer
+    in transaction pooling mode, where TEMP tables and other session state
+    don't carry over from one transaction to the next.
+    """
+    if settings.DB_PGBOUNCER:
+        raise ImproperlyConfigured(
+            "This needs a database session of its own; run it with DB_DIRECT=1 "
+            "so it connects to PostgreSQL directly instead of through pgbouncer.")
+
+
+def points_to_ewkt(values, srid=4326):
+    """
+    Validate a batch of ``POINT(x y)`` WKT strings and return them as EWKT
+    that PostGIS accepts straight from COPY, without building a GEOS
+    geometry per row. Empty values map to ``None``; anything else raises
+    ``ValueError`` naming the offending position in the batch.
+    """
+    converted = []
+    for position, value in enumerate(values):
+        if not value:
+            converted.append(None)
+            continue
+        match = POINT_RE.match(value)
+        if match is None:
+            raise ValueError(f"Invalid POINT value at row {position}: {value!r}")
+        converted.append(
+            f"SRID={match['srid'] or srid};POINT({match['x']} {match['y']})"
+        )
+    return converted
+
+
+def pg_array(values):
+    """Format a Python sequence as a PostgreSQL array literal for COPY."""
+    if values is None:
+        return None
+    items = []
+    for value in values:
+        if value is None:
+            items.append("NULL")
+        else:
+            escaped = str(value).replace("\\", "\\\\").replace('"', '\\"')
+            items.append(f'"{escaped}"')
+    return "{" + ",".join(items) + "}"
+
+
+def copy_rows(cursor, table, columns, rows):
+    """
+    Load ``rows`` (sequences matching ``columns``) into ``table`` with a
+    single ``COPY ... FROM STDIN``. ``None`` is loaded as NULL.
+    """
+    buffer = io.StringIO()
+    writer = csv.writer(buffer, lineterminator="\n")
+    count = 0
+    for row in rows:
+        writer.writerow(row)
+        count += 1
+    if not count:
+        return 0
+    buffer.seek(0)
+    cursor.copy_expert(
+        f"COPY {table} ({', '.join(columns)}) FROM STDIN WITH (FORMAT csv)",
+        buffer,
+    )
+    return count
+
+
+def simulated_latency(execute, sql, params, many, context):
+    """Execute wrapper that delays every query by ``DB_SIMULATED_LATENCY_MS``."""
+    time.sleep(settings.DB_SIMULATED_LATENCY_MS / 1000)
+    return execute(sql, params, many, context)
+
+
+def install_simulated_latency(sender, connection, **kwargs):
+    # connection_created receiver; the wrapper stays for the connection's lifetime
+    connection.execute_wrappers.append(simulated_latency)
@@ -0,0 +1,172 @@
+import zlib
+from collections import namedtuple
+
+from asgiref.sync import sync_to_async
+from django.db import connection
+
+from .db import streaming_cursor
+from .partitions import ACCOMMODATION_TABLE
+
+FORMATS = ('csv', 'jsonl', 'geojson')
+CONTENT_TYPES = {
+    'csv': 'text/csv',
+    'jsonl': 'application/x-ndjson',
+    'geojson': 'application/geo+json',
+}
+
+# Rows fetched from the server-side cursor per round trip
+BATCH_SIZE = 2000
+
+Export = namedtuple('Export', 'table columns feed')
+
+# (output name, SQL expression) pairs. center is exported as lon/lat, or as
+# the feature geometry in GeoJSON.
+EXPORTS = {
+    'locations': Export('location_location', [
+        ('id', 'id'), ('title', 'title'), ('location_type', 'location_type'),
+        ('country_code', 'country_code'), ('state_abbr', 'state_abbr'), ('city', 'city'),
+        ('parent_id', 'parent_id_id'), ('lon', 'ST_X(center)'), ('lat', 'ST_Y(center)'),
+        ('created_at', 'created_at'), ('updated_at', 'updated_at'),
+    ], feed=False),
+    'accommodations': Export(ACCOMMODATION_TABLE, [
+        ('id', 'id'), ('feed', 'feed'), ('title', 'title'), ('country_code', 'country_code'),
+        ('bedroom_count', 'bedroom_count'), ('review_score', 'review_score'),
+        ('usd_rate', 'usd_rate'), ('location_id', 'location_id'),
+        ('lon', 'ST_X(center)'), ('lat', 'ST_Y(center)'), ('amenities', 'amenities'),
+        ('images', 'images'), ('published', 'published'),
+        ('created_at', 'created_at'), ('updated_at', 'updated_at'),
+    ], feed=True),
+}
+
+GEOJSON_HEADER = '{"type": "FeatureCollection", "features": [\n'
+GEOJSON_FOOTER = '\n]}\n'
+
+
+class ExportError(Exception):
+    pass
+
+
+_DONE = object()
+
+
+def _where(export, feed, country_code):
+    conditions, params = [], []
+    if feed is not None:
+        if not export.feed:
+            raise ExportError("Only accommodations can be filtered by feed.")
+        # A constant, so only the feed's partition is read
+        conditions.append("feed = %s")
+        params.append(feed)
+    if country_code:
+        conditions.append("country_code = %s")
+        params.append(country_code.upper())
+    return (f" WHERE {' AND '.join(conditions)}" if conditions else ""), params
+
+
+def export_query(name, fmt, feed=None, country_code=None):
+    """
+    ``(sql, params)`` selecting the rows of export ``name`` with every value
+    already rendered by PostgreSQL: one text column per field for CSV, one
+    JSON document per row otherwise. No ORDER BY, so rows stream in
+    storage order without a sort.
+    """
+    if name not in EXPORTS:
+        raise ExportError(f"Unknown export: {name!r}")
+    if fmt not in FORMATS:
+        raise ExportError(f"Unknown format: {fmt!r}")
+    export = EXPORTS[name]
+    where, params = _where(export, feed, country_code)
+    if fmt == 'csv':
+        # ::text renders arrays, timestamps and numbers the way COPY does
+        columns = ', '.join(f"({expression})::text AS {column}" for column, expression in export.columns)
+        sql = f"SELECT {columns} FROM {export.table}{where}"
+    elif fmt == 'jsonl':
+        columns = ', '.join(f"{expression} AS {column}" for column, expression in export.columns)
+        sql = f"SELECT row_to_json(r)::text FROM (SELECT {columns} FROM {export.table}{where}) r"
+    else:
+        properties = ', '.join(
+            f"'{column}', {expression}" for column, expression in export.columns
+            if column not in ('lon', 'lat'))
+        sql = (f"SELECT json_build_object('type', 'Feature', "
+               f"'geometry', ST_AsGeoJSON(center)::json, "
+               f"'properties', json_build_object({properties}))::text "
+               f"FROM {export.table}{where}")
+    return sql, params
+
+
+def _csv_field(value):
+    if value is None:
+        return ''
+    if any(char in value for char in ',"\n\r'):
+        return '"' + value.replace('"', '""') + '"'
+    return value
+
+
+def export_chunks(name, fmt, feed=None, country_code=None, batch_size=BATCH_SIZE):
+    """
+    Yield export ``name`` in ``fmt`` as text chunks of ``batch_size`` rows,
+    read through a server-side cursor so memory stays constant whatever
+    the row count.
+    """
+    sql, params = export_query(name, fmt, feed, country_code)
+    if fmt == 'csv':
+        yield ','.join(column for column, _expression in EXPORTS[name].columns) + '\n'
+    elif fmt == 'geojson':
+        yield GEOJSON_HEADER
+    separator = ''
+    with streaming_cursor() as cursor:
+        cursor.execute(sql, params)
+        while True:
+            rows = cursor.fetchmany(batch_size)
+            if not rows:
+                break
+            if fmt == 'csv':
+                yield ''.join(','.join(_csv_field(value) for value in row) + '\n' for row in rows)
+            elif fmt == 'jsonl':
+                yield ''.join(row[0] + '\n' for row in rows)
+            else:
+                yield separator + ',\n'.join(row[0] for row in rows)
+                separator = ',\n'
+    if fmt == 'geojson':
+        yield GEOJSON_FOOTER
+
+
+async def aiter_chunks(chunks):
+    """
+    Async iterator over the iterator ``chunks``, pulling one chunk at a time
+    in the request's sync thread, where its database connection lives.
+    Under ASGI, Django buffers a sync iterator completely before sending
+    anything.
+    """
+    pull = sync_to_async(next, thread_sensitive=True)
+    try:
+        while True:
+            chunk = await pull(chunks, _DONE)
+            if chunk is _DONE:
+                break
+            yield chunk
+    finally:
+        # Closing the generators closes the server-side cursor
+        await sync_to_async(chunks.close, thread_sensitive=True)()
+
+
+def copy_csv(fp, name, feed=None, country_code=None):
+    """
+    Write export ``name`` as CSV to the text file ``fp`` with a single
+    ``COPY ... TO STDOUT``, the fastest path when the whole output goes to
+    one file.
+    """
+    sql, params = export_query(name, 'csv', feed, country_code)
+    with connection.cursor() as cursor:
+        copy_sql = cursor.mogrify(f"COPY ({sql}) TO STDOUT WITH (FORMAT csv, HEADER)", params)
+        cursor.copy_expert(copy_sql.decode(), fp)
+
+
+def gzip_chunks(chunks, level=6):
+    """Compress text ``chunks`` into a gzip stream on the fly."""
+    compressor = zlib.compressobj(level, zlib.DEFLATED, 16 + zlib.MAX_WBITS)
+    for chunk in chunks:
+        data = compressor.compress(chunk.encode())
+        if data:
+            yield data
+    yield compressor.flush()
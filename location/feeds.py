@@ -0,0 +1,374 @@
+import csv
+import json
+import time
+
+from django.db import connection, transaction
+from django.utils import timezone
+
+from .cache import bump_version
+from .changes import ACCOMMODATION, record_sql
+from .db import copy_rows, pg_array, points_to_ewkt, require_session
+from .listings import database_now, refresh_feed_listings
+from .models import Accommodation, LocalizeAccommodation
+from .partitions import (
+    ensure_feed_partition, ensure_month_partition, feed_partition_name, shadow_feed_partition,
+)
+from .prices import price_sql
+from .rollups import PENDING_TABLE
+from .search import flush_search_index
+
+REQUIRED_FIELDS = ('id', 'title', 'country_code', 'bedroom_count', 'usd_rate', 'location_id')
+
+STAGING_TABLE = "location_feed_staging"
+SEEN_TABLE = "location_feed_seen"
+STAGING_COLUMNS = ('id', 'title', 'country_code', 'bedroom_count', 'review_score', 'usd_rate',
+                   'center', 'images', 'location_id', 'amenities', 'user_id', 'published')
+
+UPSERT_SQL = """
+    WITH written AS (
+        INSERT INTO {table} AS a (
+            id, feed, title, country_code, bedroom_count, review_score, usd_rate,
+            center, images, location_id, amenities, user_id, published,
+            created_at, updated_at
+        )
+        SELECT id, %s, title, country_code, bedroom_count, COALESCE(review_score, 0),
+               usd_rate, center, COALESCE(images, '{{}}'), location_id,
+               COALESCE(amenities, '{{}}'), user_id, COALESCE(published, FALSE),
+               {created_at}, NOW()
+        FROM {staging} s
+        ON CONFLICT (id, feed) DO UPDATE SET
+            title = EXCLUDED.title,
+            country_code = EXCLUDED.country_code,
+            bedroom_count = EXCLUDED.bedroom_count,
+            review_score = EXCLUDED.review_score,
+            usd_rate = EXCLUDED.usd_rate,
+            center = EXCLUDED.center,
+            images = EXCLUDED.images,
+            location_id = EXCLUDED.location_id,
+            amenities = EXCLUDED.amenities,
+            user_id = EXCLUDED.user_id,
+            published = EXCLUDED.published,
+            updated_at = EXCLUDED.updated_at
+        WHERE (a.title, a.country_code, a.bedroom_count, a.review_score, a.usd_rate,
+               a.center, a.images, a.location_id, a.amenities, a.user_id, a.published)
+              IS DISTINCT FROM
+              (EXCLUDED.title, EXCLUDED.country_code, EXCLUDED.bedroom_count,
+               EXCLUDED.review_score, EXCLUDED.usd_rate, EXCLUDED.center, EXCLUDED.images,
+               EXCLUDED.location_id, EXCLUDED.amenities, EXCLUDED.user_id, EXCLUDED.published)
+        RETURNING (xmax = 0) AS inserted, id, feed, location_id, usd_rate, published
+    ), queued AS (
+        INSERT INTO {pending} (location_id)
+        SELECT DISTINCT location_id FROM written
+        ON CONFLICT DO NOTHING
+    ){records}
+    SELECT COUNT(*) FILTER (WHERE inserted), COUNT(*) FILTER (WHERE NOT inserted)
+    FROM written
+"""
+
+# Locations losing an accommodation that moves elsewhere in this batch
+QUEUE_MOVED_SQL = """
+    INSERT INTO {pending} (location_id)
+    SELECT DISTINCT a.location_id
+    FROM {table} a
+    JOIN {staging} s ON s.id = a.id
+    WHERE a.location_id IS DISTINCT FROM s.location_id
+    ON CONFLICT DO NOTHING
+"""
+
+PRUNE_SQL = """
+    WITH deleted AS (
+        DELETE FROM {partition} a
+        WHERE NOT EXISTS (SELECT 1 FROM {seen} s WHERE s.id = a.id)
+        RETURNING id, feed, location_id
+    ), queued AS (
+        INSERT INTO {pending} (location_id)
+        SELECT DISTINCT location_id FROM deleted
+        ON CONFLICT DO NOTHING
+    ), changed AS (
+        {record_deleted}
+    ), prices AS (
+        {price_deleted}
+    )
+    SELECT COUNT(*) FROM deleted
+"""
+
+SWAP_LOCATIONS_TABLE = "location_feed_swap_locations"
+
+# Accommodations of the live partition missing from a shadow load
+DROPPED_BY_SWAP_SQL = """
+    SELECT COUNT(*) FROM {partition} a
+    WHERE NOT EXISTS (SELECT 1 FROM {shadow} s WHERE s.id = a.id)
+"""
+
+# Change records of a shadow load against the live partition it replaces
+SWAP_CHANGES_SQL = """
+    WITH diff AS (
+        SELECT COALESCE(s.id, live.id) AS id, %s AS feed,
+               CASE WHEN live.id IS NULL THEN 'c' WHEN s.id IS NULL THEN 'd' ELSE 'u' END AS operation
+        FROM {shadow} s
+        FULL JOIN {partition} live ON live.id = s.id
+        WHERE live.id IS NULL OR s.id IS NULL
+           OR (live.title, live.country_code, live.bedroom_count, live.review_score, live.usd_rate,
+               live.center, live.images, live.location_id, live.amenities, live.user_id, live.published)
+              IS DISTINCT FROM
+              (s.title, s.country_code, s.bedroom_count, s.review_score, s.usd_rate,
+               s.center, s.images, s.location_id, s.amenities, s.user_id, s.published)
+    )
+    {record}
+"""
+
+# Price history rows of a shadow load against the live partition it replaces
+SWAP_PRICES_SQL = """
+    WITH diff AS (
+        SELECT COALESCE(s.id, live.id) AS id, %s AS feed,
+               COALESCE(s.location_id, live.location_id) AS location_id, s.usd_rate, s.published
+        FROM {shadow} s
+        FULL JOIN {partition} live ON live.id = s.id
+        WHERE live.id IS NULL OR s.id IS NULL
+           OR (live.usd_rate, live.published, live.location_id)
+              IS DISTINCT FROM (s.usd_rate, s.published, s.location_id)
+    )
+    {record}
+"""
+
+TRUE_VALUES = ('1', 't', 'true', 'y', 'yes')
+
+
+class FeedIngestError(Exception):
+    pass
+
+
+def _list_field(value):
+    # CSV feeds carry lists either as JSON arrays or "|"-separated strings
+    if value is None or isinstance(value, (list, tuple)):
+        return value
+    value = value.strip()
+    if not value:
+        return []
+    if value.startswith('['):
+        return json.loads(value)
+    return value.split('|')
+
+
+def _bool_field(value):
+    if value is None or isinstance(value, bool):
+        return value
+    return str(value).strip().lower() in TRUE_VALUES
+
+
+def _center(row):
+    if row.get('center'):
+        return row['center']
+    if row.get('lat') not in (None, '') and row.get('lon') not in (None, ''):
+        return f"POINT({row['lon']} {row['lat']})"
+    return None
+
+
+def read_feed_file(fileobj, fmt):
+    """Yield accommodation dicts from a JSONL or CSV text stream."""
+    if fmt == 'jsonl':
+        for line_no, line in enumerate(fileobj, 1):
+            line = line.strip()
+            if not line:
+                continue
+            try:
+                yield json.loads(line)
+            except ValueError as e:
+                raise FeedIngestError(f"Line {line_no}: invalid JSON ({e})")
+    elif fmt == 'csv':
+        yield from csv.DictReader(fileobj)
+    else:
+        raise FeedIngestError(f"Unsupported feed format: {fmt}")
+
+
+def _staging_rows(batch):
+    try:
+        centers = points_to_ewkt([_center(row) for row in batch])
+    except ValueError as e:
+        raise FeedIngestError(str(e))
+    for row, center in zip(batch, centers):
+        missing = [field for field in REQUIRED_FIELDS if row.get(field) in (None, '')]
+        if missing or center is None:
+            raise FeedIngestError(
+                f"Accommodation {row.get('id')!r} is missing: {', '.join(missing or ['center'])}")
+        yield (
+            row['id'],
+            row['title'],
+            row['country_code'],
+            row['bedroom_count'],
+            row.get('review_score') or None,
+            row['usd_rate'],
+            center,
+            pg_array(_list_field(row.get('images'))),
+            row['location_id'],
+            pg_array(_list_field(row.get('amenities'))),
+            row.get('user_id') or None,
+            _bool_field(row.get('published')),
+        )
+
+
+def _batches(rows, size):
+    # Later rows win within a batch, like they would across batches
+    batch = {}
+    for row in rows:
+        batch[row.get('id')] = row
+        if len(batch) >= size:
+            yield list(batch.values())
+            batch = {}
+    if batch:
+        yield list(batch.values())
+
+
+def ingest_feed(feed, rows, batch_size=10000, prune=False, swap=False, progress=None):
+    """
+    Upsert accommodation dicts from ``rows`` into the partition of ``feed``,
+    creating the partition first if the feed is new.
+
+    Rows are COPYed in batches of ``batch_size`` into a temporary staging
+    table and upserted on ``(id, feed)`` straight into
+    ``location_accommodation_feed_<feed>``, one transaction per batch, so
+    memory stays bounded by the batch size. Rows whose values did not change
+    are skipped. With ``prune``, accommodations of the feed that were not in
+    ``rows`` are deleted once everything is loaded.
+
+    With ``swap``, ``rows`` must be the complete feed: it is loaded into a
+    shadow table that replaces the live partition in one step once the load
+    succeeded (see ``partitions.shadow_feed_partition``), so readers never
+    see a half-refreshed feed. ``created_at`` is carried over from the live
+    partition.
+
+    Stats of the affected locations are queued for the next
+    ``rollups.refresh_location_stats``; the listings of written and deleted
+    rows are refreshed once the load is done (``location.listings``). Every
+    written or deleted row gets a change record (``location.changes``), and
+    a price history row if its rate, availability or location changed
+    (``location.prices``).
+
+    ``progress(rows_read, elapsed_seconds)`` is called after each batch.
+    Returns a dict with ``rows``, ``inserted``, ``updated``, ``unchanged``
+    and ``deleted`` counts and the elapsed time.
+    """
+    started = time.perf_counter()
+    # The staging tables outlive the per-batch transactions
+    require_session()
+    ensure_feed_partition(feed)
+    ensure_month_partition(timezone.now())
+    partition = feed_partition_name(feed)
+
+    if swap:
+        with connection.cursor() as cursor:
+            cursor.execute(f"DROP TABLE IF EXISTS {SWAP_LOCATIONS_TABLE}")
+
+        def compare(cursor):
+            # Runs in the swap's transaction (see shadow_feed_partition), so
+            # the change and price records commit with the swap or not at all
+            cursor.execute(SWAP_CHANGES_SQL.format(
+                shadow=shadow, partition=partition,
+                record=record_sql(ACCOMMODATION, 'diff', 'operation')), [feed])
+            cursor.execute(SWAP_PRICES_SQL.format(
+                shadow=shadow, partition=partition,
+                record=price_sql('diff', published='COALESCE(w.published, FALSE)')), [feed])
+            cursor.execute(DROPPED_BY_SWAP_SQL.format(partition=partition, shadow=shadow))
+            totals['deleted'] = cursor.fetchone()[0]
+            # Everything lands in an empty table; report what changed
+            # relative to the live data instead
+            cursor.execute(
+                f"SELECT COUNT(*) FROM {shadow} s WHERE NOT EXISTS "
+                f"(SELECT 1 FROM {partition} live WHERE live.id = s.id)")
+            totals['inserted'] = cursor.fetchone()[0]
+            totals['updated'] = totals['rows'] - totals['inserted']
+            cursor.execute(
+                f"CREATE TEMP TABLE {SWAP_LOCATIONS_TABLE} AS "
+                f"SELECT DISTINCT location_id FROM {partition}")
+
+        with shadow_feed_partition(feed, before_swap=compare) as shadow:
+            created_at = (f"COALESCE((SELECT live.created_at FROM {partition} live "
+                          f"WHERE live.id = s.id), NOW())")
+            totals = _load(feed, rows, shadow, created_at, batch_size, False, started, progress,
+                           record_changes=False)
+        # Queue stats of every location touched by the old or new data only
+        # once the swap is visible, so a refresh can't run against the old data
+        with connection.cursor() as cursor:
+            cursor.execute(
+                f"INSERT INTO {PENDING_TABLE} (location_id) "
+                f"SELECT location_id FROM {SWAP_LOCATIONS_TABLE} "
+                f"UNION SELECT DISTINCT location_id FROM {partition} "
+                f"ON CONFLICT DO NOTHING")
+            cursor.execute(f"DROP TABLE {SWAP_LOCATIONS_TABLE}")
+        # Everything may have changed
+        refresh_feed_listings(feed)
+    else:
+        since = database_now()
+        totals = _load(feed, rows, partition, "NOW()", batch_size, prune, started, progress)
+        if totals['inserted'] or totals['updated']:
+            # The generated search_vector of written rows went to the GIN
+            # pending list; a swap builds the index after the load instead
+            flush_search_index(partition)
+        if totals['inserted'] or totals['updated'] or totals['deleted']:
+            # Written rows carry updated_at = NOW() of their batch
+            refresh_feed_listings(feed, since=since, prune=bool(totals['deleted']))
+
+    totals['unchanged'] = totals['rows'] - totals['inserted'] - totals['updated']
+    if totals['inserted'] or totals['updated'] or totals['deleted']:
+        # Batches commit one by one, so everything is visible by now
+        bump_version(Accommodation)
+    if totals['deleted']:
+        # Their localizations went with them (ON DELETE CASCADE)
+        bump_version(LocalizeAccommodation)
+    totals['elapsed'] = time.perf_counter() - started
+    return totals
+
+
+def _load(feed, rows, table, created_at, batch_size, prune, started, progress, record_changes=True):
+    totals = {'rows': 0, 'inserted': 0, 'updated': 0, 'deleted': 0}
+
+    with connection.cursor() as cursor:
+        # CREATE TABLE AS copies the column types but, unlike LIKE, none of
+        # the NOT NULL constraints, which the optional feed columns would break
+        cursor.execute(
+            f"CREATE TEMP TABLE {STAGING_TABLE} AS SELECT {', '.join(STAGING_COLUMNS)} "
+            f"FROM location_accommodation WITH NO DATA")
+        cursor.execute(
+            f"CREATE TEMP TABLE {SEEN_TABLE} (id VARCHAR(20) PRIMARY KEY)")
+        # A shadow load is diffed against the live data instead. The
+        # table read by the prices CTE still holds the values from before
+        # the upsert, as every part of the statement sees the same snapshot.
+        records = ""
+        if record_changes:
+            records = (", changed AS ("
+                       + record_sql(ACCOMMODATION, 'written', "CASE WHEN inserted THEN 'c' ELSE 'u' END")
+                       + "), prices AS (" + price_sql('written', previous=table) + ")")
+        upsert_sql = UPSERT_SQL.format(
+            table=table, staging=STAGING_TABLE, created_at=created_at, pending=PENDING_TABLE,
+            records=records)
+        queue_moved_sql = QUEUE_MOVED_SQL.format(
+            table=table, staging=STAGING_TABLE, pending=PENDING_TABLE)
+        try:
+            for batch in _batches(rows, batch_size):
+                with transaction.atomic():
+                    cursor.execute(f"TRUNCATE {STAGING_TABLE}")
+                    totals['rows'] += copy_rows(
+                        cursor, STAGING_TABLE, STAGING_COLUMNS, _staging_rows(batch))
+                    cursor.execute(queue_moved_sql)
+                    cursor.execute(upsert_sql, [feed])
+                    inserted, updated = cursor.fetchone()
+                    totals['inserted'] += inserted
+                    totals['updated'] += updated
+                    if prune:
+                        cursor.execute(
+                            f"INSERT INTO {SEEN_TABLE} SELECT id FROM {STAGING_TABLE} "
+                            f"ON CONFLICT DO NOTHING")
+                if progress:
+                    progress(totals['rows'], time.perf_counter() - started)
+
+            if prune:
+                with transaction.atomic():
+                    cursor.execute(PRUNE_SQL.format(
+                        partition=table, seen=SEEN_TABLE, pending=PENDING_TABLE,
+                        record_deleted=record_sql(ACCOMMODATION, 'deleted', "'d'"),
+                        price_deleted=price_sql('deleted', usd_rate='NULL', published='FALSE')))
+                    totals['deleted'] = cursor.fetchone()[0]
+        finally:
+            cursor.execute(f"DROP TABLE IF EXISTS {STAGING_TABLE}, {SEEN_TABLE}")
+
+    return totals
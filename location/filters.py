@@ -0,0 +1,24 @@
+def filter_accommodations(queryset, params, path='location_id__path'):
+    """
+    Apply the filters of a validated ``AccommodationFilterForm`` to an
+    ``Accommodation`` queryset, or an ``AccommodationListing`` one with
+    ``path='path'``.
+    """
+    if params.get('country_code'):
+        queryset = queryset.filter(country_code=params['country_code'].upper())
+    if params.get('location_id'):
+        queryset = queryset.filter(location_id=params['location_id'])
+    if params.get('under'):
+        # One GIN lookup on the materialized path instead of a recursive walk
+        queryset = queryset.filter(**{f'{path}__contains': [params['under']]})
+    if params.get('bedroom_count') is not None:
+        queryset = queryset.filter(bedroom_count=params['bedroom_count'])
+    if params.get('min_rate') is not None:
+        queryset = queryset.filter(usd_rate__gte=params['min_rate'])
+    if params.get('max_rate') is not None:
+        queryset = queryset.filter(usd_rate__lte=params['max_rate'])
+    if params.get('min_review_score') is not None:
+        queryset = queryset.filter(review_score__gte=params['min_review_score'])
+    if params.get('amenities'):
+        queryset = queryset.filter(amenities__contains=params['amenities'])
+    return queryset
@@ -1,6 +1,112 @@
+from datetime import date
+
 from django import forms
 
+from .changes import MODELS
+
 class SignUpForm(forms.Form):
     username = forms.CharField(max_length=150, required=True)
     email = forms.EmailField(required=True)
     password = forms.CharField(widget=forms.PasswordInput(), required=True)
+
+
+class BulkImportForm(forms.Form):
+    csv_file = forms.FileField(required=True)
+
+
+class AccommodationFilterForm(forms.Form):
+    country_code = forms.CharField(max_length=2, required=False)
+    location_id = forms.CharField(max_length=20, required=False)
+    # Anywhere in the subtree of this location
+    under = forms.CharField(max_length=20, required=False)
+    bedroom_count = forms.IntegerField(min_value=0, required=False)
+    min_rate = forms.DecimalField(max_digits=10, decimal_places=2, required=False)
+    max_rate = forms.DecimalField(max_digits=10, decimal_places=2, required=False)
+    min_review_score = forms.DecimalField(max_digits=3, decimal_places=1, required=False)
+    # Comma separated; an accommodation must offer all of them
+    amenities = forms.CharField(required=False)
+
+    def clean_amenities(self):
+        value = self.cleaned_data['amenities']
+        return [amenity.strip() for amenity in value.split(',') if amenity.strip()]
+
+
+class LocalizationForm(forms.Form):
+    # Falls back along LOCALIZATION_FALLBACKS when missing in this language
+    lang = forms.RegexField(regex=r'^[a-z]{2}$', required=False)
+    feed = forms.IntegerField(min_value=0, max_value=32767, required=False)
+
+
+class SearchForm(forms.Form):
+    q = forms.CharField(max_length=200)
+    # Language of the descriptions searched; titles are searched regardless
+    lang = forms.RegexField(regex=r'^[a-z]{2}$', required=False)
+    limit = forms.IntegerField(min_value=1, max_value=200, required=False)
+
+
+class ExportForm(forms.Form):
+    feed = forms.IntegerField(min_value=0, max_value=32767, required=False)
+    country_code = forms.CharField(max_length=2, required=False)
+    gzip = forms.BooleanField(required=False)
+
+
+class NearbyForm(forms.Form):
+    lat = forms.FloatField(min_value=-90, max_value=90)
+    lon = forms.FloatField(min_value=-180, max_value=180)
+    km = forms.FloatField(min_value=0.01, max_value=500)
+    limit = forms.IntegerField(min_value=1, max_value=200, required=False)
+
+
+class BoundingBoxForm(forms.Form):
+    west = forms.FloatField(min_value=-180, max_value=180)
+    south = forms.FloatField(min_value=-90, max_value=90)
+    east = forms.FloatField(min_value=-180, max_value=180)
+    north = forms.FloatField(min_value=-90, max_value=90)
+    limit = forms.IntegerField(min_value=1, max_value=200, required=False)
+
+    def clean(self):
+        cleaned_data = super().clean()
+        if not self.errors:
+            # west greater than east crosses the antimeridian
+            if cleaned_data['west'] == cleaned_data['east']:
+                raise forms.ValidationError("west and east must differ.")
+            if cleaned_data['south'] >= cleaned_data['north']:
+                raise forms.ValidationError("south must be less than north.")
+        return cleaned_data
+
+
+class ChangesForm(forms.Form):
+    # "txid:id" as returned by the previous read, or "latest" to start from now
+    cursor = forms.RegexField(regex=r'^(\d+:\d+|latest)$', required=False)
+    limit = forms.IntegerField(min_value=1, max_value=5000, required=False)
+    model = forms.MultipleChoiceField(
+        choices=[(model, model) for model in MODELS], required=False)
+    # Only the last change of each object within the batch
+    compact = forms.BooleanField(required=False)
+
+
+class PriceHistoryForm(forms.Form):
+    feed = forms.IntegerField(min_value=0, max_value=32767, required=False)
+    # Defaults to the last year
+    since = forms.DateField(required=False)
+    until = forms.DateField(required=False)
+
+    def clean(self):
+        cleaned_data = super().clean()
+        since, until = cleaned_data.get('since'), cleaned_data.get('until')
+        if since and until and since >= until:
+            raise forms.ValidationError("since must be before until.")
+        return cleaned_data
+
+
+class MonthlyPricesForm(forms.Form):
+    # First month as YYYY-MM; defaults to the last 12 months
+    start = forms.RegexField(regex=r'^\d{4}-(0[1-9]|1[0-2])$', required=False)
+    months = forms.IntegerField(min_value=1, max_value=36, required=False)
+
+    def clean_start(self):
+        value = self.cleaned_data['start']
+        if not value:
+            return None
+        year, month = value.split('-')
+        return date(int(year), int(month), 1)
@@ -0,0 +1,101 @@
+from math import cos, radians
+
+from django.contrib.gis.db.models import GeometryField
+from django.contrib.gis.db.models.functions import Distance
+from django.contrib.gis.geos import Point, Polygon
+from django.contrib.gis.measure import D
+from django.db.models import FloatField, Func, Q, Value
+
+SRID = 4326
+KM_PER_DEGREE_LAT = 111.32
+
+
+class KNNDistance(Func):
+    """
+    PostGIS ``<->`` operator. Ordering by it lets the planner walk the GiST
+    index nearest-first and stop after LIMIT rows instead of sorting every
+    candidate by an exact distance.
+    """
+    arg_joiner = ' <-> '
+    template = '%(expressions)s'
+    output_field = FloatField()
+
+
+def _geometry(geom):
+    return Value(geom, output_field=GeometryField(srid=SRID))
+
+
+def radius_bbox(lat, lon, km):
+    """
+    Bounding box in degrees that encloses a ``km`` radius around a point.
+    Near the antimeridian the box wraps around ±180° and ``west`` is
+    greater than ``east``; ``split_bbox`` cuts it in two.
+    """
+    lat_delta = km / KM_PER_DEGREE_LAT
+    # Longitude degrees shrink towards the poles
+    lon_delta = km / (KM_PER_DEGREE_LAT * max(cos(radians(lat)), 0.01))
+    south, north = max(lat - lat_delta, -90), min(lat + lat_delta, 90)
+    if lon_delta >= 180:
+        return -180, south, 180, north
+    return _wrap(lon - lon_delta), south, _wrap(lon + lon_delta), north
+
+
+def _wrap(lon):
+    return lon if -180 <= lon <= 180 else (lon + 180) % 360 - 180
+
+
+def split_bbox(bbox):
+    """``bbox`` as one box, or two when it crosses the antimeridian."""
+    west, south, east, north = bbox
+    if west <= east:
+        return [bbox]
+    return [(west, south, 180, north), (-180, south, east, north)]
+
+
+def _any_box(lookup, bbox):
+    boxes = split_bbox(bbox)
+    condition = Q(**{lookup: _polygon(boxes[0])})
+    for box in boxes[1:]:
+        condition |= Q(**{lookup: _polygon(box)})
+    return condition, len(boxes) > 1
+
+
+def _polygon(bbox):
+    polygon = Polygon.from_bbox(bbox)
+    polygon.srid = SRID
+    return polygon
+
+
+def nearby(queryset, lat, lon, km, field='center'):
+    """
+    Rows of ``queryset`` within ``km`` of (``lat``, ``lon``), nearest first,
+    annotated with ``distance`` (a ``Distance`` in metres).
+
+    The ``&&`` bounding-box test and the ``<->`` ordering are answered by the
+    GiST index; the exact spherical distance is only checked for rows that
+    survive the box.
+    """
+    point = Point(lon, lat, srid=SRID)
+    in_box, wraps = _any_box(f'{field}__bboverlaps', radius_bbox(lat, lon, km))
+    queryset = (
+        queryset
+        .filter(in_box, **{f'{field}__distance_lte': (point, D(km=km))})
+        .annotate(distance=Distance(field, point))
+    )
+    # <-> is planar, so across ±180° it would rank the other side last
+    return queryset.order_by('distance' if wraps else KNNDistance(field, _geometry(point)))
+
+
+def within_bbox(queryset, west, south, east, north, field='center'):
+    """
+    Rows of ``queryset`` inside the bounding box, ordered by distance from its
+    centre so a limited page shows the most central results. A box with
+    ``west`` greater than ``east`` crosses the antimeridian.
+    """
+    in_box, wraps = _any_box(f'{field}__contained', (west, south, east, north))
+    centre_lon = (west + east) / 2 + (180 if wraps else 0)
+    centre = Point(_wrap(centre_lon), (south + north) / 2, srid=SRID)
+    queryset = queryset.filter(in_box)
+    if wraps:
+        return queryset.order_by(Distance(field, centre))
+    return queryset.order_by(KNNDistance(field, _geometry(centre)))
@@ -0,0 +1,157 @@
+import threading
+import time
+
+from django.db import connection
+
+from .cache import cache_get, cache_set
+from .models import Location
+
+# Seconds a process trusts its copy of the tree before checking the version
+TREE_CHECK_INTERVAL = 30
+TREE_CACHE_TIMEOUT = 60 * 60
+MAX_DEPTH = 50
+
+# Recompute ``path`` for the seed locations (walking up to their root, so
+# stale stored paths above them don't matter) and everything below them.
+# A location reached from two seeds gets the same path both times.
+REBUILD_PATHS_SQL = f"""
+    WITH RECURSIVE up AS (
+        SELECT id AS node, id AS ancestor, parent_id_id, 0 AS level
+        FROM location_location
+        WHERE {{where}}
+        UNION ALL
+        SELECT up.node, l.id, l.parent_id_id, up.level + 1
+        FROM up
+        JOIN location_location l ON l.id = up.parent_id_id
+        WHERE up.level < {MAX_DEPTH}
+    ), seeds AS (
+        SELECT node AS id, array_agg(ancestor::varchar ORDER BY level DESC) AS path
+        FROM up
+        GROUP BY node
+    ), tree AS (
+        SELECT id, path FROM seeds
+        UNION ALL
+        SELECT child.id, tree.path || child.id::varchar
+        FROM location_location child
+        JOIN tree ON child.parent_id_id = tree.id
+        WHERE cardinality(tree.path) < {MAX_DEPTH}
+    )
+    UPDATE location_location l
+    SET path = t.path
+    FROM (SELECT DISTINCT ON (id) id, path FROM tree) t
+    WHERE l.id = t.id AND l.path IS DISTINCT FROM t.path
+"""
+
+# Locations whose stored path does not end in their current parent and id
+STALE_PATH_CONDITION = (
+    "(cardinality(path) = 0 OR path[cardinality(path)] IS DISTINCT FROM id "
+    "OR path[cardinality(path) - 1] IS DISTINCT FROM parent_id_id)"
+)
+
+# Bumped by a statement trigger on location_location (migration 0017)
+TREE_VERSION_SQL = "SELECT version FROM location_treeversion WHERE id = 1"
+
+_lock = threading.Lock()
+_tree = None
+
+
+def rebuild_paths(where=None, params=()):
+    """
+    Recompute ``Location.path`` for the locations matching the SQL condition
+    ``where`` (over ``location_location``) and their descendants, in one
+    statement. Without ``where`` every path is rebuilt from the roots.
+    Returns the number of rows whose path changed.
+    """
+    with connection.cursor() as cursor:
+        cursor.execute(REBUILD_PATHS_SQL.format(where=where or "parent_id_id IS NULL"), params)
+        return cursor.rowcount
+
+
+class LocationTree:
+    """Parent links of every location, for ancestor and descendant lookups without queries."""
+
+    def __init__(self, parents):
+        self.parents = parents
+        self._children = None
+
+    def __contains__(self, location_id):
+        return location_id in self.parents
+
+    def ancestors(self, location_id):
+        """Ancestor ids from the root down, excluding ``location_id``."""
+        chain = []
+        parent = self.parents.get(location_id)
+        while parent is not None and len(chain) < MAX_DEPTH:
+            chain.append(parent)
+            parent = self.parents.get(parent)
+        chain.reverse()
+        return chain
+
+    def children(self, location_id):
+        if self._children is None:
+            children = {}
+            for child, parent in self.parents.items():
+                if parent is not None:
+                    children.setdefault(parent, []).append(child)
+            self._children = children
+        return self._children.get(location_id, [])
+
+    def descendants(self, location_id):
+        """Ids of every location below ``location_id``, breadth first."""
+        found = []
+        level = self.children(location_id)
+        while level and len(found) < len(self.parents):
+            found.extend(level)
+            level = [child for parent in level for child in self.children(parent)]
+        return found
+
+
+def _tree_version():
+    with connection.cursor() as cursor:
+        cursor.execute(TREE_VERSION_SQL)
+        return str(cursor.fetchone()[0])
+
+
+def _load_parents():
+    return dict(Location.objects.values_list('id', 'parent_id_id').iterator(chunk_size=10000))
+
+
+def get_tree():
+    """
+    The location tree, cached in-process and in the shared cache.
+
+    The cache key is derived from a one-row counter that a trigger bumps
+    on every insert, delete or re-parenting of locations, so any save,
+    bulk import or delete produces a new key and checking it is a primary
+    key lookup. Each process re-checks the version at most every
+    ``TREE_CHECK_INTERVAL`` seconds, and immediately after ``invalidate_tree``.
+    """
+    global _tree
+    now = time.monotonic()
+    current = _tree
+    if current is not None and now - current[1] < TREE_CHECK_INTERVAL:
+        return current[2]
+
+    version = _tree_version()
+    if current is not None and current[0] == version:
+        with _lock:
+            _tree = (version, now, current[2])
+        return current[2]
+
+    key = f"location:tree:{version}"
+    parents = cache_get(key)
+    if parents is None:
+        parents = _load_parents()
+        cache_set(key, parents, TREE_CACHE_TIMEOUT)
+    tree = LocationTree(parents)
+    with _lock:
+        _tree = (version, now, tree)
+    return tree
+
+
+def invalidate_tree():
+    """Make the next ``get_tree`` in this process re-check the version."""
+    global _tree
+    with _lock:
+        if _tree is not None:
+            _tree = (_tree[0], float('-inf'), _tree[2])
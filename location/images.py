@@ -0,0 +1,214 @@
+import hashlib
+import io
+import logging
+import threading
+from concurrent.futures import ThreadPoolExecutor
+
+from PIL import Image, ImageOps
+from django.conf import settings
+from django.core.files.base import ContentFile
+from django.core.files.storage import default_storage
+from django.db import connection
+
+from .models import ImageRendition
+
+logger = logging.getLogger(__name__)
+
+# name -> bounding box; the aspect ratio is kept
+DEFAULT_RENDITIONS = {
+    'thumb': (320, 240),
+    'medium': (800, 600),
+    'large': (1600, 1200),
+}
+RENDITION_DIR = "renditions"
+JPEG_QUALITY = 85
+
+# Sources listed on accommodations without a rendition yet
+PENDING_SOURCES_SQL = """
+    SELECT DISTINCT image FROM location_accommodation, unnest(images) AS image
+    {where}
+    EXCEPT SELECT source FROM location_imagerendition
+"""
+
+_executor = None
+_executor_lock = threading.Lock()
+
+
+def renditions():
+    return getattr(settings, 'IMAGE_RENDITIONS', DEFAULT_RENDITIONS)
+
+
+def is_local(source):
+    # Feeds may list remote URLs; only files in our storage are resized
+    return bool(source) and '://' not in source
+
+
+def rendition_url(file):
+    return f"{getattr(settings, 'IMAGE_URL', '/images/')}{file}"
+
+
+def _render(data, size):
+    # Pillow releases the GIL while decoding, resizing and encoding, so
+    # renditions of different images run in parallel on threads
+    with Image.open(io.BytesIO(data)) as image:
+        image = ImageOps.exif_transpose(image)
+        if image.mode != 'RGB':
+            image = image.convert('RGB')
+        image.thumbnail(size, Image.LANCZOS)
+        output = io.BytesIO()
+        image.save(output, 'JPEG', quality=JPEG_QUALITY, optimize=True, progressive=True)
+        return output.getvalue(), image.width, image.height
+
+
+def _store(data):
+    # Content-addressed: the same bytes always land on the same name
+    digest = hashlib.sha256(data).hexdigest()
+    name = f"{RENDITION_DIR}/{digest[:2]}/{digest}.jpg"
+    if not default_storage.exists(name):
+        default_storage.save(name, ContentFile(data))
+    return name
+
+
+def render_source(source, source_hash=None, data=None):
+    """
+    Render every configured rendition of ``source`` into storage and return
+    unsaved ``ImageRendition`` rows. Touches storage only, never the
+    database, so it is safe to run on worker threads.
+    """
+    if data is None:
+        with default_storage.open(source, 'rb') as f:
+            data = f.read()
+    source_hash = source_hash or hashlib.sha256(data).hexdigest()
+    rows = []
+    for name, size in renditions().items():
+        output, width, height = _render(data, size)
+        rows.append(ImageRendition(
+            source=source, source_hash=source_hash, rendition=name, file=_store(output),
+            width=width, height=height, size=len(output)))
+    return rows
+
+
+def _plan(sources, force):
+    """
+    Split ``sources`` into those to render, as ``(source, hash, data)``, and
+    rows copied from identical images rendered before.
+    """
+    to_render, reused = [], []
+    existing = {}
+    for source, source_hash in ImageRendition.objects.filter(source__in=sources).values_list(
+            'source', 'source_hash'):
+        existing[source] = source_hash
+    loaded = []
+    for source in sources:
+        try:
+            with default_storage.open(source, 'rb') as f:
+                data = f.read()
+        except OSError:
+            logger.warning("Image %s is missing from storage", source)
+            continue
+        source_hash = hashlib.sha256(data).hexdigest()
+        if not force and existing.get(source) == source_hash:
+            continue
+        loaded.append((source, source_hash, data))
+
+    known = {}
+    if not force:
+        for row in ImageRendition.objects.filter(
+                source_hash__in=[source_hash for _source, source_hash, _data in loaded]):
+            known.setdefault(row.source_hash, []).append(row)
+    for source, source_hash, data in loaded:
+        if set(row.rendition for row in known.get(source_hash, ())) >= set(renditions()):
+            reused += [
+                ImageRendition(source=source, source_hash=source_hash, rendition=row.rendition,
+                               file=row.file, width=row.width, height=row.height, size=row.size)
+                for row in known[source_hash] if row.rendition in renditions()
+            ]
+        else:
+            to_render.append((source, source_hash, data))
+    return to_render, reused
+
+
+def _save(rows):
+    ImageRendition.objects.bulk_create(
+        rows, update_conflicts=True, unique_fields=['source', 'rendition'],
+        update_fields=['source_hash', 'file', 'width', 'height', 'size'])
+
+
+def process_images(sources, workers=4, force=False):
+    """
+    Create or refresh the renditions of ``sources`` (``Accommodation.images``
+    entries). Images are resized on a pool of ``workers`` threads; the
+    results are written from the calling thread in one statement. Unchanged
+    sources are skipped unless ``force``, and sources whose content was
+    rendered before under another name reuse those files. Returns
+    ``(rendered, reused)`` source counts.
+    """
+    sources = [source for source in dict.fromkeys(sources) if is_local(source)]
+    if not sources:
+        return 0, 0
+    to_render, reused = _plan(sources, force)
+    rows = list(reused)
+    rendered = 0
+    with ThreadPoolExecutor(max_workers=workers) as pool:
+        futures = {
+            pool.submit(render_source, source, source_hash, data): source
+            for source, source_hash, data in to_render
+        }
+        for future, source in futures.items():
+            try:
+                rows += future.result()
+                rendered += 1
+            except Exception:  # One broken image must not stop the batch
+                logger.exception("Could not render %s", source)
+    if rows:
+        _save(rows)
+    return rendered, len({row.source for row in reused})
+
+
+def pending_sources(feed=None):
+    """Local images listed on accommodations that have no rendition yet."""
+    where, params = "", []
+    if feed is not None:
+        where, params = "WHERE feed = %s", [feed]
+    with connection.cursor() as cursor:
+        cursor.execute(PENDING_SOURCES_SQL.format(where=where), params)
+        return [row[0] for row in cursor.fetchall() if is_local(row[0])]
+
+
+def _process_in_background(sources):
+    try:
+        # Stored names are unique, so a known source needs no new renditions
+        known = set(ImageRendition.objects.filter(source__in=sources).values_list('source', flat=True))
+        process_images([source for source in sources if source not in known], workers=1)
+    except Exception:
+        logger.exception("Background rendition of %d images failed", len(sources))
+    finally:
+        # Worker threads get their own connection; don't leave it open
+        connection.close()
+
+
+def submit(sources):
+    """
+    Render ``sources`` on the process-wide background pool
+    (``IMAGE_WORKERS`` threads) so saving an accommodation doesn't wait for
+    Pillow.
+    """
+    global _executor
+    sources = [source for source in sources if is_local(source)]
+    if not sources:
+        return None
+    with _executor_lock:
+        if _executor is None:
+            _executor = ThreadPoolExecutor(
+                max_workers=getattr(settings, 'IMAGE_WORKERS', 2), thread_name_prefix='renditions')
+    return _executor.submit(_process_in_background, sources)
+
+
+def renditions_for(sources):
+    """``{source: {rendition: {url, width, height}}}`` for ``sources``, in one query."""
+    result = {}
+    for row in ImageRendition.objects.filter(source__in=list(sources)):
+        result.setdefault(row.source, {})[row.rendition] = {
+            'url': rendition_url(row.file), 'width': row.width, 'height': row.height,
+        }
+    return result
@@ -0,0 +1,222 @@
+import csv
+import time
+
+from django.db import connection, transaction
+
+from .cache import bump_version_on_commit
+from .changes import LOCATION, record_sql
+from .db import copy_rows, points_to_ewkt
+from .hierarchy import STALE_PATH_CONDITION, rebuild_paths
+from .listings import refresh_location_listings
+from .models import Location
+from .rollups import PENDING_TABLE
+
+REQUIRED_COLUMNS = ('id', 'title', 'center', 'location_type', 'country_code')
+
+STAGING_TABLE = "location_import_staging"
+STAGING_COLUMNS = ('line_no', 'id', 'title', 'center', 'parent_id', 'location_type',
+                   'country_code', 'state_abbr', 'city', 'created_at')
+
+CREATE_STAGING_SQL = f"""
+    CREATE TEMP TABLE {STAGING_TABLE} (
+        line_no BIGINT,
+        id VARCHAR(20) NOT NULL,
+        title VARCHAR(100),
+        center GEOMETRY(POINT, 4326),
+        parent_id VARCHAR(20),
+        location_type VARCHAR(20),
+        country_code VARCHAR(2),
+        state_abbr VARCHAR(3),
+        city VARCHAR(30),
+        created_at TIMESTAMPTZ
+    ) ON COMMIT DROP
+"""
+
+DROP_STAGING_SQL = f"DROP TABLE IF EXISTS {STAGING_TABLE}, location_import_ordered"
+
+# Keep the last occurrence of every id and order the rows parents-first.
+# Rows whose parent is not part of the file are roots of the import; rows
+# that never get a depth are part of a parent cycle.
+ORDER_STAGING_SQL = f"""
+    CREATE TEMP TABLE location_import_ordered ON COMMIT DROP AS
+    WITH RECURSIVE latest AS (
+        SELECT DISTINCT ON (id) * FROM {STAGING_TABLE} ORDER BY id, line_no DESC
+    ), ordered AS (
+        SELECT latest.id, 0 AS depth
+        FROM latest
+        WHERE parent_id IS NULL
+           OR NOT EXISTS (SELECT 1 FROM latest parent WHERE parent.id = latest.parent_id)
+        UNION ALL
+        SELECT child.id, ordered.depth + 1
+        FROM latest child
+        JOIN ordered ON child.parent_id = ordered.id
+        WHERE ordered.depth < 100
+    )
+    SELECT latest.*, ordered.depth
+    FROM latest
+    LEFT JOIN ordered ON ordered.id = latest.id
+"""
+
+UNRESOLVED_SQL = """
+    SELECT id, parent_id FROM location_import_ordered o
+    WHERE depth IS NULL
+       OR (depth = 0 AND parent_id IS NOT NULL
+           AND NOT EXISTS (SELECT 1 FROM location_location l WHERE l.id = o.parent_id))
+    ORDER BY line_no
+    LIMIT 10
+"""
+
+# Moved locations change the rolled-up stats of their old ancestors
+QUEUE_MOVED_SQL = f"""
+    INSERT INTO {PENDING_TABLE} (location_id)
+    SELECT moved.location_id
+    FROM location_location l
+    JOIN location_import_ordered o ON o.id = l.id
+    CROSS JOIN LATERAL unnest(ARRAY[l.id, l.parent_id_id]) AS moved(location_id)
+    WHERE l.parent_id_id IS DISTINCT FROM o.parent_id
+      AND moved.location_id IS NOT NULL
+    ON CONFLICT DO NOTHING
+"""
+
+# Locations carry no feed
+RECORD_CHANGES_SQL = record_sql(LOCATION, 'written', "CASE WHEN inserted THEN 'c' ELSE 'u' END", feed='NULL')
+
+UPSERT_SQL = f"""
+    WITH written AS (
+        INSERT INTO location_location (
+            id, title, center, parent_id_id, location_type, country_code,
+            state_abbr, city, created_at, updated_at, path
+        )
+        SELECT id, title, center, parent_id, location_type, country_code,
+               state_abbr, city, COALESCE(created_at, NOW()), NOW(), '{{}}'
+        FROM location_import_ordered
+        ORDER BY depth, line_no
+        ON CONFLICT (id) DO UPDATE SET
+            title = EXCLUDED.title,
+            center = EXCLUDED.center,
+            parent_id_id = EXCLUDED.parent_id_id,
+            location_type = EXCLUDED.location_type,
+            country_code = EXCLUDED.country_code,
+            state_abbr = EXCLUDED.state_abbr,
+            city = EXCLUDED.city,
+            updated_at = EXCLUDED.updated_at
+        WHERE (location_location.title, location_location.center,
+               location_location.parent_id_id, location_location.location_type,
+               location_location.country_code, location_location.state_abbr,
+               location_location.city)
+              IS DISTINCT FROM
+              (EXCLUDED.title, EXCLUDED.center, EXCLUDED.parent_id_id,
+               EXCLUDED.location_type, EXCLUDED.country_code, EXCLUDED.state_abbr,
+               EXCLUDED.city)
+        RETURNING (xmax = 0) AS inserted, id
+    ), changed AS (
+        {RECORD_CHANGES_SQL}
+    )
+    SELECT COUNT(*) FILTER (WHERE inserted), COUNT(*) FILTER (WHERE NOT inserted)
+    FROM written
+"""
+
+
+class LocationImportError(Exception):
+    pass
+
+
+def _chunks(reader, size):
+    chunk = []
+    for row in reader:
+        chunk.append(row)
+        if len(chunk) >= size:
+            yield chunk
+            chunk = []
+    if chunk:
+        yield chunk
+
+
+def _staging_rows(chunk, first_line):
+    try:
+        centers = points_to_ewkt([row.get('center') for row in chunk])
+    except ValueError as e:
+        raise LocationImportError(f"Line {first_line}+: {e}")
+    for offset, (row, center) in enumerate(zip(chunk, centers)):
+        yield (
+            first_line + offset,
+            row['id'],
+            row['title'],
+            center,
+            row.get('parent_id') or None,
+            row['location_type'],
+            row['country_code'],
+            row.get('state_abbr') or None,
+            row.get('city') or None,
+            row.get('created_at') or None,
+        )
+
+
+def bulk_import_locations(fileobj, chunk_size=50000, progress=None):
+    """
+    Import ``Location`` rows from a CSV file object in the format of
+    ``example_location.csv``.
+
+    The file is streamed in chunks of ``chunk_size`` rows which are COPYed
+    into a temporary staging table, then every row is written with a single
+    parents-first upsert. Unchanged rows are left untouched so their
+    ``updated_at`` does not move. ``updated_at`` from the file is ignored.
+    ``Location.path`` is rebuilt for new and moved rows and their subtrees,
+    and the listings of accommodations below changed rows are refreshed.
+    ``progress(rows_staged, elapsed_seconds)`` is called after each chunk.
+
+    Returns a dict with ``rows``, ``inserted``, ``updated`` and ``unchanged``
+    counts and the elapsed time.
+    """
+    started = time.perf_counter()
+    reader = csv.DictReader(fileobj)
+    missing = [column for column in REQUIRED_COLUMNS if column not in (reader.fieldnames or ())]
+    if missing:
+        raise LocationImportError(f"Missing required columns: {', '.join(missing)}")
+
+    staged = 0
+    with transaction.atomic(), connection.cursor() as cursor:
+        # ON COMMIT DROP only fires at the outermost commit; inside a caller's
+        # transaction this is a savepoint and an earlier import's tables remain
+        cursor.execute(DROP_STAGING_SQL)
+        cursor.execute(CREATE_STAGING_SQL)
+        # Header is line 1
+        for chunk in _chunks(reader, chunk_size):
+            staged += copy_rows(cursor, STAGING_TABLE, STAGING_COLUMNS,
+                                _staging_rows(chunk, staged + 2))
+            if progress:
+                progress(staged, time.perf_counter() - started)
+
+        cursor.execute(ORDER_STAGING_SQL)
+        cursor.execute(UNRESOLVED_SQL)
+        unresolved = cursor.fetchall()
+        if unresolved:
+            details = ", ".join(f"{id} (parent {parent})" for id, parent in unresolved)
+            raise LocationImportError(f"Unknown parent or parent cycle for: {details}")
+
+        cursor.execute("SELECT COUNT(*) FROM location_import_ordered")
+        rows = cursor.fetchone()[0]
+        cursor.execute(QUEUE_MOVED_SQL)
+        cursor.execute(UPSERT_SQL)
+        inserted, updated = cursor.fetchone()
+        # New and moved rows, and everything below the moved ones
+        rebuild_paths(
+            f"id IN (SELECT id FROM location_import_ordered) AND {STALE_PATH_CONDITION}")
+        if inserted or updated:
+            bump_version_on_commit(Location)
+        if updated:
+            # Retitled and moved locations change the breadcrumbs below them;
+            # written rows carry this transaction's NOW()
+            cursor.execute(
+                "SELECT id FROM location_location "
+                "WHERE id IN (SELECT id FROM location_import_ordered) AND updated_at = NOW()")
+            refresh_location_listings([row[0] for row in cursor.fetchall()])
+        cursor.execute(DROP_STAGING_SQL)
+
+    return {
+        'rows': rows,
+        'inserted': inserted,
+        'updated': updated,
+        'unchanged': rows - inserted - updated,
+        'elapsed': time.perf_counter() - started,
+    }
@@ -0,0 +1,308 @@
+import atexit
+import glob
+import heapq
+import json
+import logging
+import os
+import threading
+import time
+import uuid
+from contextlib import contextmanager
+from contextvars import ContextVar
+
+from asgiref.sync import iscoroutinefunction, markcoroutinefunction
+from django.conf import settings
+
+logger = logging.getLogger(__name__)
+
+# Statements kept per recorder, slowest first
+SLOWEST_KEPT = 5
+# Request duration histogram buckets, in seconds
+BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10)
+# Seconds between writes of a process's totals to METRICS_DIR
+FLUSH_INTERVAL = 1.0
+
+# Active recorders, innermost last. Like the current user in
+# ``location.middleware``, follows the request through sync_to_async hops
+# and never leaks between concurrent requests.
+_recorders = ContextVar('query_recorders', default=())
+
+
+class QueryRecorder:
+    """Query count, database time and slowest statements of one unit of work."""
+
+    def __init__(self):
+        self.count = 0
+        self.db_time = 0.0
+        self.started = time.perf_counter()
+        self._slowest = []
+        self._lock = threading.Lock()
+
+    def add(self, sql, duration):
+        with self._lock:
+            self.count += 1
+            self.db_time += duration
+            entry = (duration, self.count, sql)
+            if len(self._slowest) < SLOWEST_KEPT:
+                heapq.heappush(self._slowest, entry)
+            else:
+                heapq.heappushpop(self._slowest, entry)
+
+    @property
+    def elapsed(self):
+        return time.perf_counter() - self.started
+
+    @property
+    def slowest(self):
+        """``(seconds, sql)`` of the slowest statements, slowest first."""
+        return [(duration, sql) for duration, _n, sql in sorted(self._slowest, reverse=True)]
+
+
+def record_queries(execute, sql, params, many, context):
+    """Execute wrapper feeding every active ``QueryRecorder``."""
+    recorders = _recorders.get()
+    if not recorders:
+        return execute(sql, params, many, context)
+    started = time.perf_counter()
+    try:
+        return execute(sql, params, many, context)
+    finally:
+        duration = time.perf_counter() - started
+        for recorder in recorders:
+            recorder.add(sql, duration)
+
+
+def install_query_recorder(sender, connection, **kwargs):
+    # connection_created receiver; the wrapper list outlives reconnects
+    if record_queries not in connection.execute_wrappers:
+        connection.execute_wrappers.append(record_queries)
+
+
+@contextmanager
+def recording():
+    """
+    Record the queries run inside the block (on any connection) into the
+    yielded recorder. Blocks nest: an outer recorder sees the queries of
+    the inner ones too.
+    """
+    recorder = QueryRecorder()
+    token = _recorders.set(_recorders.get() + (recorder,))
+    try:
+        yield recorder
+    finally:
+        _recorders.reset(token)
+
+
+class ViewMetrics:
+    """
+    Per-view totals, rendered for Prometheus. With ``METRICS_DIR`` set, every
+    process also writes its totals to a file of its own there (at most once
+    per ``FLUSH_INTERVAL`` and at exit) and ``snapshot`` sums the files of
+    all processes, so whichever worker answers a scrape reports all of
+    them. Files of exited workers are kept, so the sums never go backwards.
+    """
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._views = {}
+        self._path = None
+        self._owner = None
+        self._flushed = 0.0
+
+    def observe(self, view, status, recorder, elapsed):
+        with self._lock:
+            stats = self._views.get(view)
+            if stats is None:
+                stats = self._views[view] = _empty_stats()
+            stats['requests'] += 1
+            stats['errors'] += status >= 500
+            stats['queries'] += recorder.count
+            stats['db_seconds'] += recorder.db_time
+            stats['seconds'] += elapsed
+            for index, bound in enumerate(BUCKETS):
+                if elapsed <= bound:
+                    stats['buckets'][index] += 1
+            if time.monotonic() - self._flushed >= FLUSH_INTERVAL:
+                self._write()
+
+    def _local(self):
+        return {view: {**stats, 'buckets': list(stats['buckets'])}
+                for view, stats in self._views.items()}
+
+    def _write(self):
+        directory = getattr(settings, 'METRICS_DIR', None)
+        if not directory:
+            return
+        pid = os.getpid()
+        if self._owner != (pid, directory):
+            # A pid can be reused by a later worker; never overwrite its file
+            self._owner = (pid, directory)
+            self._path = os.path.join(directory, f"{pid}-{uuid.uuid4().hex[:8]}.json")
+        # Throttled even when it fails, so a full disk isn't retried per request
+        self._flushed = time.monotonic()
+        try:
+            os.makedirs(directory, exist_ok=True)
+            temporary = f"{self._path}.tmp"
+            with open(temporary, 'w') as f:
+                json.dump(self._local(), f)
+            # Readers see the old file or the new one, never half of one
+            os.replace(temporary, self._path)
+        except (OSError, TypeError, ValueError):
+            # Metrics never fail the request they measure
+            logger.exception("Could not write view metrics to %s", self._path)
+
+    def flush(self):
+        with self._lock:
+            if self._views:
+                self._write()
+
+    def snapshot(self):
+        directory = getattr(settings, 'METRICS_DIR', None)
+        if not directory:
+            with self._lock:
+                return self._local()
+        self.flush()
+        totals = {}
+        for path in glob.glob(os.path.join(directory, '*.json')):
+            try:
+                with open(path) as f:
+                    views = json.load(f)
+            except (OSError, ValueError):
+                continue
+            for view, stats in views.items():
+                total = totals.setdefault(view, _empty_stats())
+                for key in ('requests', 'errors', 'queries', 'db_seconds', 'seconds'):
+                    total[key] += stats[key]
+                total['buckets'] = [a + b for a, b in zip(total['buckets'], stats['buckets'])]
+        return totals
+
+    def reset(self):
+        with self._lock:
+            self._views.clear()
+            self._flushed = 0.0
+
+
+def _empty_stats():
+    return {
+        'requests': 0, 'errors': 0, 'queries': 0, 'db_seconds': 0.0,
+        'seconds': 0.0, 'buckets': [0] * len(BUCKETS),
+    }
+
+
+view_metrics = ViewMetrics()
+# The requests since the last write would be lost otherwise
+atexit.register(view_metrics.flush)
+
+
+def _label(value):
+    return str(value).replace('\\', '\\\\').replace('"', '\\"').replace('\n', '\\n')
+
+
+def render_prometheus(cache_metrics=None):
+    """The per-view metrics, plus ``location.cache.metrics()`` counters, in the Prometheus text format."""
+    lines = []
+
+    def metric(name, kind, help_text, samples):
+        lines.append(f"# HELP {name} {help_text}")
+        lines.append(f"# TYPE {name} {kind}")
+        for labels, value in samples:
+            label_text = ','.join(f'{key}="{_label(v)}"' for key, v in labels)
+            lines.append(f"{name}{{{label_text}}} {value}" if labels else f"{name} {value}")
+
+    views = sorted(view_metrics.snapshot().items())
+    metric("location_http_requests_total", "counter", "Requests served.",
+           [((('view', view),), stats['requests']) for view, stats in views])
+    metric("location_http_errors_total", "counter", "Requests answered with a 5xx status.",
+           [((('view', view),), stats['errors']) for view, stats in views])
+    metric("location_http_db_queries_total", "counter", "SQL statements run while serving requests.",
+           [((('view', view),), stats['queries']) for view, stats in views])
+    metric("location_http_db_seconds_total", "counter", "Time spent in SQL statements.",
+           [((('view', view),), round(stats['db_seconds'], 6)) for view, stats in views])
+
+    lines.append("# HELP location_http_request_seconds Request duration.")
+    lines.append("# TYPE location_http_request_seconds histogram")
+    for view, stats in views:
+        label = _label(view)
+        for bound, count in zip(BUCKETS, stats['buckets']):
+            lines.append(f'location_http_request_seconds_bucket{{view="{label}",le="{bound}"}} {count}')
+        lines.append(f'location_http_request_seconds_bucket{{view="{label}",le="+Inf"}} {stats["requests"]}')
+        lines.append(f'location_http_request_seconds_sum{{view="{label}"}} {round(stats["seconds"], 6)}')
+        lines.append(f'location_http_request_seconds_count{{view="{label}"}} {stats["requests"]}')
+
+    if cache_metrics is not None:
+        for name in ('hits', 'misses', 'sets', 'evictions', 'invalidations'):
+            metric(f"location_cache_{name}_total", "counter", f"Cache {name} of this process.",
+                   [((('backend', cache_metrics['backend']),), cache_metrics[name])])
+    return '\n'.join(lines) + '\n'
+
+
+def _view_name(request):
+    match = getattr(request, 'resolver_match', None)
+    if match is None:
+        return 'unresolved'
+    return match.view_name or match.route
+
+
+class QueryInstrumentationMiddleware:
+    """
+    Record the query count, database time and duration of every request.
+    Adds ``X-DB-Queries``, ``X-DB-Time-Ms``, ``X-DB-Slowest-Ms`` and
+    ``X-Response-Time-Ms`` headers, feeds the ``/metrics`` endpoint, and
+    logs the slowest statements of requests running more than
+    ``QUERY_COUNT_WARNING`` queries.
+    """
+    sync_capable = True
+    async_capable = True
+
+    def __init__(self, get_response):
+        self.get_response = get_response
+        if iscoroutinefunction(get_response):
+            markcoroutinefunction(self)
+
+    def __call__(self, request):
+        if iscoroutinefunction(self):
+            return self.__acall__(request)
+        with recording() as recorder:
+            response = self.get_response(request)
+        return self.finish(request, response, recorder)
+
+    async def __acall__(self, request):
+        with recording() as recorder:
+            response = await self.get_response(request)
+        return self.finish(request, response, recorder)
+
+    def finish(self, request, response, recorder):
+        elapsed = recorder.elapsed
+        slowest = recorder.slowest
+        response['X-DB-Queries'] = str(recorder.count)
+        response['X-DB-Time-Ms'] = f"{recorder.db_time * 1000:.1f}"
+        response['X-DB-Slowest-Ms'] = f"{slowest[0][0] * 1000:.1f}" if slowest else "0.0"
+        response['X-Response-Time-Ms'] = f"{elapsed * 1000:.1f}"
+        view = _view_name(request)
+        view_metrics.observe(view, response.status_code, recorder, elapsed)
+
+        limit = getattr(settings, 'QUERY_COUNT_WARNING', 50)
+        if limit and recorder.count > limit:
+            logger.warning(
+                "%s %s (%s) ran %d queries in %.1f ms; slowest:\n%s",
+                request.method, request.path, view, recorder.count, recorder.db_time * 1000,
+                '\n'.join(f"  {duration * 1000:.1f} ms: {sql}" for duration, sql in slowest))
+        return response
+
+
+class QueryBudgetMixin:
+    """
+    ``TestCase`` mixin failing a test when a block runs more queries than
+    its budget, so N+1 regressions show up in CI:
+
+        with self.assertMaxQueries(8):
+            self.client.get(url)
+    """
+
+    @contextmanager
+    def assertMaxQueries(self, budget):
+        with recording() as recorder:
+            yield recorder
+        if recorder.count > budget:
+            statements = '\n'.join(f"  {sql}" for _duration, sql in recorder.slowest)
+            self.fail(f"{recorder.count} queries run, budget is {budget}; slowest:\n{statements}")
@@ -0,0 +1,340 @@
+import io
+import logging
+import multiprocessing
+import os
+import signal
+import socket
+import threading
+import time
+import traceback
+from datetime import timedelta
+
+from django.core.files.storage import default_storage
+from django.db import connection, connections, transaction
+from django.utils import timezone
+
+from .changes import prune_changes
+from .feeds import ingest_feed, read_feed_file
+from .images import pending_sources, process_images
+from .importers import bulk_import_locations
+from .listings import rebuild_listings
+from .partitions import restore_foreign_keys
+from .models import Job
+from .prices import seed_prices
+from .rollups import refresh_location_stats
+from .sitemap import update_shards, write_sitemap
+
+logger = logging.getLogger(__name__)
+
+# Seconds before retry n + 1 is RETRY_DELAY * 2 ** (n - 1)
+RETRY_DELAY = 30
+# A running job whose heartbeat is older than this lost its worker
+STALE_AFTER = timedelta(minutes=15)
+# Progress writes are throttled to one per this many seconds per job
+PROGRESS_INTERVAL = 1.0
+# Seconds between the heartbeats of a running job, well under STALE_AFTER
+HEARTBEAT_INTERVAL = 60.0
+
+HANDLERS = {}
+
+
+class JobError(Exception):
+    pass
+
+
+def job_handler(kind):
+    """
+    Register the decorated ``handler(payload, job)`` for jobs of ``kind``.
+    Its return value (JSON-serializable) becomes the job's result; raising
+    fails the attempt.
+    """
+    def decorator(func):
+        HANDLERS[kind] = func
+        return func
+    return decorator
+
+
+def enqueue(kind, payload=None, priority=0, max_attempts=3, run_after=None):
+    """Queue a job of ``kind``; higher ``priority`` runs first."""
+    if kind not in HANDLERS:
+        raise JobError(f"No handler for job kind {kind!r}")
+    return Job.objects.create(
+        kind=kind, payload=payload or {}, priority=priority, max_attempts=max_attempts,
+        run_after=run_after or timezone.now())
+
+
+def worker_name():
+    return f"{socket.gethostname()}:{os.getpid()}:{threading.get_ident()}"
+
+
+def claim_job(worker, kinds=None):
+    """
+    Lock and mark running the next due job, or return None. SKIP LOCKED
+    lets any number of workers poll the same queue without waiting on or
+    double-claiming each other's rows.
+    """
+    with transaction.atomic():
+        queryset = Job.objects.select_for_update(skip_locked=True).filter(
+            status=Job.QUEUED, run_after__lte=timezone.now())
+        if kinds:
+            queryset = queryset.filter(kind__in=kinds)
+        job = queryset.order_by('-priority', 'run_after', 'id').first()
+        if job is None:
+            return None
+        now = timezone.now()
+        job.status = Job.RUNNING
+        job.attempts += 1
+        job.locked_by = worker
+        job.heartbeat = job.started_at = now
+        job.progress_done, job.progress_total, job.message = 0, None, ''
+        job.save(update_fields=['status', 'attempts', 'locked_by', 'heartbeat', 'started_at',
+                                'progress_done', 'progress_total', 'message'])
+    return job
+
+
+class Progress:
+    """
+    Passed to handlers as ``job.progress``: ``job.progress(done, total,
+    message)`` records how far the job got and refreshes its heartbeat.
+    Writes go straight to the row, outside the handler's transaction, so
+    the admin sees them while the job runs.
+    """
+
+    def __init__(self, job):
+        self.job = job
+        self.values = {}
+        self._written = 0.0
+
+    def __call__(self, done, total=None, message=''):
+        self.values = {'progress_done': done, 'progress_total': total, 'message': message[:200]}
+        now = time.monotonic()
+        if now - self._written >= PROGRESS_INTERVAL:
+            self._written = now
+            Job.objects.filter(pk=self.job.pk, locked_by=self.job.locked_by).update(
+                heartbeat=timezone.now(), **self.values)
+
+
+class Heartbeat(threading.Thread):
+    """
+    Refreshes the heartbeat of a running job every ``interval`` seconds
+    until stopped, so a handler that spends longer than ``STALE_AFTER`` in
+    one step without reporting progress isn't requeued under it. Runs on a
+    connection of its own, outside the handler's transaction.
+    """
+
+    def __init__(self, job, interval=HEARTBEAT_INTERVAL):
+        super().__init__(name=f"job-{job.pk}-heartbeat", daemon=True)
+        self.job = job
+        self.interval = interval
+        self.stopped = threading.Event()
+
+    def run(self):
+        try:
+            while not self.stopped.wait(self.interval):
+                try:
+                    Job.objects.filter(pk=self.job.pk, locked_by=self.job.locked_by).update(
+                        heartbeat=timezone.now())
+                except Exception:
+                    logger.exception("Heartbeat of job %s failed", self.job.pk)
+        finally:
+            connection.close()
+
+    def stop(self):
+        self.stopped.set()
+        self.join()
+
+
+def run_job(job):
+    """
+    Run a claimed job and record its outcome, scheduling a retry on failure.
+    The outcome is only written while ``job`` still holds the row; a job
+    requeued and claimed again in the meantime belongs to the new worker.
+    """
+    handler = HANDLERS.get(job.kind)
+    job.progress = Progress(job)
+    heartbeat = Heartbeat(job)
+    heartbeat.start()
+    try:
+        try:
+            if handler is None:
+                raise JobError(f"No handler for job kind {job.kind!r}")
+            result = handler(job.payload, job)
+        finally:
+            heartbeat.stop()
+    except Exception as e:
+        logger.exception("Job %s failed (attempt %s of %s)", job.pk, job.attempts, job.max_attempts)
+        updates = {'error': f"{e}\n\n{traceback.format_exc()}", 'locked_by': '', 'heartbeat': None}
+        if job.attempts < job.max_attempts and handler is not None:
+            updates.update(status=Job.QUEUED, run_after=timezone.now() + timedelta(
+                seconds=RETRY_DELAY * 2 ** (job.attempts - 1)))
+        else:
+            updates.update(status=Job.FAILED, finished_at=timezone.now())
+        _finish(job, updates)
+        return False
+    # The last report may have been throttled
+    return _finish(job, dict(
+        status=Job.SUCCEEDED, result=result, error='', locked_by='', heartbeat=None,
+        finished_at=timezone.now(), **job.progress.values))
+
+
+def _finish(job, updates):
+    if Job.objects.filter(pk=job.pk, locked_by=job.locked_by).update(**updates):
+        return True
+    logger.warning("Job %s was taken over by another worker; outcome of attempt %s dropped",
+                   job.pk, job.attempts)
+    return False
+
+
+def requeue_stale(stale_after=STALE_AFTER):
+    """Put running jobs back in the queue whose worker stopped sending heartbeats."""
+    return Job.objects.filter(
+        status=Job.RUNNING, heartbeat__lt=timezone.now() - stale_after
+    ).update(status=Job.QUEUED, locked_by='', heartbeat=None, run_after=timezone.now())
+
+
+def work(kinds=None, poll_interval=1.0, once=False, stop=None):
+    """
+    Run jobs until ``stop`` (a ``threading.Event``) is set. With ``once``,
+    return as soon as the queue is empty. Returns the number of jobs run.
+    """
+    worker = worker_name()
+    count = 0
+    while stop is None or not stop.is_set():
+        job = claim_job(worker, kinds)
+        if job is None:
+            if once:
+                break
+            requeue_stale()
+            if stop is not None:
+                stop.wait(poll_interval)
+            else:
+                time.sleep(poll_interval)
+            continue
+        run_job(job)
+        count += 1
+    return count
+
+
+def stop_on_signals(stop):
+    """Set ``stop`` on SIGINT/SIGTERM so workers finish their current job and exit."""
+    for signum in (signal.SIGINT, signal.SIGTERM):
+        signal.signal(signum, lambda *args: stop.set())
+
+
+def _process_main(kwargs):
+    stop = threading.Event()
+    stop_on_signals(stop)
+    _worker_main({**kwargs, 'stop': stop})
+
+
+def _worker_main(kwargs):
+    try:
+        return work(**kwargs)
+    finally:
+        # Each worker thread or process opened its own connection
+        connection.close()
+
+
+def run_workers(concurrency, processes=False, stop=None, **kwargs):
+    """
+    Run ``concurrency`` workers in threads, or in processes for CPU-bound
+    handlers, and wait for them. Returns the number of jobs run (thread
+    workers only; processes report through the job rows).
+    """
+    if processes:
+        # Children must not share the parent's socket to the database
+        connections.close_all()
+        context = multiprocessing.get_context('fork')
+        children = [context.Process(target=_process_main, args=(kwargs,))
+                    for _ in range(concurrency)]
+        for child in children:
+            child.start()
+        for child in children:
+            child.join()
+        return None
+
+    counts = []
+    threads = [
+        threading.Thread(target=lambda: counts.append(_worker_main({**kwargs, 'stop': stop})),
+                         name=f"job-worker-{index}", daemon=True)
+        for index in range(concurrency)
+    ]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    return sum(counts)
+
+
+# Handlers. Uploads are saved to the default storage by the enqueuing side
+# and deleted once imported.
+
+@job_handler('import_locations')
+def import_locations_job(payload, job):
+    with default_storage.open(payload['path'], 'rb') as f:
+        result = bulk_import_locations(
+            io.TextIOWrapper(f, encoding='utf-8-sig', newline=''),
+            progress=lambda rows, elapsed: job.progress(rows, None, f"{rows} rows staged"))
+    default_storage.delete(payload['path'])
+    return result
+
+
+@job_handler('ingest_feed')
+def ingest_feed_job(payload, job):
+    path = payload['path']
+    fmt = payload.get('format') or ('csv' if path.lower().endswith('.csv') else 'jsonl')
+    with default_storage.open(path, 'rb') as f:
+        rows = read_feed_file(io.TextIOWrapper(f, encoding='utf-8-sig', newline=''), fmt)
+        result = ingest_feed(
+            payload['feed'], rows, prune=payload.get('prune', False), swap=payload.get('swap', False),
+            progress=lambda rows, elapsed: job.progress(rows, None, f"{rows} rows loaded"))
+    default_storage.delete(path)
+    return result
+
+
+@job_handler('restore_foreign_keys')
+def restore_foreign_keys_job(payload, job):
+    with transaction.atomic():
+        restore_foreign_keys(payload['feed'], payload['foreign_keys'])
+    return {'restored': [name for _table, name, _definition in payload['foreign_keys']]}
+
+
+@job_handler('refresh_location_stats')
+def refresh_location_stats_job(payload, job):
+    return {'refreshed': refresh_location_stats(full=payload.get('full', False))}
+
+
+@job_handler('rebuild_listings')
+def rebuild_listings_job(payload, job):
+    return rebuild_listings(payload.get('feed'))
+
+
+@job_handler('prune_changes')
+def prune_changes_job(payload, job):
+    return {'deleted': prune_changes(timezone.now() - timedelta(days=payload.get('days', 30)))}
+
+
+@job_handler('seed_prices')
+def seed_prices_job(payload, job):
+    return {'seeded': seed_prices(payload.get('feed'))}
+
+
+@job_handler('generate_sitemap')
+def generate_sitemap_job(payload, job):
+    if payload.get('incremental'):
+        return update_shards(payload.get('shard_dir', 'sitemap'), full=payload.get('full', False))
+    output = payload.get('output', 'sitemap.json')
+    with open(output, 'w', encoding='utf-8') as f:
+        return {'rows': write_sitemap(f), 'output': output}
+
+
+@job_handler('process_images')
+def process_images_job(payload, job, batch_size=100):
+    sources = payload.get('sources') or pending_sources(payload.get('feed'))
+    rendered = reused = 0
+    for start in range(0, len(sources), batch_size):
+        counts = process_images(sources[start:start + batch_size], workers=payload.get('workers', 4))
+        rendered += counts[0]
+        reused += counts[1]
+        job.progress(min(start + batch_size, len(sources)), len(sources))
+    return {'rendered': rendered, 'reused': reused}
@@ -0,0 +1,152 @@
+from django.db import connection, transaction
+
+from .partitions import ACCOMMODATION_TABLE, LOCALIZE_TABLE
+
+LISTING_TABLE = "location_accommodationlisting"
+
+# Upsert the listing of every accommodation matching {where}. The
+# breadcrumb follows the location's materialized path; the descriptions of
+# all languages are folded into one JSON object. Rows whose values did not
+# change are left alone.
+REFRESH_SQL = f"""
+    INSERT INTO {LISTING_TABLE} AS li (
+        accommodation_id, feed, title, country_code, country_name, bedroom_count,
+        review_score, usd_rate, center, location_id, location_title, path, breadcrumb,
+        amenities, primary_image, localized, user_id, published, created_at, updated_at,
+        refreshed_at
+    )
+    SELECT a.id, a.feed, a.title, a.country_code, crumbs.titles[1], a.bedroom_count,
+           a.review_score, a.usd_rate, a.center, a.location_id, l.title, l.path, crumbs.titles,
+           a.amenities, a.images[1],
+           COALESCE((
+               SELECT jsonb_object_agg(t.language, jsonb_build_object(
+                   'description', t.description, 'policy', t.policy))
+               FROM {LOCALIZE_TABLE} t
+               WHERE t.property_id = a.id AND t.feed = a.feed
+           ), jsonb_build_object()),
+           a.user_id, a.published, a.created_at, a.updated_at, NOW()
+    FROM {ACCOMMODATION_TABLE} a
+    JOIN location_location l ON l.id = a.location_id
+    CROSS JOIN LATERAL (
+        SELECT ARRAY(
+            SELECT p.title
+            FROM unnest(l.path) WITH ORDINALITY AS u(id, n)
+            JOIN location_location p ON p.id = u.id
+            ORDER BY u.n
+        ) AS titles
+    ) crumbs
+    WHERE {{where}}
+    ON CONFLICT (accommodation_id, feed) DO UPDATE SET
+        title = EXCLUDED.title,
+        country_code = EXCLUDED.country_code,
+        country_name = EXCLUDED.country_name,
+        bedroom_count = EXCLUDED.bedroom_count,
+        review_score = EXCLUDED.review_score,
+        usd_rate = EXCLUDED.usd_rate,
+        center = EXCLUDED.center,
+        location_id = EXCLUDED.location_id,
+        location_title = EXCLUDED.location_title,
+        path = EXCLUDED.path,
+        breadcrumb = EXCLUDED.breadcrumb,
+        amenities = EXCLUDED.amenities,
+        primary_image = EXCLUDED.primary_image,
+        localized = EXCLUDED.localized,
+        user_id = EXCLUDED.user_id,
+        published = EXCLUDED.published,
+        created_at = EXCLUDED.created_at,
+        updated_at = EXCLUDED.updated_at,
+        refreshed_at = EXCLUDED.refreshed_at
+    WHERE (li.title, li.country_code, li.country_name, li.bedroom_count, li.review_score,
+           li.usd_rate, li.center, li.location_id, li.location_title, li.path, li.breadcrumb,
+           li.amenities, li.primary_image, li.localized, li.user_id, li.published,
+           li.created_at, li.updated_at)
+          IS DISTINCT FROM
+          (EXCLUDED.title, EXCLUDED.country_code, EXCLUDED.country_name, EXCLUDED.bedroom_count,
+           EXCLUDED.review_score, EXCLUDED.usd_rate, EXCLUDED.center, EXCLUDED.location_id,
+           EXCLUDED.location_title, EXCLUDED.path, EXCLUDED.breadcrumb, EXCLUDED.amenities,
+           EXCLUDED.primary_image, EXCLUDED.localized, EXCLUDED.user_id, EXCLUDED.published,
+           EXCLUDED.created_at, EXCLUDED.updated_at)
+"""
+
+# Listings among {where} whose accommodation is gone
+DELETE_SQL = f"""
+    DELETE FROM {LISTING_TABLE} li
+    WHERE {{where}}
+      AND NOT EXISTS (
+          SELECT 1 FROM {ACCOMMODATION_TABLE} a
+          WHERE a.id = li.accommodation_id AND a.feed = li.feed
+      )
+"""
+
+KEYS_CONDITION = "({id}, {feed}) IN (SELECT * FROM unnest(%s::varchar[], %s::smallint[]))"
+
+
+def _refresh(where, params, delete_where=None, delete_params=()):
+    with transaction.atomic(), connection.cursor() as cursor:
+        cursor.execute(REFRESH_SQL.format(where=where), params)
+        written = cursor.rowcount
+        deleted = 0
+        if delete_where:
+            cursor.execute(DELETE_SQL.format(where=delete_where), delete_params)
+            deleted = cursor.rowcount
+    return {'written': written, 'deleted': deleted}
+
+
+def refresh_listings(keys):
+    """
+    Rewrite the listings of the accommodations ``keys`` (``(id, feed)``
+    pairs), dropping those whose accommodation no longer exists. Called by
+    the model signals.
+    """
+    keys = list(dict.fromkeys(key for key in keys if key[0] is not None))
+    if not keys:
+        return {'written': 0, 'deleted': 0}
+    ids, feeds = (list(values) for values in zip(*keys))
+    return _refresh(
+        KEYS_CONDITION.format(id='a.id', feed='a.feed'), [ids, feeds],
+        KEYS_CONDITION.format(id='li.accommodation_id', feed='li.feed'), [ids, feeds])
+
+
+def refresh_location_listings(location_ids):
+    """
+    Rewrite the listings of every accommodation at or below
+    ``location_ids``, whose breadcrumb or country name may have changed.
+    One GIN lookup on ``Location.path``.
+    """
+    location_ids = sorted({location_id for location_id in location_ids if location_id})
+    if not location_ids:
+        return {'written': 0, 'deleted': 0}
+    return _refresh("l.path && %s::varchar[]", [location_ids])
+
+
+def refresh_feed_listings(feed, since=None, prune=False):
+    """
+    Rewrite the listings of ``feed``, only those of accommodations updated
+    at or after ``since`` if given. With ``prune`` (or without ``since``),
+    listings of accommodations that left the feed are dropped too. Called
+    by the bulk feed loader.
+    """
+    where, params = "a.feed = %s", [feed]
+    if since is not None:
+        where += " AND a.updated_at >= %s"
+        params.append(since)
+    delete_where = "li.feed = %s" if prune or since is None else None
+    return _refresh(where, params, delete_where, [feed])
+
+
+def rebuild_listings(feed=None):
+    """Rewrite every listing (of ``feed``), e.g. after fixing data by hand."""
+    if feed is not None:
+        return refresh_feed_listings(feed)
+    return _refresh("TRUE", [], "TRUE")
+
+
+def database_now():
+    """
+    The database clock, to pass as ``since`` once a load is done. Inside a
+    transaction this is its start time, which rows written later in it
+    carry as well.
+    """
+    with connection.cursor() as cursor:
+        cursor.execute("SELECT NOW()")
+        return cursor.fetchone()[0]
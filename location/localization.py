@@ -0,0 +1,94 @@
+from django.conf import settings
+from django.db.models import BooleanField
+from django.db.models.expressions import RawSQL
+
+from .cache import cache_get_many, cache_set_many, model_version
+from .models import LocalizeAccommodation
+
+CACHE_TIMEOUT = 60 * 60
+
+# Matches the (property_id, feed) pairs of a whole page in one index scan of
+# the partition. The language is always compared with a constant, so the
+# planner prunes every other language partition.
+KEYS_CONDITION = "(property_id, feed) IN (SELECT * FROM unnest(%s::varchar[], %s::smallint[]))"
+
+# Cached for accommodations without any localization, which the cache
+# can't tell apart from a miss if stored as None
+MISSING = {}
+
+
+def default_language():
+    return getattr(settings, 'LOCALIZATION_DEFAULT_LANGUAGE', 'en')
+
+
+def fallback_chain(language):
+    """
+    Languages to try for ``language``, in order: itself, its configured
+    ``LOCALIZATION_FALLBACKS`` and finally the default language.
+    """
+    fallbacks = getattr(settings, 'LOCALIZATION_FALLBACKS', {}).get(language, ())
+    return list(dict.fromkeys([language, *fallbacks, default_language()]))
+
+
+def pick_localized(translations, language):
+    """
+    The entry of ``translations`` (``{language: {description, policy}}``,
+    as stored on ``AccommodationListing``) for ``language`` along
+    ``fallback_chain``, shaped like a ``localized_content`` payload, or None.
+    """
+    for fallback in fallback_chain(language):
+        if fallback in translations:
+            return {'language': fallback, **translations[fallback]}
+    return None
+
+
+def _cache_key(version, key, language):
+    property_id, feed = key
+    return f"location:localized:{version}:{feed}:{property_id}:{language}"
+
+
+def _fetch(keys, language):
+    # One query against one language partition for all of ``keys``
+    property_ids, feeds = zip(*keys)
+    condition = RawSQL(KEYS_CONDITION, [list(property_ids), list(feeds)], output_field=BooleanField())
+    rows = (LocalizeAccommodation.objects.filter(condition, language=language)
+            .values_list('property_id', 'feed', 'description', 'policy'))
+    return {
+        (property_id, feed): {'language': language, 'description': description, 'policy': policy}
+        for property_id, feed, description, policy in rows
+    }
+
+
+def localized_content(accommodations, language):
+    """
+    Description and policy of each of ``accommodations`` (instances or
+    ``(id, feed)`` pairs) in ``language``, falling back along
+    ``fallback_chain``. Returns ``{(id, feed): payload or None}``; the
+    payload names the language it was found in.
+
+    Cached per (property, feed, requested language); the misses of a page
+    cost one query per language of the chain at most.
+    """
+    keys = list(dict.fromkeys(
+        key if isinstance(key, tuple) else (key.id, key.feed) for key in accommodations))
+    if not keys:
+        return {}
+    version = model_version(LocalizeAccommodation)
+    cache_keys = {key: _cache_key(version, key, language) for key in keys}
+    cached = cache_get_many(list(cache_keys.values()))
+    content = {key: cached[cache_keys[key]] for key in keys if cache_keys[key] in cached}
+
+    missing = [key for key in keys if key not in content]
+    found = {}
+    for fallback in fallback_chain(language):
+        if not missing:
+            break
+        found.update(_fetch(missing, fallback))
+        missing = [key for key in missing if key not in found]
+    if found or missing:
+        cache_set_many({
+            cache_keys[key]: found.get(key, MISSING)
+            for key in keys if key not in content
+        }, CACHE_TIMEOUT)
+        content.update(found)
+    return {key: content.get(key) or None for key in keys}
@@ -0,0 +1,25 @@
+from django.core.management.base import BaseCommand, CommandError
+from location.benchmarks import geo_benchmarks
+from location.models import Accommodation, Location
+
+class Command(BaseCommand):
+    help = "Time radius and bounding-box searches against the current data and report p50/p99 latency."
+
+    def add_arguments(self, parser):
+        parser.add_argument("--model", choices=("accommodation", "location"), default="accommodation")
+        parser.add_argument("--queries", type=int, default=200, help="Queries per search type (default: 200).")
+        parser.add_argument("--km", type=float, default=10, help="Search radius in km (default: 10).")
+        parser.add_argument("--limit", type=int, default=50, help="Rows fetched per query (default: 50).")
+        parser.add_argument("--seed", type=int, default=0, help="Random seed for query points.")
+
+    def handle(self, *args, **options):
+        model = Accommodation if options["model"] == "accommodation" else Location
+        table = model._meta.db_table
+        results = geo_benchmarks(model, queries=options["queries"], km=options["km"],
+                                 limit=options["limit"], seed=options["seed"])
+        if results is None:
+            raise CommandError(f"{table} is empty; load data first.")
+
+        self.stdout.write(f"{table}: {options['queries']} queries per search")
+        for label, stats in results.items():
+            self.stdout.write(f"{label}: p50 {stats['p50_ms']:.2f} ms, p99 {stats['p99_ms']:.2f} ms")
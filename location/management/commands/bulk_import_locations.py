@@ -0,0 +1,30 @@
+from django.core.management.base import BaseCommand, CommandError
+from location.importers import LocationImportError, bulk_import_locations
+
+class Command(BaseCommand):
+    help = "Bulk import locations from a CSV file using COPY and a single upsert."
+
+    def add_arguments(self, parser):
+        parser.add_argument("csv_file", help="Path of the CSV file to import.")
+        parser.add_argument(
+            "--chunk-size", type=int, default=50000,
+            help="Number of CSV rows copied to the staging table at a time (default: 50000).",
+        )
+
+    def handle(self, *args, **options):
+        def progress(rows, elapsed):
+            rate = rows / elapsed if elapsed else 0
+            self.stdout.write(f"Staged {rows} rows ({rate:.0f} rows/s)")
+
+        try:
+            with open(options["csv_file"], newline="", encoding="utf-8-sig") as f:
+                result = bulk_import_locations(f, options["chunk_size"], progress)
+        except (OSError, LocationImportError) as e:
+            raise CommandError(str(e))
+
+        rate = result["rows"] / result["elapsed"] if result["elapsed"] else 0
+        self.stdout.write(self.style.SUCCESS(
+            f"Imported {result['rows']} locations in {result['elapsed']:.2f}s ({rate:.0f} rows/s): "
+            f"{result['inserted']} inserted, {result['updated']} updated, "
+            f"{result['unchanged']} unchanged."
+        ))
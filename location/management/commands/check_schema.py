@@ -0,0 +1,33 @@
+from django.core.management.base import BaseCommand, CommandError
+from location.partitions import PartitionError
+from location.schema import check_column_types, check_indexes, check_query_plans
+
+class Command(BaseCommand):
+    help = ("Check that the partitioned tables match the models, have their indexes, "
+            "and that the common joins use index scans and partition pruning.")
+
+    def add_arguments(self, parser):
+        parser.add_argument("--feed", type=int, default=0, help="Feed used for the EXPLAIN checks.")
+        parser.add_argument("--language", default="en", help="Language used for the EXPLAIN checks.")
+
+    def handle(self, *args, **options):
+        failures = 0
+        for title, problems in [("Column types", check_column_types()), ("Indexes", check_indexes())]:
+            failures += self.report(title, problems)
+        try:
+            plans = check_query_plans(feed=options["feed"], language=options["language"])
+        except PartitionError as e:
+            raise CommandError(str(e))
+        for description, problems in plans:
+            failures += self.report(f"Plan: {description}", problems)
+
+        if failures:
+            raise CommandError(f"{failures} schema problems found")
+        self.stdout.write(self.style.SUCCESS("Schema OK"))
+
+    def report(self, title, problems):
+        if not problems:
+            self.stdout.write(f"{title}: OK")
+        for problem in problems:
+            self.stdout.write(self.style.ERROR(f"{title}: {problem}"))
+        return len(problems)
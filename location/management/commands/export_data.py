@@ -0,0 +1,52 @@
+import gzip
+from django.core.management.base import BaseCommand, CommandError
+from django.db import DatabaseError
+from location.exports import EXPORTS, FORMATS, ExportError, copy_csv, export_chunks
+
+class Command(BaseCommand):
+    help = "Stream locations or accommodations to a CSV, JSONL or GeoJSON file in constant memory."
+
+    def add_arguments(self, parser):
+        parser.add_argument("name", choices=sorted(EXPORTS), help="What to export.")
+        parser.add_argument("path", help="File to write, or '-' for stdout. A .gz suffix compresses it.")
+        parser.add_argument(
+            "--format", choices=FORMATS,
+            help="Output format (default: guessed from the file extension, jsonl for stdout).",
+        )
+        parser.add_argument("--feed", type=int, help="Only accommodations of this feed.")
+        parser.add_argument("--country", help="Only rows with this country code.")
+        parser.add_argument(
+            "--gzip", action="store_true",
+            help="Compress the output (implied by a .gz suffix).",
+        )
+
+    def handle(self, *args, **options):
+        path = options["path"]
+        compress = options["gzip"] or path.endswith(".gz")
+        fmt = options["format"]
+        if fmt is None:
+            extension = path[:-3] if path.endswith(".gz") else path
+            fmt = next((f for f in FORMATS if extension.lower().endswith(f".{f}")), "jsonl")
+        filters = {"feed": options["feed"], "country_code": options["country"]}
+
+        try:
+            if path == "-":
+                if compress:
+                    raise CommandError("Refusing to write gzip to stdout; give a file path.")
+                for chunk in export_chunks(options["name"], fmt, **filters):
+                    self.stdout.write(chunk, ending="")
+                return
+            if compress:
+                fp = gzip.open(path, "wt", encoding="utf-8", newline="")
+            else:
+                fp = open(path, "w", encoding="utf-8", newline="")
+            with fp:
+                if fmt == "csv":
+                    copy_csv(fp, options["name"], **filters)
+                else:
+                    for chunk in export_chunks(options["name"], fmt, **filters):
+                        fp.write(chunk)
+        except (OSError, ExportError, DatabaseError) as e:
+            raise CommandError(str(e))
+
+        self.stdout.write(self.style.SUCCESS(f"Exported {options['name']} to {path}"))
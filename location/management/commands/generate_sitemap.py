@@ -1,33 +1,66 @@
-import json
+import resource
+import time
 from django.core.management.base import BaseCommand
-from location.models import Location
+from location.jobs import enqueue
+from location.sitemap import update_shards, write_sitemap
 
 class Command(BaseCommand):
-    help = "Generate a sitemap.json file for all country locations"
+    help = "Generate a sitemap.json file for all countries, states and cities"
 
-    def handle(self, *args, **kwargs):
-        # Fetch all country locations
-        countries = Location.objects.filter(location_type="country").order_by("title")
+    def add_arguments(self, parser):
+        parser.add_argument(
+            "--output", default="sitemap.json",
+            help="Path of the sitemap file to write (default: sitemap.json).",
+        )
+        parser.add_argument(
+            "--incremental", action="store_true",
+            help="Only rebuild the per-country shards whose locations changed "
+                 "since the last run, plus the shard index.",
+        )
+        parser.add_argument(
+            "--shard-dir", default="sitemap",
+            help="Directory holding the shards and index.json for --incremental "
+                 "(default: sitemap).",
+        )
+        parser.add_argument(
+            "--full", action="store_true",
+            help="With --incremental, rebuild every shard, changed or not.",
+        )
+        parser.add_argument(
+            "--background", action="store_true",
+            help="Queue the build for the run_jobs worker instead of running it here.",
+        )
 
-        sitemap = []
-        for country in countries:
-            # Create entry for each country
-            country_data = {
-                country.title: country.country_code.lower(),
-                "locations": [],
-            }
-            
-            # Fetch states and cities under each country
-            states = Location.objects.filter(parent_id=country).order_by("title")
-            for state in states:
-                state_slug = f"{country.country_code.lower()}/{state.title.lower().replace(' ', '-')}"
-                state_data = {state.title: state_slug}
-                country_data["locations"].append(state_data)
-            
-            sitemap.append(country_data)
+    def handle(self, *args, **options):
+        if options["background"]:
+            job = enqueue("generate_sitemap", {
+                key: options[key] for key in ("output", "incremental", "shard_dir", "full")})
+            self.stdout.write(self.style.SUCCESS(f"Queued as job #{job.pk}"))
+            return
 
-        # Write the sitemap to a JSON file
-        with open("sitemap.json", "w", encoding="utf-8") as f:
-            json.dump(sitemap, f, indent=4)
-        
-        self.stdout.write(self.style.SUCCESS("sitemap.json generated successfully!"))
+        started = time.perf_counter()
+
+        if options["incremental"]:
+            summary = update_shards(options["shard_dir"], full=options["full"])
+            rows = summary["rows"]
+            message = (
+                f"Rebuilt {summary['rebuilt']} of {summary['countries']} country shards "
+                f"({summary['removed']} removed, {summary['bytes'] / 1024:.1f} kB written) "
+                f"in {options['shard_dir']}"
+            )
+        else:
+            # Stream the whole hierarchy to the file in a single query
+            with open(options["output"], "w", encoding="utf-8") as f:
+                rows = write_sitemap(f)
+            message = f"{options['output']} generated successfully!"
+
+        elapsed = time.perf_counter() - started
+        rate = rows / elapsed if elapsed else 0
+        # ru_maxrss is reported in kilobytes on Linux
+        peak_mb = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024
+
+        self.stdout.write(
+            f"{rows} locations in {elapsed:.2f}s ({rate:.0f} rows/s), "
+            f"peak memory {peak_mb:.1f} MB"
+        )
+        self.stdout.write(self.style.SUCCESS(message))
@@ -0,0 +1,58 @@
+from django.core.management.base import BaseCommand, CommandError
+from django.db import DatabaseError
+from location import benchmarks
+from location.feeds import FeedIngestError
+from location.importers import LocationImportError
+from location.partitions import LANGUAGE_RE
+
+class Command(BaseCommand):
+    help = ("Load a reproducible synthetic data set (countries, states, cities, accommodations "
+            "across feeds and localizations across languages) for benchmarking.")
+
+    def add_arguments(self, parser):
+        parser.add_argument("--countries", type=int, default=20, help="Countries (default: 20).")
+        parser.add_argument("--states", type=int, default=10, help="States per country (default: 10).")
+        parser.add_argument("--cities", type=int, default=20, help="Cities per state (default: 20).")
+        parser.add_argument(
+            "--accommodations", type=int, default=100000,
+            help="Accommodations in total, split evenly over the feeds (default: 100000).",
+        )
+        parser.add_argument("--feeds", type=int, default=1, help="Feeds 0 .. N-1 to spread them over (default: 1).")
+        parser.add_argument(
+            "--languages", default="en,fr,de",
+            help="Comma separated languages of the localizations (default: en,fr,de).",
+        )
+        parser.add_argument(
+            "--localized", type=float, default=0.5,
+            help="Share of accommodations with a description per language (default: 0.5).",
+        )
+        parser.add_argument("--seed", type=int, default=0, help="Random seed; the same seed gives the same data.")
+        parser.add_argument(
+            "--clear", action="store_true",
+            help="Delete previously generated rows first (real data is left alone).",
+        )
+
+    def handle(self, *args, **options):
+        self.generate(options)
+        self.stdout.write(self.style.SUCCESS("Synthetic data loaded"))
+
+    def generate(self, options):
+        languages = [language.strip() for language in options["languages"].split(",") if language.strip()]
+        invalid = [language for language in languages if not LANGUAGE_RE.match(language)]
+        if invalid:
+            raise CommandError(f"Invalid language codes: {', '.join(invalid)}")
+        if options["countries"] > 26 * 26 or options["feeds"] < 1 or not 0 <= options["localized"] <= 1:
+            raise CommandError("Expected at most 676 countries, at least one feed and --localized in 0..1")
+
+        try:
+            if options["clear"]:
+                benchmarks.clear()
+                self.stdout.write("Cleared generated data")
+            return benchmarks.generate(
+                countries=options["countries"], states=options["states"], cities=options["cities"],
+                accommodations=options["accommodations"], feeds=options["feeds"],
+                languages=languages, localized=options["localized"], seed=options["seed"],
+                progress=self.stdout.write,
+            )
+        except (FeedIngestError, LocationImportError, DatabaseError) as e:
+            raise CommandError(str(e))
@@ -0,0 +1,66 @@
+import sys
+from django.core.management.base import BaseCommand, CommandError
+from django.db import DatabaseError
+from location.feeds import FeedIngestError, ingest_feed, read_feed_file
+from location.partitions import PartitionError
+
+class Command(BaseCommand):
+    help = "Bulk load an accommodation feed (JSONL or CSV) into its feed partition."
+
+    def add_arguments(self, parser):
+        parser.add_argument("feed", type=int, help="Feed id; rows go to location_accommodation_feed_<feed>.")
+        parser.add_argument("path", help="Feed file to load, or '-' to read from stdin.")
+        parser.add_argument(
+            "--format", choices=("jsonl", "csv"),
+            help="Feed format (default: guessed from the file extension, jsonl for stdin).",
+        )
+        parser.add_argument(
+            "--batch-size", type=int, default=10000,
+            help="Rows per COPY/upsert batch (default: 10000).",
+        )
+        parser.add_argument(
+            "--prune", action="store_true",
+            help="Delete accommodations of the feed that are not in the file (full refresh).",
+        )
+        parser.add_argument(
+            "--swap", action="store_true",
+            help="Full refresh: load the file into a shadow table and swap it in for the "
+                 "live partition with DETACH/ATTACH PARTITION once loaded.",
+        )
+
+    def handle(self, *args, **options):
+        if options["prune"] and options["swap"]:
+            raise CommandError("--swap already replaces the whole feed; drop --prune.")
+
+        fmt = options["format"]
+        if fmt is None:
+            fmt = "csv" if options["path"].lower().endswith(".csv") else "jsonl"
+
+        def progress(rows, elapsed):
+            rate = rows / elapsed if elapsed else 0
+            self.stdout.write(f"Loaded {rows} rows ({rate:.0f} rows/s)")
+
+        try:
+            if options["path"] == "-":
+                result = self._ingest(options, read_feed_file(sys.stdin, fmt), progress)
+            else:
+                with open(options["path"], newline="", encoding="utf-8-sig") as f:
+                    result = self._ingest(options, read_feed_file(f, fmt), progress)
+        except (OSError, FeedIngestError, PartitionError, DatabaseError) as e:
+            raise CommandError(str(e))
+
+        rate = result["rows"] / result["elapsed"] if result["elapsed"] else 0
+        self.stdout.write(self.style.SUCCESS(
+            f"Feed {options['feed']}: {result['rows']} rows in {result['elapsed']:.2f}s "
+            f"({rate:.0f} rows/s): {result['inserted']} inserted, {result['updated']} updated, "
+            f"{result['unchanged']} unchanged, {result['deleted']} deleted."
+        ))
+
+    def _ingest(self, options, rows, progress):
+        return ingest_feed(
+            options["feed"], rows,
+            batch_size=options["batch_size"],
+            prune=options["prune"],
+            swap=options["swap"],
+            progress=progress,
+        )
@@ -0,0 +1,72 @@
+import json
+import statistics
+import time
+from concurrent.futures import ThreadPoolExecutor
+from urllib.request import urlopen
+from django.core.management.base import BaseCommand, CommandError
+
+class Command(BaseCommand):
+    help = ("Fire concurrent GET requests at one or more running servers and compare throughput "
+            "and latency, e.g. the WSGI and ASGI deployments of the read endpoints.")
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            "--url", action="append", required=True, metavar="LABEL=URL",
+            help="Target to load, e.g. wsgi=http://localhost:8000/api/accommodations/ (repeatable).",
+        )
+        parser.add_argument("--concurrency", type=int, default=50, help="Requests in flight (default: 50).")
+        parser.add_argument("--requests", type=int, default=1000, help="Requests per target (default: 1000).")
+        parser.add_argument("--timeout", type=float, default=30, help="Per-request timeout in seconds.")
+        parser.add_argument("--output", help="Also write the results to this JSON file.")
+
+    def handle(self, *args, **options):
+        if options["requests"] < 1 or options["concurrency"] < 1:
+            raise CommandError("--requests and --concurrency must be at least 1")
+        targets = []
+        for value in options["url"]:
+            label, sep, url = value.partition("=")
+            if not sep or not url:
+                raise CommandError(f"Expected LABEL=URL, got {value!r}")
+            targets.append((label, url))
+
+        results = [self.run(label, url, options) for label, url in targets]
+        for result in results:
+            self.stdout.write(
+                f"{result['label']}: {result['requests_per_second']:.1f} req/s, "
+                f"p50 {result['p50_ms']:.1f} ms, p99 {result['p99_ms']:.1f} ms, "
+                f"{result['errors']} errors"
+            )
+        if options["output"]:
+            with open(options["output"], "w") as f:
+                json.dump(results, f, indent=2)
+
+    def run(self, label, url, options):
+        timeout = options["timeout"]
+
+        def fetch(_):
+            started = time.perf_counter()
+            try:
+                with urlopen(url, timeout=timeout) as response:
+                    response.read()
+                    ok = response.status < 400
+            except OSError:  # HTTP errors, refused connections and timeouts
+                ok = False
+            return ok, (time.perf_counter() - started) * 1000
+
+        started = time.perf_counter()
+        with ThreadPoolExecutor(max_workers=options["concurrency"]) as pool:
+            outcomes = list(pool.map(fetch, range(options["requests"])))
+        elapsed = time.perf_counter() - started
+
+        timings = sorted(ms for _ok, ms in outcomes)
+        return {
+            'label': label,
+            'url': url,
+            'concurrency': options["concurrency"],
+            'requests': len(outcomes),
+            'errors': sum(1 for ok, _ms in outcomes if not ok),
+            'elapsed_s': round(elapsed, 3),
+            'requests_per_second': len(outcomes) / elapsed if elapsed else 0,
+            'p50_ms': statistics.median(timings),
+            'p99_ms': timings[min(len(timings) - 1, int(len(timings) * 0.99))],
+        }
@@ -0,0 +1,53 @@
+from django.core.management.base import BaseCommand, CommandError
+from django.utils import timezone
+from location.partitions import (
+    ACCOMMODATION_TABLE, LOCALIZE_TABLE, PRICE_TABLE, PartitionError,
+    ensure_feed_partition, ensure_language_partition, ensure_month_partitions, list_partitions,
+)
+
+class Command(BaseCommand):
+    help = ("Create accommodation feed and localization language partitions on demand, "
+            "and the monthly price history partitions ahead of time.")
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            "--feed", type=int, action="append", default=[],
+            help="Feed id to create a location_accommodation partition for (repeatable).",
+        )
+        parser.add_argument(
+            "--language", action="append", default=[],
+            help="Two-letter language code to create a location_localizeaccommodation "
+                 "partition for (repeatable).",
+        )
+        parser.add_argument(
+            "--months", type=int, default=0,
+            help="Create location_pricehistory partitions for this month and the following "
+                 "ones, this many in all. Run monthly.",
+        )
+        parser.add_argument(
+            "--list", action="store_true",
+            help="List existing partitions.",
+        )
+
+    def handle(self, *args, **options):
+        try:
+            for feed in options["feed"]:
+                self._report(f"feed {feed}", ensure_feed_partition(feed))
+            for language in options["language"]:
+                self._report(f"language '{language}'", ensure_language_partition(language))
+            for month in ensure_month_partitions(timezone.now(), options["months"]):
+                self._report(f"month {month:%Y-%m}", True)
+        except PartitionError as e:
+            raise CommandError(str(e))
+
+        if options["list"]:
+            for parent in (ACCOMMODATION_TABLE, LOCALIZE_TABLE, PRICE_TABLE):
+                self.stdout.write(f"{parent}:")
+                for name, bound in list_partitions(parent):
+                    self.stdout.write(f"  {name} {bound}")
+
+    def _report(self, label, created):
+        if created:
+            self.stdout.write(self.style.SUCCESS(f"Created partition for {label}"))
+        else:
+            self.stdout.write(f"Partition for {label} already exists")
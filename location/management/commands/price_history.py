@@ -0,0 +1,52 @@
+from datetime import timedelta
+from django.core.management.base import BaseCommand, CommandError
+from django.utils import timezone
+from location.jobs import enqueue
+from location.partitions import next_month
+from location.prices import monthly_prices, price_history, seed_prices
+
+class Command(BaseCommand):
+    help = ("Seed the price history with the current rates, or print the rate changes of an "
+            "accommodation or the monthly averages of a location.")
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            "--seed", action="store_true",
+            help="Write the current rate of every accommodation without history. Run once after migrating.",
+        )
+        parser.add_argument("--feed", type=int, help="Feed of --property, or the only feed to --seed.")
+        parser.add_argument("--property", help="Print the changes of this accommodation.")
+        parser.add_argument("--location", help="Print monthly rates at or below this location.")
+        parser.add_argument("--months", type=int, default=12, help="Months to print, up to this one.")
+        parser.add_argument(
+            "--background", action="store_true",
+            help="Queue --seed for the run_jobs worker instead of running it here.",
+        )
+
+    def handle(self, *args, **options):
+        if not (options["seed"] or options["property"] or options["location"]):
+            raise CommandError("Pass --seed, --property or --location.")
+        if options["seed"]:
+            if options["background"]:
+                job = enqueue("seed_prices", {"feed": options["feed"]})
+                self.stdout.write(self.style.SUCCESS(f"Queued as job #{job.pk}"))
+            else:
+                seeded = seed_prices(options["feed"])
+                self.stdout.write(self.style.SUCCESS(f"Seeded the history of {seeded} accommodations"))
+
+        # The last --months months, this one included
+        end = timezone.now().date().replace(day=1)
+        start = end
+        for _ in range(options["months"] - 1):
+            start = (start - timedelta(days=1)).replace(day=1)
+
+        if options["property"]:
+            for row in price_history(options["property"], options["feed"] or 0, start, next_month(end)):
+                rate = "deleted" if row["usd_rate"] is None else row["usd_rate"]
+                status = "published" if row["published"] else "unpublished"
+                self.stdout.write(f"{row['at']:%Y-%m-%d %H:%M}  {rate}  {status}  {row['location_id']}")
+        if options["location"]:
+            for row in monthly_prices(options["location"], start, end):
+                self.stdout.write(
+                    f"{row['month']:%Y-%m}  avg {row['avg_usd_rate']}  min {row['min_usd_rate']}  "
+                    f"max {row['max_usd_rate']}  ({row['accommodations']} accommodations)")
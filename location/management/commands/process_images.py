@@ -0,0 +1,31 @@
+from django.core.management.base import BaseCommand
+from location.images import pending_sources, process_images
+
+class Command(BaseCommand):
+    help = "Render the configured sizes of accommodation images that have none yet."
+
+    def add_arguments(self, parser):
+        parser.add_argument("sources", nargs="*", help="Image names to (re)render (default: every pending image).")
+        parser.add_argument("--feed", type=int, help="Only images of accommodations in this feed.")
+        parser.add_argument(
+            "--workers", type=int, default=4,
+            help="Threads resizing images in parallel (default: 4).",
+        )
+        parser.add_argument(
+            "--batch-size", type=int, default=100,
+            help="Images read into memory and written per batch (default: 100).",
+        )
+        parser.add_argument("--force", action="store_true", help="Render again even if unchanged.")
+
+    def handle(self, *args, **options):
+        sources = options["sources"] or pending_sources(options["feed"])
+        batch_size = options["batch_size"]
+        rendered = reused = 0
+        for start in range(0, len(sources), batch_size):
+            counts = process_images(
+                sources[start:start + batch_size], workers=options["workers"], force=options["force"])
+            rendered += counts[0]
+            reused += counts[1]
+            self.stdout.write(f"Processed {min(start + batch_size, len(sources))} of {len(sources)} images")
+        self.stdout.write(self.style.SUCCESS(
+            f"{rendered} images rendered, {reused} reused renditions of identical images."))
@@ -0,0 +1,25 @@
+from django.core.management import call_command
+from django.core.management.base import BaseCommand
+from location.instrumentation import recording
+
+class Command(BaseCommand):
+    help = "Run another management command and report its query count, database time and slowest statements."
+
+    def add_arguments(self, parser):
+        parser.add_argument("command", help="Command to run, e.g. generate_sitemap.")
+        parser.add_argument("args", nargs="*", help="Its arguments; put them after --.")
+        parser.add_argument(
+            "--slowest", type=int, default=5,
+            help="Slowest statements to show (default: 5, at most 5).",
+        )
+
+    def handle(self, *args, **options):
+        with recording() as recorder:
+            call_command(options["command"], *args, stdout=self.stdout, stderr=self.stderr)
+
+        self.stdout.write(self.style.SUCCESS(
+            f"{options['command']}: {recorder.count} queries, "
+            f"{recorder.db_time * 1000:.1f} ms in the database, {recorder.elapsed * 1000:.1f} ms total"
+        ))
+        for duration, sql in recorder.slowest[:options["slowest"]]:
+            self.stdout.write(f"  {duration * 1000:8.1f} ms  {' '.join(sql.split())[:200]}")
@@ -0,0 +1,24 @@
+from datetime import timedelta
+from django.core.management.base import BaseCommand
+from django.utils import timezone
+from location.changes import prune_changes
+from location.jobs import enqueue
+
+class Command(BaseCommand):
+    help = "Delete change records older than the retention period, once every consumer has read them."
+
+    def add_arguments(self, parser):
+        parser.add_argument("--days", type=int, default=30, help="Keep this many days of changes.")
+        parser.add_argument(
+            "--background", action="store_true",
+            help="Queue the prune for the run_jobs worker instead of running it here.",
+        )
+
+    def handle(self, *args, **options):
+        if options["background"]:
+            job = enqueue("prune_changes", {"days": options["days"]})
+            self.stdout.write(self.style.SUCCESS(f"Queued as job #{job.pk}"))
+            return
+
+        deleted = prune_changes(timezone.now() - timedelta(days=options["days"]))
+        self.stdout.write(self.style.SUCCESS(f"Deleted {deleted} change records"))
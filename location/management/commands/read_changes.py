@@ -0,0 +1,55 @@
+import json
+import time
+from django.core.management.base import BaseCommand, CommandError
+from location.changes import MODELS, START, ChangeFeedError, compact, latest_cursor, read_changes
+
+class Command(BaseCommand):
+    help = ("Print accommodation, localization and location changes after a cursor as JSON lines, "
+            "in commit order. The cursor to resume from is reported on stderr.")
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            "--cursor", default=START,
+            help="Cursor printed by the previous run, or 'latest' to skip the history.",
+        )
+        parser.add_argument("--batch-size", type=int, default=500, help="Changes read per query.")
+        parser.add_argument(
+            "--model", action="append", choices=MODELS,
+            help="Only changes of this model; repeat for several.",
+        )
+        parser.add_argument(
+            "--compact", action="store_true",
+            help="Only the last change of each object within a batch.",
+        )
+        parser.add_argument(
+            "--follow", action="store_true",
+            help="Keep polling for new changes until interrupted.",
+        )
+        parser.add_argument(
+            "--poll-interval", type=float, default=1.0,
+            help="Seconds to wait between polls once caught up (with --follow).",
+        )
+
+    def handle(self, *args, **options):
+        cursor = latest_cursor() if options["cursor"] == "latest" else options["cursor"]
+        batch_size = options["batch_size"]
+        count = 0
+        try:
+            while True:
+                changes, cursor = read_changes(cursor, batch_size, options["model"])
+                caught_up = len(changes) < batch_size
+                if options["compact"]:
+                    changes = compact(changes)
+                for change in changes:
+                    self.stdout.write(json.dumps(change))
+                count += len(changes)
+                if caught_up:
+                    if not options["follow"]:
+                        break
+                    self.stdout.flush()
+                    time.sleep(options["poll_interval"])
+        except ChangeFeedError as e:
+            raise CommandError(str(e))
+        except KeyboardInterrupt:
+            pass
+        self.stderr.write(f"{count} changes; resume with --cursor {cursor}")
@@ -0,0 +1,28 @@
+import time
+from django.core.management.base import BaseCommand
+from location.jobs import enqueue
+from location.listings import rebuild_listings
+
+class Command(BaseCommand):
+    help = ("Rewrite the denormalized accommodation listings the list endpoints read from. "
+            "Run once after migrating; signals and the bulk loaders keep them current afterwards.")
+
+    def add_arguments(self, parser):
+        parser.add_argument("--feed", type=int, help="Only the listings of this feed.")
+        parser.add_argument(
+            "--background", action="store_true",
+            help="Queue the rebuild for the run_jobs worker instead of running it here.",
+        )
+
+    def handle(self, *args, **options):
+        if options["background"]:
+            job = enqueue("rebuild_listings", {"feed": options["feed"]})
+            self.stdout.write(self.style.SUCCESS(f"Queued as job #{job.pk}"))
+            return
+
+        started = time.perf_counter()
+        result = rebuild_listings(options["feed"])
+        self.stdout.write(self.style.SUCCESS(
+            f"Rewrote {result['written']} listings, removed {result['deleted']} "
+            f"in {time.perf_counter() - started:.2f}s"
+        ))
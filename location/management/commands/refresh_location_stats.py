@@ -0,0 +1,29 @@
+import time
+from django.core.management.base import BaseCommand
+from location.jobs import enqueue
+from location.rollups import refresh_location_stats
+
+class Command(BaseCommand):
+    help = "Refresh the per-location accommodation rollups for locations with pending changes."
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            "--full", action="store_true",
+            help="Recompute every location instead of only the queued ones.",
+        )
+        parser.add_argument(
+            "--background", action="store_true",
+            help="Queue the refresh for the run_jobs worker instead of running it here.",
+        )
+
+    def handle(self, *args, **options):
+        if options["background"]:
+            job = enqueue("refresh_location_stats", {"full": options["full"]})
+            self.stdout.write(self.style.SUCCESS(f"Queued as job #{job.pk}"))
+            return
+
+        started = time.perf_counter()
+        refreshed = refresh_location_stats(full=options["full"])
+        self.stdout.write(self.style.SUCCESS(
+            f"Refreshed stats for {refreshed} locations in {time.perf_counter() - started:.2f}s"
+        ))
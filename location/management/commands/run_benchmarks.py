@@ -0,0 +1,74 @@
+import json
+from django.core.management.base import CommandError
+from location.benchmarks import BENCHMARKS, compare, environment, run_benchmarks, summarize
+from location.management.commands.generate_synthetic_data import Command as GenerateCommand
+
+class Command(GenerateCommand):
+    help = ("Time imports, sitemap generation, the admin changelist, search and geo queries "
+            "and write the results as JSON to diff between commits.")
+
+    def add_arguments(self, parser):
+        # The generate_synthetic_data options size the data set of --generate
+        super().add_arguments(parser)
+        parser.add_argument(
+            "--generate", action="store_true",
+            help="Load synthetic data first and time the imports too.",
+        )
+        parser.add_argument(
+            "--only", action="append", choices=sorted(BENCHMARKS),
+            help="Run only this benchmark (repeatable; default: all).",
+        )
+        parser.add_argument("--rounds", type=int, default=5, help="Timed runs of slow benchmarks (default: 5).")
+        parser.add_argument("--queries", type=int, default=100, help="Queries per search benchmark (default: 100).")
+        parser.add_argument("--km", type=float, default=10, help="Geo search radius in km (default: 10).")
+        parser.add_argument("--limit", type=int, default=50, help="Rows fetched per geo query (default: 50).")
+        parser.add_argument("--output", help="Write the results to this JSON file.")
+        parser.add_argument("--compare", help="Results JSON of an earlier run to compare against.")
+        parser.add_argument(
+            "--max-regression", type=float,
+            help="Fail if a p50 grew by more than this factor over --compare, e.g. 1.2.",
+        )
+
+    def handle(self, *args, **options):
+        if options["rounds"] < 1 or options["queries"] < 1:
+            raise CommandError("--rounds and --queries must be at least 1")
+        previous = None
+        if options["compare"]:
+            try:
+                with open(options["compare"]) as f:
+                    previous = json.load(f)["results"]
+            except (OSError, ValueError, KeyError) as e:
+                raise CommandError(f"Cannot read {options['compare']}: {e}")
+
+        results = {}
+        if options["generate"]:
+            loaded = self.generate(options)
+            results["import: locations"] = {
+                **summarize([loaded["locations"]["elapsed"] * 1000]), "rows": loaded["locations"]["rows"]}
+            for feed, result in loaded["feeds"].items():
+                results[f"import: feed {feed}"] = {**summarize([result["elapsed"] * 1000]), "rows": result["rows"]}
+            results["import: localizations"] = {
+                **summarize([loaded["localize_elapsed"] * 1000]), "rows": loaded["localizations"]}
+
+        results.update(run_benchmarks(
+            options["only"], rounds=options["rounds"], queries=options["queries"],
+            km=options["km"], limit=options["limit"], seed=options["seed"]))
+
+        for name, stats in results.items():
+            self.stdout.write(
+                f"{name}: p50 {stats['p50_ms']:.2f} ms, p99 {stats['p99_ms']:.2f} ms "
+                f"({stats['rounds']} rounds)")
+        if options["output"]:
+            with open(options["output"], "w") as f:
+                json.dump({"environment": environment(), "results": results}, f, indent=2, sort_keys=True)
+
+        if previous is not None:
+            regressions = []
+            for name, before, after, ratio in compare(previous, results):
+                line = f"{name}: {before:.2f} -> {after:.2f} ms ({ratio:.2f}x)"
+                if options["max_regression"] and ratio > options["max_regression"]:
+                    regressions.append(line)
+                    line = self.style.ERROR(line)
+                self.stdout.write(line)
+            if regressions:
+                raise CommandError("Slower than allowed:\n" + "\n".join(regressions))
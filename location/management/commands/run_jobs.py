@@ -0,0 +1,49 @@
+import threading
+from django.core.management.base import BaseCommand, CommandError
+from location.jobs import HANDLERS, run_workers, stop_on_signals, work
+
+class Command(BaseCommand):
+    help = "Run queued background jobs (imports, feed loads, rollups, sitemaps, images)."
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            "--concurrency", type=int, default=1,
+            help="Number of workers polling the queue (default: 1).",
+        )
+        parser.add_argument(
+            "--processes", action="store_true",
+            help="Run the workers as processes instead of threads, for CPU-bound jobs.",
+        )
+        parser.add_argument(
+            "--kind", action="append", dest="kinds", choices=sorted(HANDLERS),
+            help="Only run jobs of this kind (repeatable).",
+        )
+        parser.add_argument(
+            "--poll-interval", type=float, default=1.0,
+            help="Seconds to wait when the queue is empty (default: 1).",
+        )
+        parser.add_argument(
+            "--once", action="store_true",
+            help="Exit once the queue is empty instead of waiting for new jobs.",
+        )
+
+    def handle(self, *args, **options):
+        if options["concurrency"] < 1:
+            raise CommandError("--concurrency must be at least 1.")
+        kwargs = {"kinds": options["kinds"], "poll_interval": options["poll_interval"],
+                  "once": options["once"]}
+
+        if options["processes"]:
+            run_workers(options["concurrency"], processes=True, **kwargs)
+            self.stdout.write(self.style.SUCCESS("Workers stopped."))
+            return
+
+        stop = threading.Event()
+        if not options["once"]:
+            stop_on_signals(stop)
+        if options["concurrency"] == 1:
+            # In this thread, on the command's own connection
+            count = work(stop=stop, **kwargs)
+        else:
+            count = run_workers(options["concurrency"], stop=stop, **kwargs)
+        self.stdout.write(self.style.SUCCESS(f"Ran {count} jobs."))
@@ -1,15 +1,37 @@
-from threading import local
+from contextvars import ContextVar
 
-_user = local()
+from asgiref.sync import iscoroutinefunction, markcoroutinefunction
+
+# A ContextVar follows the request through sync_to_async/async_to_sync
+# hops and never leaks between concurrent requests, unlike a thread local
+# under ASGI.
+_user = ContextVar('current_user', default=None)
 
 def get_current_user():
-    return getattr(_user, 'user', None)
+    return _user.get()
 
 class CurrentUserMiddleware:
+    sync_capable = True
+    async_capable = True
+
     def __init__(self, get_response):
         self.get_response = get_response
+        if iscoroutinefunction(get_response):
+            markcoroutinefunction(self)
 
     def __call__(self, request):
-        _user.user = request.user
-        response = self.get_response(request)
-        return response
+        if iscoroutinefunction(self):
+            return self.__acall__(request)
+        token = _user.set(request.user)
+        try:
+            return self.get_response(request)
+        finally:
+            # The user belongs to this request only
+            _user.reset(token)
+
+    async def __acall__(self, request):
+        token = _user.set(request.user)
+        try:
+            return await self.get_response(request)
+        finally:
+            _user.reset(token)
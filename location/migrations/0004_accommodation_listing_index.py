@@ -0,0 +1,21 @@
+from django.db import migrations
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('location', '0003_localiseAccomodation_partition'),
+    ]
+
+
+    operations = [
+        # Keyset pagination index for the accommodation listing API; created on
+        # the partitioned table so every feed partition gets its own copy
+        migrations.RunSQL(
+            """
+            CREATE INDEX IF NOT EXISTS location_accommodation_created_idx
+            ON location_accommodation (created_at DESC, id DESC, feed DESC)
+            WHERE published;
+            """,
+            reverse_sql="DROP INDEX IF EXISTS location_accommodation_created_idx;",
+        ),
+    ]
@@ -0,0 +1,33 @@
+from django.db import migrations
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('location', '0004_accommodation_listing_index'),
+    ]
+
+
+    operations = [
+        # 0002 created center without an SRID, so it can't be compared with the
+        # SRID 4326 geometries Django sends
+        migrations.RunSQL(
+            """
+            ALTER TABLE location_accommodation
+            ALTER COLUMN center TYPE GEOMETRY(POINT, 4326) USING ST_SetSRID(center, 4326);
+            """,
+            reverse_sql="""
+            ALTER TABLE location_accommodation
+            ALTER COLUMN center TYPE GEOMETRY(POINT) USING ST_SetSRID(center, 0);
+            """,
+        ),
+
+        # Spatial index on the partitioned table; PostgreSQL builds one per feed
+        # partition and adds it to partitions created later
+        migrations.RunSQL(
+            """
+            CREATE INDEX IF NOT EXISTS location_accommodation_center_gist
+            ON location_accommodation USING GIST (center);
+            """,
+            reverse_sql="DROP INDEX IF EXISTS location_accommodation_center_gist;",
+        ),
+    ]
@@ -0,0 +1,36 @@
+from django.db import migrations, models
+import django.db.models.deletion
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('location', '0005_accommodation_center_gist'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='PendingLocationStats',
+            fields=[
+                ('location_id', models.CharField(max_length=20, primary_key=True, serialize=False)),
+            ],
+        ),
+        migrations.CreateModel(
+            name='LocationStats',
+            fields=[
+                ('location_id', models.OneToOneField(db_column='location_id', on_delete=django.db.models.deletion.CASCADE, primary_key=True, related_name='stats', serialize=False, to='location.location')),
+                ('direct_count', models.PositiveIntegerField(default=0)),
+                ('direct_published', models.PositiveIntegerField(default=0)),
+                ('direct_usd_rate_sum', models.DecimalField(decimal_places=2, default=0, max_digits=20)),
+                ('direct_review_score_sum', models.DecimalField(decimal_places=1, default=0, max_digits=20)),
+                ('accommodation_count', models.PositiveIntegerField(default=0)),
+                ('published_count', models.PositiveIntegerField(default=0)),
+                ('usd_rate_sum', models.DecimalField(decimal_places=2, default=0, max_digits=20)),
+                ('review_score_sum', models.DecimalField(decimal_places=1, default=0, max_digits=20)),
+                ('updated_at', models.DateTimeField(auto_now=True)),
+            ],
+            options={
+                'verbose_name_plural': 'location stats',
+            },
+        ),
+    ]
@@ -0,0 +1,40 @@
+import django.contrib.postgres.fields
+import django.contrib.postgres.indexes
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('location', '0006_locationstats'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='location',
+            name='path',
+            field=django.contrib.postgres.fields.ArrayField(base_field=models.CharField(max_length=20), blank=True, default=list, editable=False, size=None),
+        ),
+        # Backfill every path from the roots down
+        migrations.RunSQL(
+            """
+            WITH RECURSIVE tree AS (
+                SELECT id, ARRAY[id::varchar] AS path
+                FROM location_location
+                WHERE parent_id_id IS NULL
+                UNION ALL
+                SELECT child.id, tree.path || child.id::varchar
+                FROM location_location child
+                JOIN tree ON child.parent_id_id = tree.id
+                WHERE cardinality(tree.path) < 50
+            )
+            UPDATE location_location l SET path = tree.path
+            FROM tree WHERE l.id = tree.id;
+            """,
+            reverse_sql=migrations.RunSQL.noop,
+        ),
+        migrations.AddIndex(
+            model_name='location',
+            index=django.contrib.postgres.indexes.GinIndex(fields=['path'], name='location_path_gin'),
+        ),
+    ]
@@ -0,0 +1,99 @@
+from django.db import migrations
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('location', '0007_location_path'),
+    ]
+
+
+    operations = [
+        # 0002 declared location_id as CHAR (one character) against the
+        # VARCHAR(20) primary key of location_location, and left the other
+        # columns looser than the model. One ALTER TABLE so every partition is
+        # rewritten once. Columns without a usable default stay nullable, as
+        # existing rows and callers rely on that.
+        migrations.RunSQL(
+            """
+            UPDATE location_accommodation SET images = '{}' WHERE images IS NULL;
+            UPDATE location_accommodation SET amenities = '{}' WHERE amenities IS NULL;
+            UPDATE location_accommodation SET published = FALSE WHERE published IS NULL;
+            UPDATE location_accommodation SET review_score = 0 WHERE review_score IS NULL;
+
+            ALTER TABLE location_accommodation
+                ALTER COLUMN location_id TYPE VARCHAR(20),
+                ALTER COLUMN country_code TYPE VARCHAR(2),
+                ALTER COLUMN images TYPE VARCHAR(300)[],
+                ALTER COLUMN amenities TYPE VARCHAR(100)[],
+                ALTER COLUMN created_at TYPE TIMESTAMPTZ USING created_at AT TIME ZONE 'UTC',
+                ALTER COLUMN updated_at TYPE TIMESTAMPTZ USING updated_at AT TIME ZONE 'UTC',
+                ALTER COLUMN feed SET DEFAULT 0,
+                ALTER COLUMN country_code SET NOT NULL,
+                ALTER COLUMN review_score SET NOT NULL,
+                ALTER COLUMN images SET NOT NULL,
+                ALTER COLUMN amenities SET NOT NULL,
+                ALTER COLUMN published SET NOT NULL,
+                ALTER COLUMN created_at SET NOT NULL,
+                ALTER COLUMN updated_at SET NOT NULL;
+            """,
+            reverse_sql="""
+            ALTER TABLE location_accommodation
+                ALTER COLUMN country_code DROP NOT NULL,
+                ALTER COLUMN review_score DROP NOT NULL,
+                ALTER COLUMN images DROP NOT NULL,
+                ALTER COLUMN amenities DROP NOT NULL,
+                ALTER COLUMN published DROP NOT NULL,
+                ALTER COLUMN created_at DROP NOT NULL,
+                ALTER COLUMN updated_at DROP NOT NULL,
+                ALTER COLUMN feed DROP DEFAULT,
+                ALTER COLUMN created_at TYPE TIMESTAMP USING created_at AT TIME ZONE 'UTC',
+                ALTER COLUMN updated_at TYPE TIMESTAMP USING updated_at AT TIME ZONE 'UTC',
+                ALTER COLUMN amenities TYPE TEXT[],
+                ALTER COLUMN images TYPE TEXT[],
+                ALTER COLUMN country_code TYPE CHAR(2),
+                ALTER COLUMN location_id TYPE CHAR(20);
+            """,
+        ),
+
+        # 0003 left property_id untyped, so joining it to the VARCHAR(20)
+        # accommodation id needed a cast. language is the partition key and
+        # cannot change type; CHAR(2) compares fine with the model's values.
+        migrations.RunSQL(
+            """
+            ALTER TABLE location_localizeaccommodation
+                ALTER COLUMN property_id TYPE VARCHAR(20),
+                ALTER COLUMN created_at TYPE TIMESTAMPTZ USING created_at AT TIME ZONE 'UTC',
+                ALTER COLUMN updated_at TYPE TIMESTAMPTZ USING updated_at AT TIME ZONE 'UTC',
+                ALTER COLUMN property_id SET NOT NULL;
+            """,
+            reverse_sql="""
+            ALTER TABLE location_localizeaccommodation
+                ALTER COLUMN property_id DROP NOT NULL,
+                ALTER COLUMN created_at TYPE TIMESTAMP USING created_at AT TIME ZONE 'UTC',
+                ALTER COLUMN updated_at TYPE TIMESTAMP USING updated_at AT TIME ZONE 'UTC',
+                ALTER COLUMN property_id TYPE VARCHAR;
+            """,
+        ),
+
+        # Indexes for the foreign keys and the common filters. Created on the
+        # partitioned table, so PostgreSQL builds one per partition and adds
+        # it to partitions created later.
+        migrations.RunSQL(
+            """
+            CREATE INDEX IF NOT EXISTS location_accommodation_location_id_idx
+            ON location_accommodation (location_id);
+            CREATE INDEX IF NOT EXISTS location_accommodation_user_id_idx
+            ON location_accommodation (user_id);
+            CREATE INDEX IF NOT EXISTS location_accommodation_country_code_idx
+            ON location_accommodation (country_code);
+            CREATE INDEX IF NOT EXISTS location_accommodation_published_idx
+            ON location_accommodation (published);
+            """,
+            reverse_sql="""
+            DROP INDEX IF EXISTS location_accommodation_location_id_idx;
+            DROP INDEX IF EXISTS location_accommodation_user_id_idx;
+            DROP INDEX IF EXISTS location_accommodation_country_code_idx;
+            DROP INDEX IF EXISTS location_accommodation_published_idx;
+            """,
+        ),
+    ]
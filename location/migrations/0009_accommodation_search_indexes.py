@@ -0,0 +1,31 @@
+from django.contrib.postgres.operations import TrigramExtension
+from django.db import migrations
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('location', '0008_align_partitioned_column_types'),
+    ]
+
+
+    operations = [
+        TrigramExtension(),
+
+        # Matches the UPPER("title"::text) LIKE ... that icontains compiles to
+        migrations.RunSQL(
+            """
+            CREATE INDEX IF NOT EXISTS location_accommodation_title_trgm
+            ON location_accommodation USING GIN (UPPER(title::text) gin_trgm_ops);
+            """,
+            reverse_sql="DROP INDEX IF EXISTS location_accommodation_title_trgm;",
+        ),
+
+        # Serves amenities @> ARRAY[...] for the admin search and the API filter
+        migrations.RunSQL(
+            """
+            CREATE INDEX IF NOT EXISTS location_accommodation_amenities_gin
+            ON location_accommodation USING GIN (amenities);
+            """,
+            reverse_sql="DROP INDEX IF EXISTS location_accommodation_amenities_gin;",
+        ),
+    ]
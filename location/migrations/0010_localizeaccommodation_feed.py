@@ -0,0 +1,21 @@
+from django.db import migrations, models
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('location', '0009_accommodation_search_indexes'),
+    ]
+
+
+    operations = [
+        # The column has existed since 0003; only the model was missing it
+        migrations.SeparateDatabaseAndState(
+            state_operations=[
+                migrations.AddField(
+                    model_name='localizeaccommodation',
+                    name='feed',
+                    field=models.PositiveSmallIntegerField(default=0),
+                ),
+            ],
+        ),
+    ]
@@ -0,0 +1,64 @@
+from django.db import migrations
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('location', '0010_localizeaccommodation_feed'),
+    ]
+
+
+    operations = [
+        # Text search configuration of a language code. Declared IMMUTABLE so
+        # generated columns and indexes may call it; changing the mapping
+        # means recreating the columns below.
+        migrations.RunSQL(
+            """
+            CREATE OR REPLACE FUNCTION location_search_config(language TEXT)
+            RETURNS regconfig
+            LANGUAGE sql IMMUTABLE PARALLEL SAFE
+            AS $$
+                SELECT CASE language
+                    WHEN 'en' THEN 'english'::regconfig
+                    WHEN 'fr' THEN 'french'::regconfig
+                    WHEN 'de' THEN 'german'::regconfig
+                    ELSE 'simple'::regconfig
+                END
+            $$;
+            """,
+            reverse_sql="DROP FUNCTION IF EXISTS location_search_config(TEXT);",
+        ),
+
+        # Generated on the partitioned parents, so every partition (existing
+        # and future) computes its own on INSERT/UPDATE; each language
+        # partition is stemmed with its own configuration. Titles come in
+        # any language and are not stemmed.
+        migrations.RunSQL(
+            """
+            ALTER TABLE location_localizeaccommodation
+                ADD COLUMN IF NOT EXISTS search_vector tsvector GENERATED ALWAYS AS (
+                    to_tsvector(location_search_config(language), COALESCE(description, ''))
+                ) STORED;
+            ALTER TABLE location_accommodation
+                ADD COLUMN IF NOT EXISTS search_vector tsvector GENERATED ALWAYS AS (
+                    to_tsvector('simple'::regconfig, COALESCE(title, ''))
+                ) STORED;
+            """,
+            reverse_sql="""
+            ALTER TABLE location_accommodation DROP COLUMN IF EXISTS search_vector;
+            ALTER TABLE location_localizeaccommodation DROP COLUMN IF EXISTS search_vector;
+            """,
+        ),
+
+        migrations.RunSQL(
+            """
+            CREATE INDEX IF NOT EXISTS location_localizeaccommodation_search_idx
+            ON location_localizeaccommodation USING GIN (search_vector);
+            CREATE INDEX IF NOT EXISTS location_accommodation_search_idx
+            ON location_accommodation USING GIN (search_vector);
+            """,
+            reverse_sql="""
+            DROP INDEX IF EXISTS location_accommodation_search_idx;
+            DROP INDEX IF EXISTS location_localizeaccommodation_search_idx;
+            """,
+        ),
+    ]
@@ -0,0 +1,48 @@
+import django.contrib.gis.db.models.fields
+import django.contrib.postgres.fields
+import django.contrib.postgres.indexes
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('location', '0013_job'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='AccommodationListing',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('accommodation_id', models.CharField(max_length=20)),
+                ('feed', models.PositiveSmallIntegerField()),
+                ('title', models.CharField(max_length=100)),
+                ('country_code', models.CharField(max_length=2)),
+                ('country_name', models.CharField(blank=True, max_length=100, null=True)),
+                ('bedroom_count', models.PositiveIntegerField()),
+                ('review_score', models.DecimalField(decimal_places=1, default=0, max_digits=3)),
+                ('usd_rate', models.DecimalField(decimal_places=2, max_digits=10)),
+                ('center', django.contrib.gis.db.models.fields.PointField(srid=4326)),
+                ('location_id', models.CharField(max_length=20)),
+                ('location_title', models.CharField(max_length=100)),
+                ('path', django.contrib.postgres.fields.ArrayField(base_field=models.CharField(max_length=20), default=list, size=None)),
+                ('breadcrumb', django.contrib.postgres.fields.ArrayField(base_field=models.CharField(max_length=100), default=list, size=None)),
+                ('amenities', django.contrib.postgres.fields.ArrayField(base_field=models.CharField(max_length=100), default=list, size=None)),
+                ('primary_image', models.CharField(blank=True, max_length=300, null=True)),
+                ('localized', models.JSONField(default=dict)),
+                ('user_id', models.IntegerField(blank=True, db_index=True, null=True)),
+                ('published', models.BooleanField(default=False)),
+                ('created_at', models.DateTimeField()),
+                ('updated_at', models.DateTimeField()),
+                ('refreshed_at', models.DateTimeField()),
+            ],
+            options={
+                'constraints': [models.UniqueConstraint(fields=('accommodation_id', 'feed'), name='location_listing_key')],
+                'indexes': [
+                    models.Index(condition=models.Q(('published', True)), fields=['-created_at', '-accommodation_id', '-feed'], name='location_listing_published_idx'),
+                    django.contrib.postgres.indexes.GinIndex(fields=['path'], name='location_listing_path_gin'),
+                ],
+            },
+        ),
+    ]
@@ -0,0 +1,32 @@
+import django.contrib.postgres.indexes
+import django.utils.timezone
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('location', '0014_accommodationlisting'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='ChangeRecord',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('txid', models.BigIntegerField()),
+                ('model', models.CharField(max_length=20)),
+                ('object_id', models.CharField(max_length=20)),
+                ('feed', models.PositiveSmallIntegerField(blank=True, null=True)),
+                ('language', models.CharField(blank=True, default='', max_length=2)),
+                ('operation', models.CharField(choices=[('c', 'created'), ('u', 'updated'), ('d', 'deleted')], max_length=1)),
+                ('created_at', models.DateTimeField(default=django.utils.timezone.now)),
+            ],
+            options={
+                'indexes': [
+                    models.Index(fields=['txid', 'id'], name='location_change_cursor_idx'),
+                    django.contrib.postgres.indexes.BrinIndex(fields=['created_at'], name='location_change_created_brin'),
+                ],
+            },
+        ),
+    ]
@@ -0,0 +1,84 @@
+import django.utils.timezone
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('location', '0015_changerecord'),
+    ]
+
+    operations = [
+        migrations.SeparateDatabaseAndState(
+            state_operations=[
+                migrations.CreateModel(
+                    name='PriceHistory',
+                    fields=[
+                        ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                        ('accommodation_id', models.CharField(max_length=20)),
+                        ('feed', models.PositiveSmallIntegerField()),
+                        ('location_id', models.CharField(blank=True, max_length=20, null=True)),
+                        ('usd_rate', models.DecimalField(blank=True, decimal_places=2, max_digits=10, null=True)),
+                        ('published', models.BooleanField(default=False)),
+                        ('changed_at', models.DateTimeField(default=django.utils.timezone.now)),
+                    ],
+                    options={
+                        'verbose_name_plural': 'price history',
+                        'indexes': [
+                            models.Index(fields=['accommodation_id', 'feed', 'changed_at'], name='location_price_property_idx'),
+                            models.Index(fields=['location_id', 'changed_at'], name='location_price_location_idx'),
+                        ],
+                    },
+                ),
+            ],
+            database_operations=[
+                # Range partitioned by month, like the list partitions of 0002
+                # and 0003. The primary key has to include the partition key.
+                migrations.RunSQL(
+                    """
+                    CREATE TABLE location_pricehistory (
+                        id BIGINT GENERATED BY DEFAULT AS IDENTITY,
+                        accommodation_id VARCHAR(20) NOT NULL,
+                        feed SMALLINT NOT NULL CHECK (feed >= 0),
+                        location_id VARCHAR(20),
+                        usd_rate NUMERIC(10, 2),
+                        published BOOLEAN NOT NULL DEFAULT FALSE,
+                        changed_at TIMESTAMP WITH TIME ZONE NOT NULL DEFAULT NOW(),
+                        PRIMARY KEY (id, changed_at)
+                    ) PARTITION BY RANGE (changed_at);
+
+                    CREATE INDEX location_price_property_idx
+                        ON location_pricehistory (accommodation_id, feed, changed_at);
+                    CREATE INDEX location_price_location_idx
+                        ON location_pricehistory (location_id, changed_at);
+
+                    -- Catches rows of months without a partition yet;
+                    -- ensure_month_partition moves them out
+                    CREATE TABLE location_pricehistory_default PARTITION OF location_pricehistory DEFAULT;
+                    """,
+                    reverse_sql="DROP TABLE IF EXISTS location_pricehistory;",
+                ),
+                # This month and the next two; manage_partitions --months
+                # creates the following ones
+                migrations.RunSQL(
+                    """
+                    DO $$
+                    DECLARE
+                        first_day DATE;
+                    BEGIN
+                        FOR n IN 0..2 LOOP
+                            first_day := (date_trunc('month', NOW() AT TIME ZONE 'UTC') + n * INTERVAL '1 month')::date;
+                            EXECUTE format(
+                                'CREATE TABLE IF NOT EXISTS %I PARTITION OF location_pricehistory '
+                                'FOR VALUES FROM (%L) TO (%L)',
+                                'location_pricehistory_' || to_char(first_day, 'YYYY_MM'),
+                                first_day::text || ' 00:00:00+00',
+                                (first_day + INTERVAL '1 month')::date::text || ' 00:00:00+00');
+                        END LOOP;
+                    END $$;
+                    """,
+                    reverse_sql=migrations.RunSQL.noop,
+                ),
+            ],
+        ),
+    ]
@@ -0,0 +1,40 @@
+from django.db import migrations
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('location', '0016_pricehistory'),
+    ]
+
+    operations = [
+        # One-row counter bumped by every statement that adds, removes or
+        # re-parents locations, whatever wrote it (ORM, bulk import, raw
+        # SQL). hierarchy.get_tree polls it instead of scanning the table.
+        # Concurrent location writers queue on the row; locations change rarely.
+        migrations.RunSQL(
+            """
+            CREATE TABLE location_treeversion (
+                id SMALLINT PRIMARY KEY CHECK (id = 1),
+                version BIGINT NOT NULL
+            );
+            INSERT INTO location_treeversion (id, version) VALUES (1, 1);
+
+            CREATE FUNCTION location_bump_tree_version() RETURNS trigger AS $$
+            BEGIN
+                UPDATE location_treeversion SET version = version + 1 WHERE id = 1;
+                RETURN NULL;
+            END;
+            $$ LANGUAGE plpgsql;
+
+            CREATE TRIGGER location_tree_version
+            AFTER INSERT OR DELETE OR TRUNCATE OR UPDATE OF parent_id_id ON location_location
+            FOR EACH STATEMENT EXECUTE FUNCTION location_bump_tree_version();
+            """,
+            reverse_sql="""
+            DROP TRIGGER IF EXISTS location_tree_version ON location_location;
+            DROP FUNCTION IF EXISTS location_bump_tree_version();
+            DROP TABLE IF EXISTS location_treeversion;
+            """,
+        ),
+    ]
@@ -0,0 +1,47 @@
+from django.db import migrations
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('location', '0017_location_tree_version'),
+    ]
+
+    operations = [
+        # 0014 created the listings empty while the list endpoints already
+        # read from them. Fill them from the accommodations as of this
+        # migration (listings.REFRESH_SQL over everything); rows the app
+        # wrote since are newer and kept.
+        migrations.RunSQL(
+            """
+            INSERT INTO location_accommodationlisting (
+                accommodation_id, feed, title, country_code, country_name, bedroom_count,
+                review_score, usd_rate, center, location_id, location_title, path, breadcrumb,
+                amenities, primary_image, localized, user_id, published, created_at, updated_at,
+                refreshed_at
+            )
+            SELECT a.id, a.feed, a.title, a.country_code, crumbs.titles[1], a.bedroom_count,
+                   a.review_score, a.usd_rate, a.center, a.location_id, l.title, l.path, crumbs.titles,
+                   a.amenities, a.images[1],
+                   COALESCE((
+                       SELECT jsonb_object_agg(t.language, jsonb_build_object(
+                           'description', t.description, 'policy', t.policy))
+                       FROM location_localizeaccommodation t
+                       WHERE t.property_id = a.id AND t.feed = a.feed
+                   ), jsonb_build_object()),
+                   a.user_id, a.published, a.created_at, a.updated_at, NOW()
+            FROM location_accommodation a
+            JOIN location_location l ON l.id = a.location_id
+            CROSS JOIN LATERAL (
+                SELECT ARRAY(
+                    SELECT p.title
+                    FROM unnest(l.path) WITH ORDINALITY AS u(id, n)
+                    JOIN location_location p ON p.id = u.id
+                    ORDER BY u.n
+                ) AS titles
+            ) crumbs
+            ON CONFLICT (accommodation_id, feed) DO NOTHING;
+            """,
+            reverse_sql=migrations.RunSQL.noop,
+        ),
+    ]
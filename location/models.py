@@ -1,6 +1,9 @@
 from django.contrib.gis.db import models
 from django.contrib.auth.models import User
 from django.contrib.postgres.fields import ArrayField
+from django.contrib.postgres.indexes import BrinIndex, GinIndex
+from django.db.models import Func
+from django.utils import timezone
 from .middleware import get_current_user
 
 
@@ -16,6 +19,29 @@ class Location(models.Model):
     city = models.CharField(max_length=30, blank=True, null=True)
     created_at = models.DateTimeField(auto_now_add=True)
     updated_at = models.DateTimeField(auto_now=True)
+    # Ids from the root down to this location, inclusive. Maintained on save
+    # and by the bulk importer (see ``location.hierarchy``).
+    path = ArrayField(
+        models.CharField(max_length=20),
+        blank=True,
+        default=list,
+        editable=False
+    )
+
+    class Meta:
+        indexes = [GinIndex(fields=['path'], name='location_path_gin')]
+
+    def ancestors(self):
+        """Ancestors of this location, root first."""
+        return (
+            Location.objects.filter(id__in=self.path[:-1])
+            .alias(depth=Func('path', function='cardinality'))
+            .order_by('depth')
+        )
+
+    def descendants(self):
+        """Every location below this one, answered by the GIN index on ``path``."""
+        return Location.objects.filter(path__contains=[self.pk]).exclude(pk=self.pk)
 
     def __str__(self):
         if self.location_type == "country":
@@ -56,8 +82,11 @@ class Accommodation(models.Model):
     updated_at = models.DateTimeField(auto_now=True)
 
     def save(self, *args, **kwargs):
-        if not self.user_id and get_current_user():
-            self.user_id = get_current_user()
+        # Compare the raw column so an unset owner doesn't cost a User query
+        if self.user_id_id is None:
+            user = get_current_user()
+            if user is not None and user.is_authenticated:
+                self.user_id = user
         super().save(*args, **kwargs)
 
 
@@ -65,6 +94,240 @@ class LocalizeAccommodation(models.Model):
     id = models.AutoField(primary_key=True)
     property_id = models.ForeignKey(
         Accommodation, on_delete=models.CASCADE, db_column='property_id')
+    # Together with property_id references the (id, feed) key of the
+    # accommodation (see migration 0003)
+    feed = models.PositiveSmallIntegerField(default=0)
     language = models.CharField(max_length=2)
     description = models.TextField()
     policy = models.JSONField()
+
+    def save(self, *args, **kwargs):
+        # Take the feed from the accommodation when it is at hand
+        if self._state.adding and LocalizeAccommodation.property_id.is_cached(self):
+            self.feed = self.property_id.feed
+        super().save(*args, **kwargs)
+
+
+class LocationStats(models.Model):
+    """
+    Accommodation aggregates per location, rolled up along ``parent_id`` so a
+    country row covers every state and city below it. Maintained by
+    ``location.rollups``; read it instead of aggregating accommodations.
+    """
+    location_id = models.OneToOneField(
+        Location, on_delete=models.CASCADE, primary_key=True,
+        db_column='location_id', related_name='stats')
+    # Accommodations attached to this location itself
+    direct_count = models.PositiveIntegerField(default=0)
+    direct_published = models.PositiveIntegerField(default=0)
+    direct_usd_rate_sum = models.DecimalField(max_digits=20, decimal_places=2, default=0)
+    direct_review_score_sum = models.DecimalField(max_digits=20, decimal_places=1, default=0)
+    # Including all descendant locations
+    accommodation_count = models.PositiveIntegerField(default=0)
+    published_count = models.PositiveIntegerField(default=0)
+    usd_rate_sum = models.DecimalField(max_digits=20, decimal_places=2, default=0)
+    review_score_sum = models.DecimalField(max_digits=20, decimal_places=1, default=0)
+    updated_at = models.DateTimeField(auto_now=True)
+
+    class Meta:
+        verbose_name_plural = "location stats"
+
+    @property
+    def avg_usd_rate(self):
+        if not self.accommodation_count:
+            return None
+        return round(self.usd_rate_sum / self.accommodation_count, 2)
+
+    @property
+    def avg_review_score(self):
+        if not self.accommodation_count:
+            return None
+        return round(self.review_score_sum / self.accommodation_count, 2)
+
+    @property
+    def published_ratio(self):
+        if not self.accommodation_count:
+            return None
+        return round(self.published_count / self.accommodation_count, 4)
+
+
+class PendingLocationStats(models.Model):
+    """Locations whose ``LocationStats`` must be recomputed on the next refresh."""
+    location_id = models.CharField(max_length=20, primary_key=True)
+
+
+class ImageRendition(models.Model):
+    """
+    A resized copy of one of the ``Accommodation.images``, produced by
+    ``location.images``. ``file`` is named after the hash of its content, so
+    identical images share one file that can be cached forever.
+    """
+    source = models.CharField(max_length=300)
+    # Hash of the original, to skip unchanged sources and reuse the
+    # renditions of identical ones
+    source_hash = models.CharField(max_length=64, db_index=True)
+    rendition = models.CharField(max_length=20)
+    file = models.CharField(max_length=200)
+    width = models.PositiveIntegerField()
+    height = models.PositiveIntegerField()
+    size = models.PositiveIntegerField()
+    created_at = models.DateTimeField(auto_now_add=True)
+
+    class Meta:
+        constraints = [
+            models.UniqueConstraint(fields=['source', 'rendition'], name='location_imagerendition_source_rendition'),
+        ]
+
+
+class Job(models.Model):
+    """
+    A unit of background work run by the ``run_jobs`` worker; see
+    ``location.jobs``.
+    """
+    QUEUED = 'queued'
+    RUNNING = 'running'
+    SUCCEEDED = 'succeeded'
+    FAILED = 'failed'
+    STATUS_CHOICES = [
+        (QUEUED, 'Queued'),
+        (RUNNING, 'Running'),
+        (SUCCEEDED, 'Succeeded'),
+        (FAILED, 'Failed'),
+    ]
+
+    kind = models.CharField(max_length=50)
+    payload = models.JSONField(default=dict, blank=True)
+    status = models.CharField(max_length=10, choices=STATUS_CHOICES, default=QUEUED)
+    priority = models.SmallIntegerField(default=0)
+    attempts = models.PositiveSmallIntegerField(default=0)
+    max_attempts = models.PositiveSmallIntegerField(default=3)
+    run_after = models.DateTimeField(default=timezone.now)
+    # Worker holding the job; heartbeat is refreshed with every progress report
+    locked_by = models.CharField(max_length=100, blank=True, default='')
+    heartbeat = models.DateTimeField(null=True, blank=True)
+    progress_done = models.PositiveIntegerField(default=0)
+    progress_total = models.PositiveIntegerField(null=True, blank=True)
+    message = models.CharField(max_length=200, blank=True, default='')
+    result = models.JSONField(null=True, blank=True)
+    error = models.TextField(blank=True, default='')
+    created_at = models.DateTimeField(auto_now_add=True)
+    started_at = models.DateTimeField(null=True, blank=True)
+    finished_at = models.DateTimeField(null=True, blank=True)
+
+    class Meta:
+        indexes = [
+            # Only queued rows are polled; the index stays as small as the queue
+            models.Index(
+                fields=['-priority', 'run_after', 'id'], name='location_job_queued_idx',
+                condition=models.Q(status='queued')),
+        ]
+
+    def __str__(self):
+        return f"{self.kind} #{self.pk} ({self.status})"
+
+
+class AccommodationListing(models.Model):
+    """
+    Display-ready copy of one accommodation for the read endpoints: its
+    columns plus the location breadcrumb, country name, primary image and
+    the descriptions in every language, so a page is one index range scan
+    of one table. Maintained by ``location.listings``; never written
+    directly.
+    """
+    accommodation_id = models.CharField(max_length=20)
+    feed = models.PositiveSmallIntegerField()
+    title = models.CharField(max_length=100)
+    country_code = models.CharField(max_length=2)
+    # Title of the root of the location's path
+    country_name = models.CharField(max_length=100, blank=True, null=True)
+    bedroom_count = models.PositiveIntegerField()
+    review_score = models.DecimalField(max_digits=3, decimal_places=1, default=0)
+    usd_rate = models.DecimalField(max_digits=10, decimal_places=2)
+    center = models.PointField()
+    location_id = models.CharField(max_length=20)
+    location_title = models.CharField(max_length=100)
+    # Location ids and titles from the root down, as in ``Location.path``
+    path = ArrayField(models.CharField(max_length=20), default=list)
+    breadcrumb = ArrayField(models.CharField(max_length=100), default=list)
+    amenities = ArrayField(models.CharField(max_length=100), default=list)
+    primary_image = models.CharField(max_length=300, blank=True, null=True)
+    # {language: {"description": ..., "policy": ...}}
+    localized = models.JSONField(default=dict)
+    user_id = models.IntegerField(blank=True, null=True, db_index=True)
+    published = models.BooleanField(default=False)
+    created_at = models.DateTimeField()
+    updated_at = models.DateTimeField()
+    refreshed_at = models.DateTimeField()
+
+    class Meta:
+        constraints = [
+            models.UniqueConstraint(fields=['accommodation_id', 'feed'], name='location_listing_key'),
+        ]
+        indexes = [
+            # The list endpoint's keyset order over published rows
+            models.Index(
+                fields=['-created_at', '-accommodation_id', '-feed'],
+                name='location_listing_published_idx', condition=models.Q(published=True)),
+            GinIndex(fields=['path'], name='location_listing_path_gin'),
+        ]
+
+    def __str__(self):
+        return f"{self.title} ({self.accommodation_id}, feed {self.feed})"
+
+
+class ChangeRecord(models.Model):
+    """
+    One create, update or delete of an accommodation, localization or
+    location, appended in the writing transaction by the signals and the
+    bulk loaders (see ``location.changes``). Downstream caches and search
+    indexes read them after a cursor instead of rescanning the tables.
+    """
+    OPERATION_CHOICES = [('c', 'created'), ('u', 'updated'), ('d', 'deleted')]
+
+    # Transaction id of the write; records are read in (txid, id) order
+    txid = models.BigIntegerField()
+    model = models.CharField(max_length=20)
+    object_id = models.CharField(max_length=20)
+    feed = models.PositiveSmallIntegerField(blank=True, null=True)
+    language = models.CharField(max_length=2, blank=True, default='')
+    operation = models.CharField(max_length=1, choices=OPERATION_CHOICES)
+    created_at = models.DateTimeField(default=timezone.now)
+
+    class Meta:
+        indexes = [
+            models.Index(fields=['txid', 'id'], name='location_change_cursor_idx'),
+            # Append-only, so a tiny BRIN index answers the retention delete
+            BrinIndex(fields=['created_at'], name='location_change_created_brin'),
+        ]
+
+    def __str__(self):
+        return f"{self.get_operation_display()} {self.model} {self.object_id}"
+
+
+class PriceHistory(models.Model):
+    """
+    Rate and availability of one accommodation from ``changed_at`` until
+    its next row. Only changes of the rate, ``published`` or the location
+    are stored, appended by the signals and the bulk feed loader (see
+    ``location.prices``). The table is range-partitioned by month on
+    ``changed_at`` (migration 0016, ``partitions.ensure_month_partition``),
+    so old months can be detached or dropped without touching the rest.
+    """
+    accommodation_id = models.CharField(max_length=20)
+    feed = models.PositiveSmallIntegerField()
+    # Location at the time, so monthly averages by location need no join
+    location_id = models.CharField(max_length=20, blank=True, null=True)
+    # None once the accommodation is gone
+    usd_rate = models.DecimalField(max_digits=10, decimal_places=2, blank=True, null=True)
+    published = models.BooleanField(default=False)
+    changed_at = models.DateTimeField(default=timezone.now)
+
+    class Meta:
+        verbose_name_plural = "price history"
+        indexes = [
+            models.Index(fields=['accommodation_id', 'feed', 'changed_at'], name='location_price_property_idx'),
+            models.Index(fields=['location_id', 'changed_at'], name='location_price_location_idx'),
+        ]
+
+    def __str__(self):
+        return f"{self.accommodation_id} (feed {self.feed}): {self.usd_rate} at {self.changed_at}"
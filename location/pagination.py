@@ -0,0 +1,187 @@
+import base64
+import json
+from datetime import datetime
+
+from django.core.exceptions import EmptyResultSet
+from django.core.paginator import Paginator
+from django.db import connections
+from django.db.models import BooleanField
+from django.utils.functional import cached_property
+from django.db.models.expressions import RawSQL
+from django.utils.dateparse import parse_datetime
+from rest_framework.exceptions import NotFound
+from rest_framework.pagination import BasePagination
+from rest_framework.response import Response
+from rest_framework.utils.urls import replace_query_param
+
+
+class KeysetPagination(BasePagination):
+    """
+    Cursor pagination that seeks with a row comparison on ``ordering``
+    (all descending) instead of OFFSET, so every page costs one index range
+    scan no matter how deep it is. The cursor carries the ordering values of
+    the last row of the previous page; the last ordering field must make the
+    key unique.
+    """
+    ordering = ('created_at', 'id')
+    page_size = 50
+    max_page_size = 200
+    cursor_query_param = 'cursor'
+    page_size_query_param = 'page_size'
+    invalid_cursor_message = 'Invalid cursor'
+
+    def paginate_queryset(self, queryset, request, view=None):
+        return self.finish_page(list(self.get_page_queryset(queryset, request)))
+
+    async def apaginate_queryset(self, queryset, request):
+        """``paginate_queryset`` for async views; the page is fetched with the async ORM."""
+        return self.finish_page([obj async for obj in self.get_page_queryset(queryset, request)])
+
+    def get_page_queryset(self, queryset, request):
+        # One extra row tells whether there is a next page
+        self.request = request
+        self.current_page_size = self.get_page_size(request)
+        position = self.decode_cursor(request)
+
+        queryset = queryset.order_by(*(f'-{field}' for field in self.ordering))
+        if position is not None:
+            queryset = queryset.filter(self.seek_condition(queryset.model, position))
+        return queryset[:self.current_page_size + 1]
+
+    def finish_page(self, page):
+        self.has_next = len(page) > self.current_page_size
+        page = page[:self.current_page_size]
+        self.next_position = self.get_position(page[-1]) if self.has_next else None
+        return page
+
+    def get_query_params(self, request):
+        # DRF requests have query_params, plain Django ones (async views) GET
+        return getattr(request, 'query_params', request.GET)
+
+    def get_page_size(self, request):
+        try:
+            size = int(self.get_query_params(request).get(self.page_size_query_param, self.page_size))
+        except ValueError:
+            return self.page_size
+        return max(1, min(size, self.max_page_size))
+
+    def seek_condition(self, model, position):
+        table = model._meta.db_table
+        columns = ', '.join(
+            f'"{table}"."{model._meta.get_field(field).column}"' for field in self.ordering)
+        placeholders = ', '.join(['%s'] * len(self.ordering))
+        return RawSQL(f'({columns}) < ({placeholders})', position, output_field=BooleanField())
+
+    def get_position(self, obj):
+        position = []
+        for field in self.ordering:
+            value = getattr(obj, obj._meta.get_field(field).attname)
+            position.append(value.isoformat() if isinstance(value, datetime) else value)
+        return position
+
+    def decode_cursor(self, request):
+        encoded = self.get_query_params(request).get(self.cursor_query_param)
+        if not encoded:
+            return None
+        try:
+            position = json.loads(base64.urlsafe_b64decode(encoded.encode()).decode())
+        except (ValueError, TypeError):
+            raise NotFound(self.invalid_cursor_message)
+        if not isinstance(position, list) or len(position) != len(self.ordering):
+            raise NotFound(self.invalid_cursor_message)
+        return self.parse_position(position)
+
+    def parse_position(self, position):
+        """Validate cursor values so a tampered cursor can't reach the database as garbage."""
+        if self.ordering[0] == 'created_at':
+            created_at = parse_datetime(position[0]) if isinstance(position[0], str) else None
+            if created_at is None:
+                raise NotFound(self.invalid_cursor_message)
+            position[0] = created_at
+        return position
+
+    def encode_cursor(self, position):
+        encoded = base64.urlsafe_b64encode(json.dumps(position).encode()).decode()
+        return replace_query_param(
+            self.request.build_absolute_uri(), self.cursor_query_param, encoded)
+
+    def get_next_link(self):
+        if not self.has_next:
+            return None
+        return self.encode_cursor(self.next_position)
+
+    def get_paginated_response(self, data):
+        return Response({
+            'next': self.get_next_link(),
+            'results': data,
+        })
+
+    def get_paginated_response_schema(self, schema):
+        return {
+            'type': 'object',
+            'properties': {
+                'next': {'type': 'string', 'nullable': True, 'format': 'uri'},
+                'results': schema,
+            },
+        }
+
+
+class AccommodationCursorPagination(KeysetPagination):
+    # The same id can exist once per feed, so feed completes the key
+    ordering = ('created_at', 'id', 'feed')
+
+    def parse_position(self, position):
+        position = super().parse_position(position)
+        if not isinstance(position[1], str) or type(position[2]) is not int:
+            raise NotFound(self.invalid_cursor_message)
+        return position
+
+
+class ListingCursorPagination(AccommodationCursorPagination):
+    # Same cursors as the accommodation list, over AccommodationListing
+    ordering = ('created_at', 'accommodation_id', 'feed')
+
+
+class EstimatedCountPaginator(Paginator):
+    """
+    Paginator for very large tables that replaces ``COUNT(*)`` with the
+    planner's estimate: the ``pg_class.reltuples`` of every partition for an
+    unfiltered queryset, or the row estimate of ``EXPLAIN`` when filtered
+    (which prunes partitions the same way the real query does). Counts that
+    are estimated below ``exact_count_threshold`` are counted exactly, so
+    small and freshly created tables stay accurate.
+    """
+    exact_count_threshold = 10000
+
+    RELTUPLES_SQL = """
+        SELECT COALESCE(SUM(GREATEST(c.reltuples, 0)), 0)
+        FROM pg_class c
+        WHERE c.oid = %s::regclass
+           OR c.oid IN (SELECT inhrelid FROM pg_inherits WHERE inhparent = %s::regclass)
+    """
+
+    @cached_property
+    def count(self):
+        queryset = self.object_list
+        if not hasattr(queryset, 'query'):
+            return super().count
+        estimate = self.estimate_count(queryset)
+        if estimate < self.exact_count_threshold:
+            return super().count
+        return estimate
+
+    def estimate_count(self, queryset):
+        with connections[queryset.db].cursor() as cursor:
+            if not queryset.query.where:
+                table = queryset.model._meta.db_table
+                cursor.execute(self.RELTUPLES_SQL, [table, table])
+                return int(cursor.fetchone()[0])
+            try:
+                sql, params = queryset.order_by().query.get_compiler(queryset.db).as_sql()
+            except EmptyResultSet:
+                return 0
+            cursor.execute(f"EXPLAIN (FORMAT JSON) {sql}", params)
+            plan = cursor.fetchone()[0]
+        if isinstance(plan, str):
+            plan = json.loads(plan)
+        return int(plan[0]['Plan']['Plan Rows'])
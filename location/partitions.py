@@ -0,0 +1,337 @@
+import logging
+import re
+from contextlib import contextmanager
+from datetime import date
+
+from django.db import DatabaseError, connection, transaction
+
+logger = logging.getLogger(__name__)
+
+ACCOMMODATION_TABLE = "location_accommodation"
+LOCALIZE_TABLE = "location_localizeaccommodation"
+PRICE_TABLE = "location_pricehistory"
+PRICE_DEFAULT_PARTITION = f"{PRICE_TABLE}_default"
+
+LANGUAGE_RE = re.compile(r"^[a-z]{2}$")
+INDEXDEF_RE = re.compile(r"^CREATE (UNIQUE )?INDEX \S+ ON ONLY \S+ (USING .*)$")
+
+# Lock wait allowed for the DETACH/ATTACH swap before giving up, so a swap
+# never queues up behind long-running queries and blocks everyone else.
+SWAP_LOCK_TIMEOUT = "5s"
+
+LIST_PARTITIONS_SQL = """
+    SELECT child.relname, pg_get_expr(child.relpartbound, child.oid)
+    FROM pg_inherits
+    JOIN pg_class parent ON pg_inherits.inhparent = parent.oid
+    JOIN pg_class child ON pg_inherits.inhrelid = child.oid
+    WHERE parent.relname = %s
+    ORDER BY child.relname
+"""
+
+SECONDARY_INDEXES_SQL = """
+    SELECT pg_get_indexdef(i.indexrelid)
+    FROM pg_index i
+    WHERE i.indrelid = %s::regclass AND NOT i.indisprimary
+"""
+
+OUTGOING_FKS_SQL = """
+    SELECT con.conname, pg_get_constraintdef(con.oid)
+    FROM pg_constraint con
+    WHERE con.contype = 'f' AND con.conrelid = %s::regclass
+"""
+
+REFERENCING_FKS_SQL = """
+    SELECT con.conrelid::regclass::text, con.conname, pg_get_constraintdef(con.oid)
+    FROM pg_constraint con
+    WHERE con.contype = 'f' AND con.confrelid = %s::regclass AND con.conparentid = 0
+"""
+
+# The leaf constraints of a foreign key dropped by a swap that are still
+# waiting for VALIDATE
+UNVALIDATED_LEAVES_SQL = """
+    SELECT con.conrelid::regclass::text
+    FROM pg_constraint con
+    WHERE con.contype = 'f' AND con.conname = %s AND NOT con.convalidated
+      AND con.confrelid = %s::regclass
+"""
+
+# Localized rows of accommodations missing from {{table}}; the ON DELETE
+# CASCADE would have removed them had the rows been deleted.
+ORPHANED_LOCALIZATIONS_SQL = f"""
+    DELETE FROM {LOCALIZE_TABLE} l
+    WHERE l.feed = %s
+      AND NOT EXISTS (
+          SELECT 1 FROM {{table}} a
+          WHERE a.id = l.property_id AND a.feed = l.feed
+      )
+"""
+
+
+class PartitionError(Exception):
+    pass
+
+
+def feed_partition_name(feed):
+    return f"{ACCOMMODATION_TABLE}_feed_{_feed_value(feed)}"
+
+
+def language_partition_name(language):
+    return f"{LOCALIZE_TABLE}_{_language_value(language)}"
+
+
+def month_partition_name(month):
+    month = _month_value(month)
+    return f"{PRICE_TABLE}_{month.year}_{month.month:02}"
+
+
+def _feed_value(feed):
+    # feed is a SMALLINT; Accommodation.feed is a PositiveSmallIntegerField
+    try:
+        feed = int(feed)
+    except (TypeError, ValueError):
+        raise PartitionError(f"Invalid feed: {feed!r}")
+    if not 0 <= feed <= 32767:
+        raise PartitionError(f"Invalid feed: {feed!r}")
+    return feed
+
+
+def _language_value(language):
+    if not isinstance(language, str) or not LANGUAGE_RE.match(language):
+        raise PartitionError(f"Invalid language code: {language!r}")
+    return language
+
+
+def _month_value(month):
+    # First day of the month of a date or datetime
+    if not isinstance(month, date):
+        raise PartitionError(f"Invalid month: {month!r}")
+    return date(month.year, month.month, 1)
+
+
+def next_month(month):
+    month = _month_value(month)
+    return date(month.year + month.month // 12, month.month % 12 + 1, 1)
+
+
+def table_exists(name):
+    with connection.cursor() as cursor:
+        cursor.execute("SELECT to_regclass(%s)", [name])
+        return cursor.fetchone()[0] is not None
+
+
+def list_partitions(parent):
+    """Return ``(partition_name, bound)`` pairs for the partitions of ``parent``."""
+    with connection.cursor() as cursor:
+        cursor.execute(LIST_PARTITIONS_SQL, [parent])
+        return cursor.fetchall()
+
+
+def ensure_feed_partition(feed):
+    """Create the accommodation partition for ``feed`` if needed. Returns True if created."""
+    feed = _feed_value(feed)
+    name = feed_partition_name(feed)
+    if table_exists(name):
+        return False
+    with connection.cursor() as cursor:
+        cursor.execute(
+            f"CREATE TABLE IF NOT EXISTS {name} PARTITION OF {ACCOMMODATION_TABLE} "
+            f"FOR VALUES IN ({feed})"
+        )
+    return True
+
+
+def ensure_language_partition(language):
+    """Create the localization partition for ``language`` if needed. Returns True if created."""
+    language = _language_value(language)
+    name = language_partition_name(language)
+    if table_exists(name):
+        return False
+    with connection.cursor() as cursor:
+        cursor.execute(
+            f"CREATE TABLE IF NOT EXISTS {name} PARTITION OF {LOCALIZE_TABLE} "
+            f"FOR VALUES IN ('{language}')"
+        )
+    return True
+
+
+def ensure_month_partition(month):
+    """
+    Create the price history partition of the month of ``month`` (a date)
+    if needed. Rows written to the default partition before it existed are
+    moved into it. Returns True if created.
+    """
+    start = _month_value(month)
+    name = month_partition_name(start)
+    if table_exists(name):
+        return False
+    lower, upper = f"{start} 00:00:00+00", f"{next_month(start)} 00:00:00+00"
+    with transaction.atomic(), connection.cursor() as cursor:
+        # ATTACH would refuse while the default partition holds rows of the month
+        cursor.execute(f"CREATE TABLE {name} (LIKE {PRICE_TABLE} INCLUDING DEFAULTS INCLUDING CONSTRAINTS)")
+        cursor.execute(
+            f"WITH moved AS ("
+            f"    DELETE FROM {PRICE_DEFAULT_PARTITION} WHERE changed_at >= %s AND changed_at < %s"
+            f"    RETURNING *"
+            f") INSERT INTO {name} SELECT * FROM moved",
+            [lower, upper])
+        cursor.execute(
+            f"ALTER TABLE {PRICE_TABLE} ATTACH PARTITION {name} "
+            f"FOR VALUES FROM ('{lower}') TO ('{upper}')")
+    return True
+
+
+def ensure_month_partitions(start, months):
+    """Create the price history partitions of ``months`` months from ``start``. Returns the months created."""
+    created = []
+    month = _month_value(start)
+    for _ in range(months):
+        if ensure_month_partition(month):
+            created.append(month)
+        month = next_month(month)
+    return created
+
+
+def _clone_secondary_indexes(cursor, parent, table):
+    cursor.execute(SECONDARY_INDEXES_SQL, [parent])
+    for (indexdef,) in cursor.fetchall():
+        match = INDEXDEF_RE.match(indexdef)
+        if match is None:
+            raise PartitionError(f"Cannot clone index definition: {indexdef}")
+        cursor.execute(f"CREATE {match[1] or ''}INDEX ON {table} {match[2]}")
+
+
+def _clone_foreign_keys(cursor, parent, table):
+    # Same names and definitions as the parent's, so ATTACH adopts them
+    # instead of adding its own and scanning the table under its locks.
+    # NOT VALID + VALIDATE keeps writes to the referenced tables going.
+    cursor.execute(OUTGOING_FKS_SQL, [parent])
+    for name, definition in cursor.fetchall():
+        cursor.execute(f"ALTER TABLE {table} ADD CONSTRAINT {name} {definition} NOT VALID")
+        cursor.execute(f"ALTER TABLE {table} VALIDATE CONSTRAINT {name}")
+
+
+@contextmanager
+def shadow_feed_partition(feed, before_swap=None):
+    """
+    Yield the name of an empty table shaped like the partition of ``feed``.
+
+    Load the complete feed into it; on a clean exit its secondary indexes
+    are built (after the load, which is much cheaper than maintaining them
+    row by row), then it is swapped in for the live partition with
+    DETACH/ATTACH in one transaction and the old partition is dropped. The
+    live partition keeps serving until the swap, which only waits
+    ``SWAP_LOCK_TIMEOUT`` for its locks. If the block raises, the shadow
+    table is dropped and the live data is untouched.
+
+    ``before_swap(cursor)`` runs in the swap's transaction with the live
+    partition locked against writes (reads go on), so whatever it records
+    about the differences between the two tables commits together with the
+    swap and describes exactly the data it replaces.
+
+    The shadow gets the foreign keys of ``location_accommodation`` before
+    the swap, so ATTACH has nothing left to check. Foreign keys pointing at
+    ``location_accommodation`` would make DETACH fail, so they are dropped
+    and recreated around the swap; the localizations of accommodations
+    missing from the new data are deleted before it. See
+    ``restore_foreign_keys`` for how they are recreated without
+    re-validating every localization under the swap's locks.
+    """
+    feed = _feed_value(feed)
+    live = feed_partition_name(feed)
+    shadow = f"{live}_shadow"
+    check = f"{shadow}_feed_check"
+
+    with connection.cursor() as cursor:
+        cursor.execute(f"DROP TABLE IF EXISTS {shadow}")
+        cursor.execute(
+            f"CREATE TABLE {shadow} (LIKE {ACCOMMODATION_TABLE} "
+            f"INCLUDING DEFAULTS INCLUDING CONSTRAINTS INCLUDING GENERATED)"
+        )
+        cursor.execute(f"ALTER TABLE {shadow} ADD PRIMARY KEY (id, feed)")
+        # Proves the partition bound up front so ATTACH can skip its scan
+        cursor.execute(
+            f"ALTER TABLE {shadow} ADD CONSTRAINT {check} "
+            f"CHECK (feed IS NOT NULL AND feed = {feed})"
+        )
+
+    try:
+        yield shadow
+    except BaseException:
+        with connection.cursor() as cursor:
+            cursor.execute(f"DROP TABLE IF EXISTS {shadow}")
+        raise
+
+    with connection.cursor() as cursor:
+        _clone_secondary_indexes(cursor, ACCOMMODATION_TABLE, shadow)
+        _clone_foreign_keys(cursor, ACCOMMODATION_TABLE, shadow)
+        cursor.execute(f"ANALYZE {shadow}")
+        cursor.execute(ORPHANED_LOCALIZATIONS_SQL.format(table=shadow), [feed])
+
+        with transaction.atomic():
+            cursor.execute(f"SET LOCAL lock_timeout = '{SWAP_LOCK_TIMEOUT}'")
+            if before_swap is not None:
+                if table_exists(live):
+                    cursor.execute(f"LOCK TABLE {live} IN EXCLUSIVE MODE")
+                # Before the foreign keys go, which locks the localizations
+                before_swap(cursor)
+            cursor.execute(REFERENCING_FKS_SQL, [ACCOMMODATION_TABLE])
+            foreign_keys = cursor.fetchall()
+            for table, name, _definition in foreign_keys:
+                cursor.execute(f"ALTER TABLE {table} DROP CONSTRAINT {name}")
+
+            if table_exists(live):
+                cursor.execute(f"ALTER TABLE {ACCOMMODATION_TABLE} DETACH PARTITION {live}")
+                cursor.execute(f"DROP TABLE {live}")
+            cursor.execute(f"ALTER TABLE {shadow} RENAME TO {live}")
+            # Free the shadow names for the next refresh
+            cursor.execute(f"ALTER INDEX {shadow}_pkey RENAME TO {live}_pkey")
+            cursor.execute(
+                f"ALTER TABLE {ACCOMMODATION_TABLE} ATTACH PARTITION {live} "
+                f"FOR VALUES IN ({feed})"
+            )
+            cursor.execute(f"ALTER TABLE {live} DROP CONSTRAINT {check}")
+
+            for table, name, definition in foreign_keys:
+                _add_unvalidated_foreign_key(cursor, table, name, definition)
+
+    try:
+        with transaction.atomic():
+            restore_foreign_keys(feed, foreign_keys)
+    except DatabaseError:
+        # The swap is committed and new rows are checked by the leaf
+        # constraints; retry the validation rather than fail the refresh
+        logger.exception("Could not restore the foreign keys of %s after the swap", live)
+        from .jobs import enqueue  # jobs imports feeds, which imports this module
+        enqueue("restore_foreign_keys", {"feed": feed, "foreign_keys": foreign_keys}, max_attempts=10)
+
+
+def _add_unvalidated_foreign_key(cursor, table, name, definition):
+    # PostgreSQL 15 has no NOT VALID foreign keys on partitioned tables, so
+    # they go on every leaf partition instead
+    leaves = [partition for partition, _bound in list_partitions(table)] or [table]
+    for leaf in leaves:
+        cursor.execute(f"ALTER TABLE {leaf} ADD CONSTRAINT {name} {definition} NOT VALID")
+
+
+def restore_foreign_keys(feed, foreign_keys):
+    """
+    Validate the ``NOT VALID`` leaf constraints added inside the swap of
+    ``feed``, then recreate each ``(table, name, definition)`` constraint
+    on the partitioned table, which adopts the validated leaf constraints
+    instead of scanning again. Runs after the swap committed: VALIDATE only
+    takes SHARE UPDATE EXCLUSIVE on the leaf, so reads and writes go on
+    while the localizations are checked. Localizations written for removed
+    accommodations before the swap took its locks are deleted first. Safe
+    to run again after a failure.
+    """
+    with connection.cursor() as cursor:
+        cursor.execute(ORPHANED_LOCALIZATIONS_SQL.format(table=ACCOMMODATION_TABLE), [_feed_value(feed)])
+        for table, name, definition in foreign_keys:
+            cursor.execute(UNVALIDATED_LEAVES_SQL, [name, ACCOMMODATION_TABLE])
+            for (leaf,) in cursor.fetchall():
+                cursor.execute(f"ALTER TABLE {leaf} VALIDATE CONSTRAINT {name}")
+            cursor.execute(
+                "SELECT 1 FROM pg_constraint WHERE conrelid = %s::regclass AND conname = %s",
+                [table, name])
+            if cursor.fetchone() is None:
+                cursor.execute(f"ALTER TABLE {table} ADD CONSTRAINT {name} {definition}")
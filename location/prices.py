@@ -0,0 +1,161 @@
+from django.db import connection
+
+from .partitions import ACCOMMODATION_TABLE, PRICE_TABLE
+
+# Columns whose change starts a new history row
+TRACKED = ('usd_rate', 'published', 'location_id')
+
+RECORD_SQL = f"""
+    INSERT INTO {PRICE_TABLE} (accommodation_id, feed, location_id, usd_rate, published, changed_at)
+    VALUES (%s, %s, %s, %s, %s, NOW())
+"""
+
+# Opening rows for accommodations without any history, e.g. right after
+# migrating, so every series and monthly average starts somewhere
+SEED_SQL = f"""
+    INSERT INTO {PRICE_TABLE} (accommodation_id, feed, location_id, usd_rate, published, changed_at)
+    SELECT a.id, a.feed, a.location_id, a.usd_rate, a.published, NOW()
+    FROM {ACCOMMODATION_TABLE} a
+    WHERE {{where}}
+      AND NOT EXISTS (
+          SELECT 1 FROM {PRICE_TABLE} h WHERE h.accommodation_id = a.id AND h.feed = a.feed
+      )
+"""
+
+# Rows of one accommodation, with the one in effect at the start of the
+# range first. Both halves are index range scans.
+HISTORY_SQL = f"""
+    SELECT changed_at, usd_rate, published, location_id
+    FROM (
+        (SELECT id, changed_at, usd_rate, published, location_id
+         FROM {PRICE_TABLE}
+         WHERE accommodation_id = %(id)s AND feed = %(feed)s AND changed_at < %(since)s
+         ORDER BY changed_at DESC, id DESC
+         LIMIT 1)
+        UNION ALL
+        SELECT id, changed_at, usd_rate, published, location_id
+        FROM {PRICE_TABLE}
+        WHERE accommodation_id = %(id)s AND feed = %(feed)s
+          AND changed_at >= %(since)s AND changed_at < %(until)s
+    ) rows
+    ORDER BY changed_at, id
+"""
+
+# Per month, every rate an accommodation had during that month while in
+# the subtree: the one in effect when it began plus those set during it.
+# Each accommodation's rates are averaged first so frequent changes don't
+# weigh more. The history is read once, not per month: the accommodations
+# ever in the subtree, then per accommodation the row in effect at the
+# start (whatever its location, so ones that moved away don't count) and
+# the rows of the range, each in effect until the next one.
+MONTHLY_SQL = f"""
+    WITH locations AS (
+        SELECT id FROM location_location WHERE path && ARRAY[%(location)s]::varchar[]
+    ), candidates AS (
+        SELECT DISTINCT h.accommodation_id, h.feed
+        FROM {PRICE_TABLE} h
+        WHERE h.location_id IN (SELECT id FROM locations)
+          AND h.changed_at < %(end)s::timestamptz + INTERVAL '1 month'
+    ), timeline AS (
+        SELECT r.location_id, r.accommodation_id, r.feed, r.usd_rate, r.changed_at,
+               LEAD(r.changed_at) OVER (
+                   PARTITION BY r.accommodation_id, r.feed ORDER BY r.changed_at, r.id
+               ) AS replaced_at
+        FROM candidates c
+        CROSS JOIN LATERAL (
+            (SELECT h.id, h.accommodation_id, h.feed, h.location_id, h.usd_rate, h.changed_at
+             FROM {PRICE_TABLE} h
+             WHERE h.accommodation_id = c.accommodation_id AND h.feed = c.feed
+               AND h.changed_at < %(start)s::timestamptz
+             ORDER BY h.changed_at DESC, h.id DESC
+             LIMIT 1)
+            UNION ALL
+            SELECT h.id, h.accommodation_id, h.feed, h.location_id, h.usd_rate, h.changed_at
+            FROM {PRICE_TABLE} h
+            WHERE h.accommodation_id = c.accommodation_id AND h.feed = c.feed
+              AND h.changed_at >= %(start)s::timestamptz
+              AND h.changed_at < %(end)s::timestamptz + INTERVAL '1 month'
+        ) r
+    ), rates AS (
+        SELECT m.month, t.accommodation_id, t.feed, AVG(t.usd_rate) AS usd_rate,
+               MIN(t.usd_rate) AS lowest, MAX(t.usd_rate) AS highest
+        FROM generate_series(%(start)s::timestamptz, %(end)s::timestamptz, INTERVAL '1 month') AS m(month)
+        JOIN timeline t
+          ON t.changed_at < m.month + INTERVAL '1 month'
+         AND (t.changed_at >= m.month OR t.replaced_at IS NULL OR t.replaced_at >= m.month)
+        WHERE t.usd_rate IS NOT NULL
+          AND t.location_id IN (SELECT id FROM locations)
+        GROUP BY m.month, t.accommodation_id, t.feed
+    )
+    SELECT month, ROUND(AVG(usd_rate), 2), MIN(lowest), MAX(highest), COUNT(*)
+    FROM rates
+    GROUP BY month
+    ORDER BY month
+"""
+
+
+def price_sql(source, previous=None, usd_rate='w.usd_rate', published='w.published',
+              location_id='w.location_id'):
+    """
+    ``INSERT`` of a history row for every row of ``source`` (a table or CTE
+    with ``id`` and ``feed``), for bulk statements to run in a CTE of their
+    own, aliased ``w``. With ``previous``, a table of the values before the
+    statement joined on ``id``, only rows whose ``TRACKED`` values changed
+    are written. The value arguments are SQL expressions over ``w``.
+    """
+    sql = (f"INSERT INTO {PRICE_TABLE} (accommodation_id, feed, location_id, usd_rate, published, changed_at) "
+           f"SELECT w.id, w.feed, {location_id}, {usd_rate}, {published}, NOW() FROM {source} w")
+    if previous:
+        sql += (f" LEFT JOIN {previous} p ON p.id = w.id"
+                f" WHERE p.id IS NULL OR ({', '.join(f'p.{c}' for c in TRACKED)})"
+                f" IS DISTINCT FROM ({', '.join(f'w.{c}' for c in TRACKED)})")
+    return sql
+
+
+def record_price(accommodation, deleted=False):
+    """Append the current rate of ``accommodation``, or its end when ``deleted``."""
+    with connection.cursor() as cursor:
+        cursor.execute(RECORD_SQL, [
+            accommodation.pk, accommodation.feed, accommodation.location_id_id,
+            None if deleted else accommodation.usd_rate, False if deleted else accommodation.published,
+        ])
+
+
+def seed_prices(feed=None):
+    """Write the current rate of every accommodation (of ``feed``) that has no history yet."""
+    where, params = "TRUE", []
+    if feed is not None:
+        where, params = "a.feed = %s", [feed]
+    with connection.cursor() as cursor:
+        cursor.execute(SEED_SQL.format(where=where), params)
+        return cursor.rowcount
+
+
+def price_history(accommodation_id, feed, since, until):
+    """
+    ``{'at', 'usd_rate', 'published', 'location_id'}`` of every change of
+    the accommodation between the datetimes ``since`` and ``until``,
+    preceded by the values in effect at ``since``. ``usd_rate`` is None
+    from the moment the accommodation was deleted.
+    """
+    with connection.cursor() as cursor:
+        cursor.execute(HISTORY_SQL, {'id': accommodation_id, 'feed': feed, 'since': since, 'until': until})
+        return [
+            {'at': changed_at, 'usd_rate': usd_rate, 'published': published, 'location_id': location_id}
+            for changed_at, usd_rate, published, location_id in cursor.fetchall()
+        ]
+
+
+def monthly_prices(location_id, start, end):
+    """
+    ``{'month', 'avg_usd_rate', 'min_usd_rate', 'max_usd_rate',
+    'accommodations'}`` for each month from ``start`` to ``end`` (first
+    days of months) with rates at ``location_id`` or anywhere below it.
+    """
+    with connection.cursor() as cursor:
+        cursor.execute(MONTHLY_SQL, {'location': location_id, 'start': start, 'end': end})
+        return [
+            {'month': month, 'avg_usd_rate': avg, 'min_usd_rate': low, 'max_usd_rate': high,
+             'accommodations': count}
+            for month, avg, low, high, count in cursor.fetchall()
+        ]
@@ -0,0 +1,125 @@
+import threading
+import time
+
+from django.contrib.auth.models import Group, User
+
+from .cache import cache_delete, cache_get, cache_set, get_cache
+
+PROPERTY_OWNERS = "Property Owners"
+
+# Seconds a process trusts its own copy before asking the shared cache. The
+# signals in ``location.signals`` clear the shared cache and this process's
+# copy; other processes pick changes up within this window.
+LOCAL_TTL = 30
+SHARED_TIMEOUT = 60 * 60
+
+GROUP_KEY = f"location:roles:group:{PROPERTY_OWNERS}"
+GENERATION_KEY = "location:roles:generation"
+# Cached in place of None, which the cache can't tell apart from a miss
+MISSING = 0
+
+_lock = threading.Lock()
+_local = {}
+
+
+def _local_get(key):
+    entry = _local.get(key)
+    if entry is not None and entry[0] > time.monotonic():
+        return entry[1]
+    return None
+
+
+def _local_set(key, value):
+    with _lock:
+        _local[key] = (time.monotonic() + LOCAL_TTL, value)
+
+
+def _cached(key, compute):
+    value = _local_get(key)
+    if value is None:
+        value = cache_get(key)
+        if value is None:
+            value = compute()
+            cache_set(key, value, SHARED_TIMEOUT)
+        _local_set(key, value)
+    return value
+
+
+def property_owners_group_id(create=False):
+    """Id of the Property Owners group, or None if it doesn't exist and ``create`` is False."""
+    group_id = _cached(GROUP_KEY, lambda: Group.objects.filter(
+        name=PROPERTY_OWNERS).values_list('pk', flat=True).first() or MISSING)
+    if group_id == MISSING and create:
+        group_id = Group.objects.get_or_create(name=PROPERTY_OWNERS)[0].pk
+        cache_set(GROUP_KEY, group_id, SHARED_TIMEOUT)
+        _local_set(GROUP_KEY, group_id)
+    return group_id or None
+
+
+def _generation():
+    # Part of every membership key, so one bump drops them all. Never
+    # expires, or old keys could come back into use.
+    generation = _local_get(GENERATION_KEY)
+    if generation is None:
+        generation = get_cache().get_or_set(GENERATION_KEY, 1, None)
+        _local_set(GENERATION_KEY, generation)
+    return generation
+
+
+def _membership_key(user_id):
+    return f"location:roles:owner:{_generation()}:{user_id}"
+
+
+def is_property_owner(user):
+    """Whether ``user`` belongs to the Property Owners group."""
+    if not user.is_authenticated:
+        return False
+    group_id = property_owners_group_id()
+    if group_id is None:
+        return False
+    return _cached(_membership_key(user.pk), lambda: User.groups.through.objects.filter(
+        user_id=user.pk, group_id=group_id).exists())
+
+
+def invalidate_user(user_id):
+    key = _membership_key(user_id)
+    cache_delete(key)
+    with _lock:
+        _local.pop(key, None)
+
+
+def invalidate_groups():
+    """Forget the group id and every cached membership."""
+    try:
+        get_cache().incr(GENERATION_KEY)
+    except ValueError:
+        get_cache().set(GENERATION_KEY, 2, None)
+    cache_delete(GROUP_KEY)
+    with _lock:
+        _local.clear()
+
+
+class RequestRoles:
+    """Role checks for one request, each resolved at most once."""
+
+    def __init__(self, user):
+        self.user = user
+        self._property_owner = None
+
+    @property
+    def is_property_owner(self):
+        if self._property_owner is None:
+            self._property_owner = is_property_owner(self.user)
+        return self._property_owner
+
+    def owns(self, accommodation):
+        # Compare the raw column so the check never loads the owner
+        return accommodation.user_id_id == self.user.pk
+
+
+def request_roles(request):
+    """The ``RequestRoles`` memo of ``request``, created on first use."""
+    roles = getattr(request, '_location_roles', None)
+    if roles is None or roles.user is not request.user:
+        roles = request._location_roles = RequestRoles(request.user)
+    return roles
@@ -0,0 +1,131 @@
+from django.db import connection, transaction
+
+from .cache import bump_version_on_commit
+from .models import LocationStats
+
+STATS_TABLE = "location_locationstats"
+PENDING_TABLE = "location_pendinglocationstats"
+LEVELS_TABLE = "location_stats_levels"
+
+# Aggregates of the accommodations attached directly to each location in
+# the seed set. Locations without accommodations get zeros.
+DIRECT_SQL = f"""
+    INSERT INTO {STATS_TABLE} (
+        location_id, direct_count, direct_published, direct_usd_rate_sum,
+        direct_review_score_sum, accommodation_count, published_count,
+        usd_rate_sum, review_score_sum, updated_at
+    )
+    SELECT l.id, COUNT(a.id), COUNT(a.id) FILTER (WHERE a.published),
+           COALESCE(SUM(a.usd_rate), 0), COALESCE(SUM(a.review_score), 0),
+           0, 0, 0, 0, NOW()
+    FROM location_location l
+    LEFT JOIN location_accommodation a ON a.location_id = l.id
+    WHERE {{where}}
+    GROUP BY l.id
+    ON CONFLICT (location_id) DO UPDATE SET
+        direct_count = EXCLUDED.direct_count,
+        direct_published = EXCLUDED.direct_published,
+        direct_usd_rate_sum = EXCLUDED.direct_usd_rate_sum,
+        direct_review_score_sum = EXCLUDED.direct_review_score_sum,
+        updated_at = EXCLUDED.updated_at
+"""
+
+# Every seed location plus all of its ancestors, with its depth below the
+# root. Depth is capped so a parent cycle cannot loop forever.
+LEVELS_SQL = f"""
+    CREATE TEMP TABLE {LEVELS_TABLE} ON COMMIT DROP AS
+    WITH RECURSIVE chain AS (
+        SELECT id, parent_id_id FROM location_location WHERE {{where}}
+        UNION
+        SELECT l.id, l.parent_id_id
+        FROM location_location l
+        JOIN chain ON l.id = chain.parent_id_id
+    ), up AS (
+        SELECT id AS node, parent_id_id AS ancestor, 0 AS depth FROM chain
+        UNION ALL
+        SELECT up.node, l.parent_id_id, up.depth + 1
+        FROM up
+        JOIN location_location l ON l.id = up.ancestor
+        WHERE up.depth < 50
+    )
+    SELECT node AS id, MAX(depth) AS depth FROM up GROUP BY node
+"""
+
+# Rolled-up totals for one depth level: own accommodations plus the already
+# rolled-up totals of the children.
+ROLLUP_SQL = f"""
+    UPDATE {STATS_TABLE} s SET
+        accommodation_count = s.direct_count + c.accommodation_count,
+        published_count = s.direct_published + c.published_count,
+        usd_rate_sum = s.direct_usd_rate_sum + c.usd_rate_sum,
+        review_score_sum = s.direct_review_score_sum + c.review_score_sum,
+        updated_at = NOW()
+    FROM (
+        SELECT lv.id,
+               COALESCE(SUM(cs.accommodation_count), 0) AS accommodation_count,
+               COALESCE(SUM(cs.published_count), 0) AS published_count,
+               COALESCE(SUM(cs.usd_rate_sum), 0) AS usd_rate_sum,
+               COALESCE(SUM(cs.review_score_sum), 0) AS review_score_sum
+        FROM {LEVELS_TABLE} lv
+        LEFT JOIN location_location child ON child.parent_id_id = lv.id
+        LEFT JOIN {STATS_TABLE} cs ON cs.location_id = child.id
+        WHERE lv.depth = %s
+        GROUP BY lv.id
+    ) c
+    WHERE s.location_id = c.id
+"""
+
+
+def mark_dirty(location_ids):
+    """Queue locations for the next ``refresh_location_stats``."""
+    location_ids = {location_id for location_id in location_ids if location_id}
+    if not location_ids:
+        return
+    with connection.cursor() as cursor:
+        cursor.execute(
+            f"INSERT INTO {PENDING_TABLE} (location_id) SELECT unnest(%s::varchar[]) "
+            f"ON CONFLICT DO NOTHING",
+            [sorted(location_ids)],
+        )
+
+
+def refresh_location_stats(full=False):
+    """
+    Recompute ``LocationStats`` for the queued locations and their ancestors.
+
+    Direct aggregates are recomputed only for the queued locations (and for
+    ancestors that have no stats row yet), then the rolled-up totals are
+    rebuilt bottom-up, one UPDATE per depth level, for the queued locations
+    and everything above them. ``full`` recomputes every location; run it
+    once to initialise the table. Returns the number of locations whose
+    rolled-up totals were refreshed.
+    """
+    with transaction.atomic(), connection.cursor() as cursor:
+        # ON COMMIT DROP only fires at the outermost commit, so a refresh run
+        # inside a caller's transaction still sees the previous levels table
+        cursor.execute(f"DROP TABLE IF EXISTS {LEVELS_TABLE}")
+        if full:
+            cursor.execute(f"DELETE FROM {PENDING_TABLE}")
+            cursor.execute(DIRECT_SQL.format(where="TRUE"))
+            cursor.execute(LEVELS_SQL.format(where="TRUE"))
+        else:
+            cursor.execute(f"DELETE FROM {PENDING_TABLE} RETURNING location_id")
+            pending = [row[0] for row in cursor.fetchall()]
+            if not pending:
+                return 0
+            cursor.execute(DIRECT_SQL.format(where="l.id = ANY(%s)"), [pending])
+            cursor.execute(LEVELS_SQL.format(where="id = ANY(%s)"), [pending])
+            cursor.execute(DIRECT_SQL.format(
+                where=f"l.id IN (SELECT lv.id FROM {LEVELS_TABLE} lv "
+                      f"WHERE NOT EXISTS (SELECT 1 FROM {STATS_TABLE} s WHERE s.location_id = lv.id))"
+            ))
+
+        cursor.execute(f"SELECT DISTINCT depth FROM {LEVELS_TABLE} ORDER BY depth DESC")
+        for (depth,) in cursor.fetchall():
+            cursor.execute(ROLLUP_SQL, [depth])
+        cursor.execute(f"SELECT COUNT(*) FROM {LEVELS_TABLE}")
+        refreshed = cursor.fetchone()[0]
+        cursor.execute(f"DROP TABLE {LEVELS_TABLE}")
+        if refreshed:
+            bump_version_on_commit(LocationStats)
+        return refreshed
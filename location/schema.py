@@ -0,0 +1,180 @@
+import json
+
+from django.db import connection, transaction
+from django.utils import timezone
+
+from .models import Accommodation, LocalizeAccommodation, PriceHistory
+from .partitions import (
+    ACCOMMODATION_TABLE, LOCALIZE_TABLE, PRICE_TABLE, feed_partition_name, language_partition_name,
+    list_partitions, month_partition_name, next_month,
+)
+
+COLUMN_TYPES_SQL = """
+    SELECT attname, format_type(atttypid, atttypmod)
+    FROM pg_attribute
+    WHERE attrelid = %s::regclass AND attnum > 0 AND NOT attisdropped
+"""
+
+LEADING_INDEX_COLUMNS_SQL = """
+    SELECT a.attname
+    FROM pg_index i
+    JOIN pg_attribute a ON a.attrelid = i.indrelid AND a.attnum = i.indkey[0]
+    WHERE i.indrelid = %s::regclass
+"""
+
+# Columns that may differ from the model. language is the partition key of
+# location_localizeaccommodation, which PostgreSQL won't let us retype.
+TYPE_EXCEPTIONS = {
+    (LOCALIZE_TABLE, 'language'): 'char(2)',
+}
+
+# Every accommodation partition needs an index led by each of these
+REQUIRED_INDEXES = {
+    ACCOMMODATION_TABLE: ('location_id', 'user_id', 'country_code', 'published'),
+    PRICE_TABLE: ('accommodation_id', 'location_id'),
+}
+
+# (description, SQL, params, relations the plan may touch or None for any).
+# Params are substituted client-side, so the planner sees constants and can
+# prune partitions at plan time.
+PLAN_CHECKS = [
+    (
+        "accommodations of a location",
+        f"SELECT a.id FROM location_location l "
+        f"JOIN {ACCOMMODATION_TABLE} a ON a.location_id = l.id WHERE l.id = %s",
+        lambda feed, language: ['1'],
+        None,
+    ),
+    (
+        "accommodations of an owner",
+        f"SELECT a.id FROM {ACCOMMODATION_TABLE} a WHERE a.user_id = %s",
+        lambda feed, language: [1],
+        None,
+    ),
+    (
+        "accommodation by key",
+        f"SELECT a.title FROM {ACCOMMODATION_TABLE} a WHERE a.id = %s AND a.feed = %s",
+        lambda feed, language: ['1', feed],
+        lambda feed, language: {feed_partition_name(feed)},
+    ),
+    (
+        "localization of an accommodation",
+        f"SELECT l.description FROM {ACCOMMODATION_TABLE} a "
+        f"JOIN {LOCALIZE_TABLE} l ON l.property_id = a.id AND l.feed = a.feed "
+        f"WHERE a.id = %s AND a.feed = %s AND l.language = %s",
+        lambda feed, language: ['1', feed, language],
+        lambda feed, language: {feed_partition_name(feed), language_partition_name(language)},
+    ),
+    (
+        "title search",
+        f"SELECT a.id FROM {ACCOMMODATION_TABLE} a "
+        f"WHERE a.feed = %s AND a.search_vector @@ websearch_to_tsquery('simple', %s)",
+        lambda feed, language: [feed, 'beach'],
+        lambda feed, language: {feed_partition_name(feed)},
+    ),
+    (
+        "description search",
+        f"SELECT l.property_id FROM {LOCALIZE_TABLE} l WHERE l.language = %s "
+        f"AND l.search_vector @@ websearch_to_tsquery(location_search_config(%s), %s)",
+        lambda feed, language: [language, language, 'beach'],
+        lambda feed, language: {language_partition_name(language)},
+    ),
+    (
+        "price history of an accommodation this month",
+        f"SELECT h.usd_rate FROM {PRICE_TABLE} h WHERE h.accommodation_id = %s AND h.feed = %s "
+        f"AND h.changed_at >= %s AND h.changed_at < %s",
+        lambda feed, language: ['1', feed, timezone.now().date().replace(day=1),
+                                next_month(timezone.now())],
+        lambda feed, language: {month_partition_name(timezone.now())},
+    ),
+]
+
+
+def _normalize_type(db_type):
+    db_type = db_type.lower().replace('character varying', 'varchar').replace('character', 'char')
+    return db_type.replace(' ', '')
+
+
+def _tables(parent):
+    return [parent] + [name for name, _bound in list_partitions(parent)]
+
+
+def check_column_types():
+    """Columns whose type differs from what the model's fields expect."""
+    problems = []
+    with connection.cursor() as cursor:
+        for model in (Accommodation, LocalizeAccommodation, PriceHistory):
+            parent = model._meta.db_table
+            expected = {
+                field.column: field.db_type(connection)
+                for field in model._meta.concrete_fields
+            }
+            for table in _tables(parent):
+                cursor.execute(COLUMN_TYPES_SQL, [table])
+                actual = dict(cursor.fetchall())
+                for column, db_type in expected.items():
+                    db_type = TYPE_EXCEPTIONS.get((parent, column), db_type)
+                    if column not in actual:
+                        problems.append(f"{table}.{column} is missing")
+                    elif _normalize_type(actual[column]) != _normalize_type(db_type):
+                        problems.append(
+                            f"{table}.{column} is {actual[column]}, the model expects {db_type}")
+    return problems
+
+
+def check_indexes():
+    """Partitions lacking an index led by one of ``REQUIRED_INDEXES``."""
+    problems = []
+    with connection.cursor() as cursor:
+        for parent, columns in REQUIRED_INDEXES.items():
+            for table in _tables(parent):
+                cursor.execute(LEADING_INDEX_COLUMNS_SQL, [table])
+                indexed = {row[0] for row in cursor.fetchall()}
+                for column in columns:
+                    if column not in indexed:
+                        problems.append(f"{table} has no index on {column}")
+    return problems
+
+
+def _plan_scans(plan):
+    # (node type, relation) for every node of an EXPLAIN (FORMAT JSON) plan
+    if 'Relation Name' in plan:
+        yield plan['Node Type'], plan['Relation Name']
+    for child in plan.get('Plans', ()):
+        yield from _plan_scans(child)
+
+
+def explain(sql, params):
+    """Return the ``(node type, relation)`` scans of the plan of ``sql``."""
+    with connection.cursor() as cursor:
+        cursor.execute(f"EXPLAIN (FORMAT JSON) {sql}", params)
+        plan = cursor.fetchone()[0]
+    if isinstance(plan, str):
+        plan = json.loads(plan)
+    return list(_plan_scans(plan[0]['Plan']))
+
+
+def check_query_plans(feed=0, language='en'):
+    """
+    EXPLAIN the common joins and report sequential scans and partitions the
+    planner failed to prune. Sequential scans are disabled for the check so
+    small or empty tables still show whether an index *can* be used.
+    Returns ``(description, problems)`` pairs.
+    """
+    results = []
+    with transaction.atomic(), connection.cursor() as cursor:
+        cursor.execute("SET LOCAL enable_seqscan = off")
+        try:
+            for description, sql, params, allowed in PLAN_CHECKS:
+                problems = []
+                allowed = allowed(feed, language) if allowed else None
+                for node_type, relation in explain(sql, params(feed, language)):
+                    if node_type == 'Seq Scan':
+                        problems.append(f"sequential scan on {relation}")
+                    if allowed is not None and relation not in allowed:
+                        problems.append(f"{relation} was not pruned")
+                results.append((description, problems))
+        finally:
+            # SET LOCAL outlives the savepoint when called inside a transaction
+            cursor.execute("RESET enable_seqscan")
+    return results
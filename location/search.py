@@ -0,0 +1,69 @@
+from django.db import connection
+from django.db.models import BooleanField, FloatField
+from django.db.models.expressions import RawSQL
+
+from .partitions import ACCOMMODATION_TABLE, LOCALIZE_TABLE
+
+# GIN indexes over the generated search_vector columns (migration 0011)
+ACCOMMODATION_SEARCH_INDEX = "location_accommodation_search_idx"
+LOCALIZE_SEARCH_INDEX = "location_localizeaccommodation_search_idx"
+
+# A title match counts this much more than a description match
+TITLE_WEIGHT = 2.0
+
+# Accommodations whose title or description in the language matches. Each
+# branch is a GIN lookup of its own; the language is a constant, so only
+# one localization partition is searched.
+MATCH_SQL = f"""
+    ({ACCOMMODATION_TABLE}.id, {ACCOMMODATION_TABLE}.feed) IN (
+        SELECT id, feed FROM {ACCOMMODATION_TABLE}
+        WHERE search_vector @@ websearch_to_tsquery('simple', %s)
+        UNION
+        SELECT property_id, feed FROM {LOCALIZE_TABLE}
+        WHERE language = %s
+          AND search_vector @@ websearch_to_tsquery(location_search_config(%s), %s)
+    )
+"""
+
+RANK_SQL = f"""
+    {TITLE_WEIGHT} * ts_rank({ACCOMMODATION_TABLE}.search_vector, websearch_to_tsquery('simple', %s))
+    + COALESCE((
+        SELECT ts_rank(l.search_vector, websearch_to_tsquery(location_search_config(%s), %s))
+        FROM {LOCALIZE_TABLE} l
+        WHERE l.property_id = {ACCOMMODATION_TABLE}.id AND l.feed = {ACCOMMODATION_TABLE}.feed
+          AND l.language = %s
+    ), 0)
+"""
+
+# The partition's own index attached to the parent's search index
+PARTITION_SEARCH_INDEX_SQL = """
+    SELECT gin_clean_pending_list(i.indexrelid)
+    FROM pg_index i
+    JOIN pg_inherits h ON h.inhrelid = i.indexrelid
+    WHERE i.indrelid = %s::regclass AND h.inhparent = %s::regclass
+"""
+
+
+def search_accommodations(queryset, query, language):
+    """
+    Filter an ``Accommodation`` queryset to rows whose title, or description
+    in ``language``, matches ``query`` (web search syntax: quotes, ``or``,
+    ``-``), annotated with ``rank`` and ordered by it.
+    """
+    match = RawSQL(MATCH_SQL, [query, language, language, query], output_field=BooleanField())
+    rank = RawSQL(RANK_SQL, [query, language, query, language], output_field=FloatField())
+    return queryset.filter(match).annotate(rank=rank).order_by('-rank', '-created_at', 'id')
+
+
+def flush_search_index(partition):
+    """
+    Merge the GIN pending list of the search index of accommodation
+    ``partition`` into the index. Bulk upserts append new entries to the
+    pending list cheaply; flushing once after the load keeps searches from
+    scanning a long unsorted list until autovacuum gets to it. Returns the
+    number of pending pages merged.
+    """
+    with connection.cursor() as cursor:
+        cursor.execute(PARTITION_SEARCH_INDEX_SQL, [partition, ACCOMMODATION_SEARCH_INDEX])
+        row = cursor.fetchone()
+    return row[0] if row else 0
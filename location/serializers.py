@@ -1,8 +1,11 @@
 from rest_framework import serializers
 
 # Create your tests here.
-from django.contrib.auth.models import User, Group
+from django.contrib.auth.models import User
 from rest_framework import serializers
+from .localization import pick_localized
+from .models import Accommodation, AccommodationListing, Location, LocationStats
+from .roles import property_owners_group_id
 
 class UserSerializer(serializers.ModelSerializer):
     class Meta:
@@ -19,7 +22,107 @@ class UserSerializer(serializers.ModelSerializer):
             email=validated_data['email'],
             password=validated_data['password']
         )
-        # Add user to the "Property Owners" group
-        property_owners_group, created = Group.objects.get_or_create(name="Property Owners")
-        user.groups.add(property_owners_group)
-        return user
\ No newline at end of file
+        # Add user to the "Property Owners" group; the id is cached
+        user.groups.add(property_owners_group_id(create=True))
+        return user
+
+class AccommodationListSerializer(serializers.ModelSerializer):
+    # Read the raw FK column so serializing a page never fetches Location rows
+    location_id = serializers.CharField(source='location_id_id', read_only=True)
+    lat = serializers.FloatField(source='center.y', read_only=True)
+    lon = serializers.FloatField(source='center.x', read_only=True)
+
+    class Meta:
+        model = Accommodation
+        fields = ['id', 'feed', 'title', 'country_code', 'bedroom_count', 'review_score',
+                  'usd_rate', 'location_id', 'lat', 'lon', 'amenities', 'created_at']
+        read_only_fields = fields
+
+
+class LocalizedAccommodationSerializer(AccommodationListSerializer):
+    # Looked up for the whole page at once by location.localization
+    localized = serializers.SerializerMethodField()
+
+    class Meta(AccommodationListSerializer.Meta):
+        fields = AccommodationListSerializer.Meta.fields + ['localized']
+        read_only_fields = fields
+
+    def get_localized(self, obj):
+        return self.context.get('localized', {}).get((obj.id, obj.feed))
+
+
+class AccommodationSearchSerializer(LocalizedAccommodationSerializer):
+    rank = serializers.FloatField(read_only=True)
+
+    class Meta(LocalizedAccommodationSerializer.Meta):
+        fields = LocalizedAccommodationSerializer.Meta.fields + ['rank']
+        read_only_fields = fields
+
+
+class AccommodationListingSerializer(serializers.ModelSerializer):
+    # The fields of AccommodationListSerializer plus the display fields
+    id = serializers.CharField(source='accommodation_id', read_only=True)
+    lat = serializers.FloatField(source='center.y', read_only=True)
+    lon = serializers.FloatField(source='center.x', read_only=True)
+
+    class Meta:
+        model = AccommodationListing
+        fields = AccommodationListSerializer.Meta.fields + [
+            'country_name', 'location_title', 'breadcrumb', 'primary_image']
+        read_only_fields = fields
+
+
+class LocalizedListingSerializer(AccommodationListingSerializer):
+    # Read from the row itself; no localization lookup
+    localized = serializers.SerializerMethodField()
+
+    class Meta(AccommodationListingSerializer.Meta):
+        fields = AccommodationListingSerializer.Meta.fields + ['localized']
+        read_only_fields = fields
+
+    def get_localized(self, obj):
+        return pick_localized(obj.localized, self.context['language'])
+
+
+class AccommodationGeoSerializer(AccommodationListSerializer):
+    distance_km = serializers.SerializerMethodField()
+
+    class Meta(AccommodationListSerializer.Meta):
+        fields = AccommodationListSerializer.Meta.fields + ['distance_km']
+        read_only_fields = fields
+
+    def get_distance_km(self, obj):
+        distance = getattr(obj, 'distance', None)
+        return round(distance.km, 3) if distance is not None else None
+
+
+class LocationGeoSerializer(serializers.ModelSerializer):
+    parent_id = serializers.CharField(source='parent_id_id', read_only=True)
+    lat = serializers.FloatField(source='center.y', read_only=True)
+    lon = serializers.FloatField(source='center.x', read_only=True)
+    distance_km = serializers.SerializerMethodField()
+
+    class Meta:
+        model = Location
+        fields = ['id', 'title', 'location_type', 'country_code', 'state_abbr', 'city',
+                  'parent_id', 'lat', 'lon', 'distance_km']
+        read_only_fields = fields
+
+    def get_distance_km(self, obj):
+        distance = getattr(obj, 'distance', None)
+        return round(distance.km, 3) if distance is not None else None
+
+
+class LocationStatsSerializer(serializers.ModelSerializer):
+    location_id = serializers.CharField(source='location_id_id', read_only=True)
+    title = serializers.CharField(source='location_id.title', read_only=True)
+    country_code = serializers.CharField(source='location_id.country_code', read_only=True)
+    avg_usd_rate = serializers.DecimalField(max_digits=12, decimal_places=2, read_only=True)
+    avg_review_score = serializers.DecimalField(max_digits=5, decimal_places=2, read_only=True)
+    published_ratio = serializers.FloatField(read_only=True)
+
+    class Meta:
+        model = LocationStats
+        fields = ['location_id', 'title', 'country_code', 'accommodation_count', 'published_count',
+                  'avg_usd_rate', 'avg_review_score', 'published_ratio', 'updated_at']
+        read_only_fields = fields
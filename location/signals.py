@@ -0,0 +1,189 @@
+from decimal import Decimal
+
+from django.contrib.auth.models import Group, User
+from django.conf import settings
+from django.db import transaction
+from django.db.models.signals import m2m_changed, post_delete, post_save, pre_save
+from django.dispatch import receiver
+
+from .cache import bump_version_on_commit
+from .changes import ACCOMMODATION, CREATED, DELETED, LOCALIZATION, LOCATION, UPDATED, record_changes
+from .hierarchy import invalidate_tree, rebuild_paths
+from .images import submit as submit_images
+from .listings import refresh_listings, refresh_location_listings
+from .models import Accommodation, LocalizeAccommodation, Location
+from .prices import record_price
+from .roles import invalidate_groups, invalidate_user
+from .rollups import mark_dirty
+
+
+def _previous_value(sender, instance, attname, **lookups):
+    """Value of ``attname`` currently stored for ``instance``, or None for new rows."""
+    previous = _previous_values(sender, instance, [attname], **lookups)
+    return previous and previous[0]
+
+
+def _previous_values(sender, instance, attnames, **lookups):
+    """Tuple of the ``attnames`` currently stored for ``instance``, or None for new rows."""
+    if instance._state.adding or instance.pk is None:
+        return None
+    rows = sender.objects.filter(pk=instance.pk, **lookups)
+    return rows.values_list(*attnames).first()
+
+
+def _price(instance):
+    rate = instance.usd_rate
+    return (None if rate is None else Decimal(str(rate)), instance.published, instance.location_id_id)
+
+
+@receiver(pre_save, sender=Accommodation)
+def remember_accommodation_state(sender, instance, **kwargs):
+    # Accommodation ids are only unique per feed
+    previous = _previous_values(
+        sender, instance, ['usd_rate', 'published', 'location_id_id'], feed=instance.feed)
+    instance._previous_price = previous
+    instance._previous_location_id = previous and previous[2]
+
+
+@receiver(post_save, sender=Accommodation)
+def accommodation_saved(sender, instance, **kwargs):
+    mark_dirty([instance.location_id_id, getattr(instance, '_previous_location_id', None)])
+
+
+@receiver(post_save, sender=Accommodation)
+def render_accommodation_images(sender, instance, **kwargs):
+    if instance.images and getattr(settings, 'IMAGE_RENDITIONS_ON_SAVE', True):
+        images = list(instance.images)
+        # Only once committed, so a rolled back save renders nothing
+        transaction.on_commit(lambda: submit_images(images))
+
+
+@receiver(post_delete, sender=Accommodation)
+def accommodation_deleted(sender, instance, **kwargs):
+    mark_dirty([instance.location_id_id])
+
+
+@receiver(post_save, sender=Accommodation)
+@receiver(post_delete, sender=Accommodation)
+def refresh_accommodation_listing(sender, instance, **kwargs):
+    refresh_listings([(instance.pk, instance.feed)])
+
+
+@receiver(post_save, sender=LocalizeAccommodation)
+@receiver(post_delete, sender=LocalizeAccommodation)
+def refresh_localized_listing(sender, instance, **kwargs):
+    refresh_listings([(instance.property_id_id, instance.feed)])
+
+
+@receiver(pre_save, sender=Location)
+def remember_location_parent(sender, instance, **kwargs):
+    instance._previous_parent_id = _previous_value(sender, instance, 'parent_id_id')
+    instance._previous_title = _previous_value(sender, instance, 'title')
+    parent_path = []
+    if instance.parent_id_id is not None:
+        parent_path = sender.objects.filter(pk=instance.parent_id_id).values_list(
+            'path', flat=True).first() or []
+    instance.path = parent_path + [instance.pk]
+
+
+@receiver(post_save, sender=Location)
+def location_saved(sender, instance, created, update_fields=None, **kwargs):
+    invalidate_tree()
+    moved = getattr(instance, '_previous_parent_id', None) != instance.parent_id_id
+    path_skipped = update_fields is not None and 'path' not in update_fields
+    if (moved and not created) or path_skipped:
+        # Fixes this row if update_fields left its path out, and re-roots
+        # every descendant
+        rebuild_paths("id = %s", [instance.pk])
+    if moved:
+        # A moved location changes the totals of its old and new ancestors
+        mark_dirty([instance.pk, instance._previous_parent_id])
+    if not created and (moved or getattr(instance, '_previous_title', None) != instance.title):
+        # Breadcrumbs below it show its title; paths are up to date by now
+        refresh_location_listings([instance.pk])
+
+
+@receiver(post_delete, sender=Location)
+def location_deleted(sender, instance, **kwargs):
+    invalidate_tree()
+
+
+@receiver(post_save, sender=Accommodation)
+def record_accommodation_saved(sender, instance, created, **kwargs):
+    record_changes(ACCOMMODATION, CREATED if created else UPDATED, [(instance.pk, instance.feed, '')])
+
+
+@receiver(post_delete, sender=Accommodation)
+def record_accommodation_deleted(sender, instance, **kwargs):
+    record_changes(ACCOMMODATION, DELETED, [(instance.pk, instance.feed, '')])
+
+
+@receiver(post_save, sender=Accommodation)
+def record_accommodation_price(sender, instance, created, **kwargs):
+    # Only changes are kept; see location.prices
+    if created or getattr(instance, '_previous_price', None) != _price(instance):
+        record_price(instance)
+
+
+@receiver(post_delete, sender=Accommodation)
+def record_accommodation_removed_price(sender, instance, **kwargs):
+    record_price(instance, deleted=True)
+
+
+@receiver(post_save, sender=LocalizeAccommodation)
+def record_localization_saved(sender, instance, created, **kwargs):
+    record_changes(LOCALIZATION, CREATED if created else UPDATED,
+                   [(instance.property_id_id, instance.feed, instance.language)])
+
+
+@receiver(post_delete, sender=LocalizeAccommodation)
+def record_localization_deleted(sender, instance, **kwargs):
+    record_changes(LOCALIZATION, DELETED, [(instance.property_id_id, instance.feed, instance.language)])
+
+
+@receiver(post_save, sender=Location)
+def record_location_saved(sender, instance, created, **kwargs):
+    record_changes(LOCATION, CREATED if created else UPDATED, [(instance.pk, None, '')])
+
+
+@receiver(post_delete, sender=Location)
+def record_location_deleted(sender, instance, **kwargs):
+    record_changes(LOCATION, DELETED, [(instance.pk, None, '')])
+
+
+@receiver(post_save, sender=Location)
+@receiver(post_delete, sender=Location)
+@receiver(post_save, sender=Accommodation)
+@receiver(post_delete, sender=Accommodation)
+@receiver(post_save, sender=LocalizeAccommodation)
+@receiver(post_delete, sender=LocalizeAccommodation)
+def bump_cached_version(sender, **kwargs):
+    bump_version_on_commit(sender)
+
+
+def _invalidate_on_commit(invalidate, *args):
+    # Now, so reads later in this transaction miss, and again once it
+    # commits, since another request may have cached the old membership in
+    # the meantime (see ``cache.bump_version_on_commit``)
+    invalidate(*args)
+    transaction.on_commit(lambda: invalidate(*args))
+
+
+@receiver(m2m_changed, sender=User.groups.through)
+def user_groups_changed(sender, instance, action, reverse, pk_set, **kwargs):
+    if action not in ('post_add', 'post_remove', 'post_clear'):
+        return
+    if not reverse:
+        _invalidate_on_commit(invalidate_user, instance.pk)
+    elif pk_set:
+        for user_id in pk_set:
+            _invalidate_on_commit(invalidate_user, user_id)
+    else:
+        # group.user_set.clear() doesn't say which users were affected
+        _invalidate_on_commit(invalidate_groups)
+
+
+@receiver(post_save, sender=Group)
+@receiver(post_delete, sender=Group)
+def group_changed(sender, instance, **kwargs):
+    _invalidate_on_commit(invalidate_groups)
@@ -0,0 +1,216 @@
+import json
+import os
+import re
+from django.db import connection
+
+from .db import streaming_cursor
+
+# Country -> state/province -> city
+MAX_DEPTH = 2
+
+# Walk the whole hierarchy in one query, ordered depth-first by title so the
+# sitemap can be written row by row without holding the tree in memory.
+TREE_SQL = """
+    WITH RECURSIVE tree AS (
+        SELECT id, title, country_code, 0 AS depth,
+               ARRAY[title::text, id::text] AS sort_path
+        FROM location_location
+        WHERE location_type = 'country' {country_filter}
+        UNION ALL
+        SELECT child.id, child.title, child.country_code, tree.depth + 1,
+               tree.sort_path || ARRAY[child.title::text, child.id::text]
+        FROM location_location child
+        JOIN tree ON child.parent_id_id = tree.id
+        WHERE tree.depth < %s
+    )
+    SELECT id, title, country_code, depth FROM tree ORDER BY sort_path
+"""
+
+# Size and a checksum of what the sitemap shows of each country's subtree,
+# used to decide which shards an incremental run has to rebuild. Groups the
+# locations by the root of their ``path`` in one pass instead of walking the
+# tree. Unlike an updated_at high-water mark, the checksum also catches rows
+# that committed late with an older timestamp.
+SUBTREE_STATS_SQL = """
+    WITH subtree AS (
+        SELECT path[1] AS root, COUNT(*) AS rows,
+               SUM(hashtextextended(concat_ws('/', title, country_code, array_to_string(path, '/')), 0)) AS checksum
+        FROM location_location
+        WHERE cardinality(path) BETWEEN 1 AND %s
+        GROUP BY path[1]
+    )
+    SELECT country.id, country.title, country.country_code, subtree.rows, subtree.checksum::text
+    FROM location_location country
+    JOIN subtree ON subtree.root = country.id
+    WHERE country.location_type = 'country'
+    ORDER BY country.title, country.id
+"""
+
+INDEX_FILE = "index.json"
+
+
+def slugify_title(title):
+    return title.lower().replace(' ', '-')
+
+
+def iter_tree(country_ids=None):
+    """
+    Yield ``(id, title, country_code, depth)`` for every country and its
+    descendants down to ``MAX_DEPTH``, in sitemap order.
+    """
+    params = []
+    country_filter = ""
+    if country_ids is not None:
+        country_filter = "AND id = ANY(%s)"
+        params.append(list(country_ids))
+    params.append(MAX_DEPTH)
+
+    with streaming_cursor() as cursor:
+        cursor.execute(TREE_SQL.format(country_filter=country_filter), params)
+        yield from cursor
+
+
+class SitemapWriter:
+    """
+    Incrementally writes the sitemap JSON document. Countries are opened one
+    at a time and their locations appended as they arrive, so memory use does
+    not grow with the size of the tree.
+    """
+
+    def __init__(self, fp):
+        self.fp = fp
+        self.countries = 0
+        self.locations = 0
+
+    def __enter__(self):
+        self.fp.write("[")
+        return self
+
+    def __exit__(self, exc_type, exc, tb):
+        if exc_type is None:
+            self.close()
+
+    def open_country(self, title, slug):
+        self._close_country()
+        self.fp.write(",\n" if self.countries else "\n")
+        self.fp.write(
+            f"    {{\n        {json.dumps(title)}: {json.dumps(slug)},\n"
+            f'        "locations": ['
+        )
+        self.countries += 1
+        self.locations = 0
+
+    def add_location(self, title, slug):
+        self.fp.write(",\n" if self.locations else "\n")
+        self.fp.write(f"            {{{json.dumps(title)}: {json.dumps(slug)}}}")
+        self.locations += 1
+
+    def _close_country(self):
+        if self.countries:
+            self.fp.write("\n        ]\n    }" if self.locations else "]\n    }")
+
+    def close(self):
+        self._close_country()
+        self.fp.write("\n]\n" if self.countries else "]\n")
+
+
+def write_sitemap(fp, country_ids=None):
+    """
+    Stream the sitemap for all countries (or only ``country_ids``) to ``fp``.
+    Returns the number of location rows written.
+    """
+    rows = 0
+    slugs = [None] * (MAX_DEPTH + 1)
+    with SitemapWriter(fp) as writer:
+        for _id, title, country_code, depth in iter_tree(country_ids):
+            if depth == 0:
+                slugs[0] = country_code.lower()
+                writer.open_country(title, slugs[0])
+            else:
+                slugs[depth] = f"{slugs[depth - 1]}/{slugify_title(title)}"
+                writer.add_location(title, slugs[depth])
+            rows += 1
+    return rows
+
+
+def shard_file_name(country_id):
+    return "country-%s.json" % re.sub(r"[^A-Za-z0-9_-]", "_", str(country_id))
+
+
+def _replace_file(path, write):
+    """Write a file through a temporary sibling so readers never see it half-written."""
+    tmp_path = f"{path}.tmp"
+    with open(tmp_path, "w", encoding="utf-8") as f:
+        result = write(f)
+    os.replace(tmp_path, path)
+    return result
+
+
+def load_index(shard_dir):
+    try:
+        with open(os.path.join(shard_dir, INDEX_FILE), encoding="utf-8") as f:
+            return json.load(f)
+    except FileNotFoundError:
+        return {"countries": []}
+
+
+def update_shards(shard_dir, full=False):
+    """
+    Bring the per-country sitemap shards in ``shard_dir`` up to date.
+
+    A country's shard is rebuilt when the location count or the checksum of
+    its subtree differs from the one recorded in the index (see
+    ``SUBTREE_STATS_SQL``), or with ``full``. Shards of deleted countries
+    are removed. Returns a summary dict.
+    """
+    os.makedirs(shard_dir, exist_ok=True)
+    index = load_index(shard_dir)
+    previous = {entry["id"]: entry for entry in index["countries"]}
+
+    with connection.cursor() as cursor:
+        cursor.execute(SUBTREE_STATS_SQL, [MAX_DEPTH + 1])
+        stats = cursor.fetchall()
+
+    countries = []
+    changed = []
+    for country_id, title, country_code, rows, checksum in stats:
+        entry = {
+            "id": country_id,
+            "title": title,
+            "slug": country_code.lower(),
+            "file": shard_file_name(country_id),
+            "rows": rows,
+            "checksum": checksum,
+        }
+        old = previous.get(country_id)
+        if (full or old is None or old["rows"] != rows or old["file"] != entry["file"]
+                or old.get("checksum") != checksum):
+            changed.append(entry)
+        countries.append(entry)
+
+    written_bytes = 0
+    for entry in changed:
+        path = os.path.join(shard_dir, entry["file"])
+        _replace_file(path, lambda f: write_sitemap(f, [entry["id"]]))
+        written_bytes += os.path.getsize(path)
+
+    current_files = {entry["file"] for entry in countries}
+    removed = [entry for entry in previous.values() if entry["file"] not in current_files]
+    for entry in removed:
+        try:
+            os.remove(os.path.join(shard_dir, entry["file"]))
+        except FileNotFoundError:
+            pass
+
+    index = {"countries": countries}
+    index_path = os.path.join(shard_dir, INDEX_FILE)
+    _replace_file(index_path, lambda f: json.dump(index, f, indent=4))
+    written_bytes += os.path.getsize(index_path)
+
+    return {
+        "countries": len(countries),
+        "rebuilt": len(changed),
+        "removed": len(removed),
+        "rows": sum(entry["rows"] for entry in changed),
+        "bytes": written_bytes,
+    }
@@ -3,4 +3,28 @@ from .views import *
 
 urlpatterns = [
     path('sign_up', UserSignUpView.as_view(), name='sign_up'), 
+    path('api/accommodations/', AccommodationListView.as_view(), name='accommodation_list'),
+    path('api/accommodations/nearby/', AccommodationNearbyView.as_view(), name='accommodation_nearby'),
+    path('api/accommodations/within/', AccommodationWithinView.as_view(), name='accommodation_within'),
+    path('api/accommodations/search/', AccommodationSearchView.as_view(), name='accommodation_search'),
+    path('api/accommodations/<str:id>/images/', AccommodationImagesView.as_view(), name='accommodation_images'),
+    path('images/<path:path>', ImageView.as_view(), name='image'),
+    path('api/accommodations/<str:id>/prices/', AccommodationPricesView.as_view(), name='accommodation_prices'),
+    path('api/accommodations/<str:id>/localized/', LocalizedAccommodationView.as_view(), name='accommodation_localized'),
+    path('api/locations/nearby/', LocationNearbyView.as_view(), name='location_nearby'),
+    path('api/locations/within/', LocationWithinView.as_view(), name='location_within'),
+    path('api/locations/<str:location_id>/stats/', LocationStatsView.as_view(), name='location_stats'),
+    path('api/locations/<str:location_id>/prices/', LocationPricesView.as_view(), name='location_prices'),
+    path('api/stats/countries/', CountryStatsView.as_view(), name='country_stats'),
+    path('api/export/<str:name>.<str:fmt>', ExportView.as_view(), name='export'),
+    path('api/changes/', ChangeFeedView.as_view(), name='changes'),
+    path('metrics', MetricsView.as_view(), name='metrics'),
+    path('api/cache/metrics/', CacheMetricsView.as_view(), name='cache_metrics'),
+    # Async variants of the read endpoints, for ASGI deployments
+    path('api/async/accommodations/', AsyncAccommodationListView.as_view(), name='accommodation_list_async'),
+    path('api/async/accommodations/nearby/', AsyncAccommodationNearbyView.as_view(), name='accommodation_nearby_async'),
+    path('api/async/accommodations/within/', AsyncAccommodationWithinView.as_view(), name='accommodation_within_async'),
+    path('api/async/locations/nearby/', AsyncLocationNearbyView.as_view(), name='location_nearby_async'),
+    path('api/async/locations/within/', AsyncLocationWithinView.as_view(), name='location_within_async'),
+    path('api/async/locations/<str:location_id>/stats/', AsyncLocationStatsView.as_view(), name='location_stats_async'),
 ]
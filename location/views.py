@@ -1,9 +1,39 @@
+from datetime import date, timedelta
+
 from django.shortcuts import render
 from django.contrib.auth.models import User
-from rest_framework.generics import CreateAPIView
+from rest_framework.generics import CreateAPIView, ListAPIView, RetrieveAPIView
+from django.core.files.storage import default_storage
+from django.core.handlers.asgi import ASGIRequest
+from django.http import FileResponse, Http404, HttpResponse, JsonResponse, StreamingHttpResponse
+from django.views import View
+from django.conf import settings
+from django.utils import timezone
+from rest_framework.exceptions import APIException, ValidationError
+from rest_framework.permissions import IsAdminUser
+from rest_framework.response import Response
+from rest_framework.views import APIView
 from django.contrib.auth.models import User
-from .serializers import UserSerializer
-from .forms import SignUpForm
+from .serializers import (
+    UserSerializer, AccommodationGeoSerializer, LocationGeoSerializer, LocationStatsSerializer,
+    AccommodationSearchSerializer, AccommodationListingSerializer, LocalizedListingSerializer,
+)
+from .forms import (
+    SignUpForm, AccommodationFilterForm, LocalizationForm, SearchForm, ExportForm, NearbyForm,
+    BoundingBoxForm, ChangesForm, PriceHistoryForm, MonthlyPricesForm,
+)
+from .cache import cached_payload, metrics
+from .changes import ChangeFeedError, compact, latest_cursor, read_changes
+from .exports import CONTENT_TYPES, EXPORTS, ExportError, aiter_chunks, export_chunks, gzip_chunks
+from .filters import filter_accommodations
+from .geo import nearby, within_bbox
+from .images import RENDITION_DIR, renditions_for
+from .instrumentation import render_prometheus
+from .localization import default_language, localized_content
+from .models import Accommodation, AccommodationListing, Location, LocationStats
+from .pagination import ListingCursorPagination
+from .prices import monthly_prices, price_history
+from .search import search_accommodations
 
 class UserSignUpView(CreateAPIView):
     queryset = User.objects.all()
@@ -34,3 +64,457 @@ class UserSignUpView(CreateAPIView):
         """
         context = {"form": SignUpForm()}
         return render(request, "sign_up.html", context)
+
+
+ACCOMMODATION_LIST_FIELDS = ('id', 'feed', 'title', 'country_code', 'bedroom_count', 'review_score',
+                             'usd_rate', 'location_id', 'center', 'amenities', 'created_at')
+LISTING_FIELDS = ('accommodation_id', 'feed', 'title', 'country_code', 'bedroom_count', 'review_score',
+                  'usd_rate', 'location_id', 'center', 'amenities', 'created_at', 'country_name',
+                  'location_title', 'breadcrumb', 'primary_image')
+LOCATION_GEO_FIELDS = ('id', 'title', 'location_type', 'country_code', 'state_abbr', 'city',
+                       'parent_id', 'center')
+DEFAULT_GEO_LIMIT = 50
+DEFAULT_SEARCH_LIMIT = 20
+
+
+def validated(form_class, params):
+    form = form_class(params)
+    if not form.is_valid():
+        raise ValidationError(form.errors)
+    return form.cleaned_data
+
+
+def published_accommodations(params):
+    """Published accommodations restricted to the list columns and the request's filters."""
+    queryset = Accommodation.objects.filter(published=True).only(*ACCOMMODATION_LIST_FIELDS)
+    return filter_accommodations(queryset, validated(AccommodationFilterForm, params))
+
+
+def published_listings(params, localized=False):
+    """
+    Published listings restricted to the list columns (and the descriptions
+    if ``localized``) and the request's filters.
+    """
+    fields = LISTING_FIELDS + ('localized',) if localized else LISTING_FIELDS
+    queryset = AccommodationListing.objects.filter(published=True).only(*fields)
+    return filter_accommodations(queryset, validated(AccommodationFilterForm, params), path='path')
+
+
+class AccommodationListView(ListAPIView):
+    """
+    Published accommodations, newest first, paginated by keyset cursor and
+    served from ``AccommodationListing``: one index range scan per page,
+    with the breadcrumb and country name already in each row. With
+    ``lang`` each row carries its localized description and policy.
+    """
+    serializer_class = AccommodationListingSerializer
+    pagination_class = ListingCursorPagination
+
+    def get_queryset(self):
+        return published_listings(self.request.query_params, localized=bool(self.get_language()))
+
+    def get_language(self):
+        return validated(LocalizationForm, self.request.query_params)['lang']
+
+    def get_serializer_class(self):
+        if self.get_language():
+            return LocalizedListingSerializer
+        return super().get_serializer_class()
+
+    def get_serializer_context(self):
+        context = super().get_serializer_context()
+        context['language'] = self.get_language()
+        return context
+
+
+class LocalizedAccommodationView(APIView):
+    """
+    One published accommodation with its description and policy in
+    ``lang`` (default ``LOCALIZATION_DEFAULT_LANGUAGE``), falling back along
+    ``LOCALIZATION_FALLBACKS``. Ids are unique per feed; ``feed`` defaults
+    to 0.
+    """
+
+    def get(self, request, id, *args, **kwargs):
+        params = validated(LocalizationForm, request.query_params)
+        language = params['lang'] or default_language()
+        listing = (AccommodationListing.objects.filter(published=True)
+                   .only(*LISTING_FIELDS, 'localized')
+                   .filter(accommodation_id=id, feed=params['feed'] or 0).first())
+        if listing is None:
+            raise Http404
+        return Response(LocalizedListingSerializer(listing, context={'language': language}).data)
+
+
+class AccommodationSearchView(APIView):
+    """
+    Published accommodations matching ``q`` in their title or their
+    description in ``lang``, best match first. Takes the filters of the
+    list endpoint (``country_code``, ``min_rate``/``max_rate``, ...);
+    ``limit`` caps the number of results.
+    """
+
+    def get(self, request, *args, **kwargs):
+        params = validated(SearchForm, request.query_params)
+        language = params['lang'] or default_language()
+        queryset = search_accommodations(
+            published_accommodations(request.query_params), params['q'], language)
+        results = list(queryset[:params['limit'] or DEFAULT_SEARCH_LIMIT])
+        serializer = AccommodationSearchSerializer(
+            results, many=True, context={'localized': localized_content(results, language)})
+        return Response({'results': serializer.data})
+
+
+class GeoSearchView(APIView):
+    """
+    Base for radius (``lat``/``lon``/``km``) and bounding box
+    (``west``/``south``/``east``/``north``) searches; ``limit`` caps the
+    number of results.
+    """
+    form_class = None
+    serializer_class = None
+
+    def get_queryset(self):
+        raise NotImplementedError
+
+    def search(self, queryset, params):
+        raise NotImplementedError
+
+    def get(self, request, *args, **kwargs):
+        params = validated(self.form_class, request.query_params)
+        limit = params.get('limit') or DEFAULT_GEO_LIMIT
+        results = self.search(self.get_queryset(), params)[:limit]
+        return Response({'results': self.serializer_class(results, many=True).data})
+
+
+class NearbyMixin:
+    form_class = NearbyForm
+
+    def search(self, queryset, params):
+        return nearby(queryset, params['lat'], params['lon'], params['km'])
+
+
+class WithinMixin:
+    form_class = BoundingBoxForm
+
+    def search(self, queryset, params):
+        return within_bbox(queryset, params['west'], params['south'], params['east'], params['north'])
+
+
+class AccommodationGeoView(GeoSearchView):
+    serializer_class = AccommodationGeoSerializer
+
+    def get_queryset(self):
+        return published_accommodations(self.request.query_params)
+
+
+class LocationGeoView(GeoSearchView):
+    serializer_class = LocationGeoSerializer
+
+    def get_queryset(self):
+        return Location.objects.only(*LOCATION_GEO_FIELDS)
+
+
+class AccommodationNearbyView(NearbyMixin, AccommodationGeoView):
+    pass
+
+
+class AccommodationWithinView(WithinMixin, AccommodationGeoView):
+    pass
+
+
+class LocationNearbyView(NearbyMixin, LocationGeoView):
+    pass
+
+
+class LocationWithinView(WithinMixin, LocationGeoView):
+    pass
+
+
+class LocationStatsView(RetrieveAPIView):
+    """
+    Rolled-up accommodation statistics of one location, read from the
+    rollup table only.
+    """
+    serializer_class = LocationStatsSerializer
+    queryset = LocationStats.objects.select_related('location_id')
+    lookup_field = 'location_id'
+
+
+class CountryStatsView(ListAPIView):
+    serializer_class = LocationStatsSerializer
+    queryset = (LocationStats.objects.select_related('location_id')
+                .filter(location_id__location_type='country')
+                .order_by('location_id__title'))
+
+    def list(self, request, *args, **kwargs):
+        return Response(country_stats_payload())
+
+
+@cached_payload(LocationStats, Location)
+def country_stats_payload():
+    # Changes only when the rollups are refreshed or a country is edited
+    return list(LocationStatsSerializer(CountryStatsView.queryset.all(), many=True).data)
+
+
+class CacheMetricsView(APIView):
+    """Cache hit/miss/eviction counters of the serving process."""
+    permission_classes = [IsAdminUser]
+
+    def get(self, request, *args, **kwargs):
+        return Response(metrics())
+
+
+class ExportView(APIView):
+    """
+    Stream ``locations`` or ``accommodations`` as ``.csv``, ``.jsonl`` or
+    ``.geojson``, optionally filtered by ``feed`` and ``country_code`` and
+    gzipped with ``gzip=1``. Rows are read through a server-side cursor and
+    written as they arrive, so neither the server nor the response buffers
+    the whole export; under ASGI through an async iterator, which Django
+    doesn't buffer either.
+    """
+    permission_classes = [IsAdminUser]
+
+    def get(self, request, name, fmt, *args, **kwargs):
+        if name not in EXPORTS or fmt not in CONTENT_TYPES:
+            raise Http404
+        params = validated(ExportForm, request.query_params)
+        try:
+            chunks = export_chunks(name, fmt, params['feed'], params['country_code'])
+            # Generators run lazily; pull the first chunk so bad filters fail here
+            chunks = _prepend(next(chunks), chunks)
+        except ExportError as e:
+            raise ValidationError(str(e))
+        filename, content_type = f"{name}.{fmt}", CONTENT_TYPES[fmt]
+        if params['gzip']:
+            chunks = gzip_chunks(chunks)
+            filename, content_type = filename + '.gz', 'application/gzip'
+        if isinstance(request._request, ASGIRequest):
+            chunks = aiter_chunks(chunks)
+        response = StreamingHttpResponse(chunks, content_type=content_type)
+        response['Content-Disposition'] = f'attachment; filename="{filename}"'
+        return response
+
+
+class ChangeFeedView(APIView):
+    """
+    Accommodation, localization and location changes after ``cursor``, in
+    commit order, for downstream consumers. Pass the returned ``cursor``
+    back to read the next batch; ``has_more`` tells whether to read again
+    right away. ``cursor=latest`` skips the history.
+    """
+    permission_classes = [IsAdminUser]
+
+    def get(self, request, *args, **kwargs):
+        params = validated(ChangesForm, request.query_params)
+        limit = params['limit'] or 500
+        cursor = latest_cursor() if params['cursor'] == 'latest' else params['cursor']
+        try:
+            changes, cursor = read_changes(cursor, limit, params['model'])
+        except ChangeFeedError as e:
+            raise ValidationError(str(e))
+        has_more = len(changes) == limit
+        if params['compact']:
+            changes = compact(changes)
+        return Response({'changes': changes, 'cursor': cursor, 'has_more': has_more})
+
+
+def _prepend(first, rest):
+    yield first
+    yield from rest
+
+
+class MetricsView(View):
+    """
+    Per-view request, query and latency counters, summed over all workers
+    with ``METRICS_DIR`` set, and the cache counters of this process in the
+    Prometheus text format. Open to
+    ``METRICS_ALLOWED_IPS`` (the scraper) and staff users.
+    """
+    http_method_names = ['get']
+
+    def get(self, request, *args, **kwargs):
+        allowed = getattr(settings, 'METRICS_ALLOWED_IPS', [])
+        if request.META.get('REMOTE_ADDR') not in allowed and not request.user.is_staff:
+            return HttpResponse(status=403)
+        return HttpResponse(render_prometheus(metrics()),
+                            content_type='text/plain; version=0.0.4; charset=utf-8')
+
+
+class AccommodationImagesView(APIView):
+    """Renditions of each image of one published accommodation (``feed`` defaults to 0)."""
+
+    def get(self, request, id, *args, **kwargs):
+        params = validated(LocalizationForm, request.query_params)
+        images = (Accommodation.objects.filter(published=True, id=id, feed=params['feed'] or 0)
+                  .values_list('images', flat=True).first())
+        if images is None:
+            raise Http404
+        available = renditions_for(images)
+        return Response({'images': [
+            {'source': source, 'renditions': available.get(source, {})} for source in images
+        ]})
+
+
+class AccommodationPricesView(APIView):
+    """
+    Rate and availability changes of one published accommodation from
+    ``since`` to before ``until`` (the last year by default), starting with
+    the values in effect at ``since``.
+    """
+
+    def get(self, request, id, *args, **kwargs):
+        params = validated(PriceHistoryForm, request.query_params)
+        feed = params['feed'] or 0
+        if not Accommodation.objects.filter(published=True, id=id, feed=feed).exists():
+            raise Http404
+        until = params['until'] or timezone.now().date() + timedelta(days=1)
+        since = params['since'] or until - timedelta(days=365)
+        return Response({'prices': price_history(id, feed, since, until)})
+
+
+class LocationPricesView(APIView):
+    """
+    Monthly average, lowest and highest rate of the accommodations at one
+    location or anywhere below it, over ``months`` months from ``start``
+    (the last 12 by default).
+    """
+
+    def get(self, request, location_id, *args, **kwargs):
+        params = validated(MonthlyPricesForm, request.query_params)
+        if not Location.objects.filter(pk=location_id).exists():
+            raise Http404
+        months = params['months'] or 12
+        start = params['start']
+        if start is None:
+            today = timezone.now().date()
+            start = _month(today.year * 12 + today.month - months)
+        end = _month(start.year * 12 + start.month - 1 + months - 1)
+        return Response({'months': monthly_prices(location_id, start, end)})
+
+
+def _month(index):
+    # First day of month number ``index`` counted from January of year 0
+    return date(index // 12, index % 12 + 1, 1)
+
+
+# Rendition names are hashes of their content, so a URL never changes meaning
+IMMUTABLE_CACHE_CONTROL = "public, max-age=31536000, immutable"
+
+
+class ImageView(View):
+    """
+    Serve a rendition file. With ``IMAGE_ACCEL_REDIRECT`` set (e.g.
+    ``/protected-media/``, an nginx ``internal`` location over
+    ``MEDIA_ROOT``) the response only names the file and nginx sends it;
+    otherwise the file is streamed from storage. Either way it may be
+    cached forever.
+    """
+    http_method_names = ['get', 'head']
+
+    def get(self, request, path, *args, **kwargs):
+        if not path.startswith(f"{RENDITION_DIR}/") or '..' in path.split('/'):
+            raise Http404
+        accel = getattr(settings, 'IMAGE_ACCEL_REDIRECT', None)
+        if accel:
+            response = HttpResponse(content_type='image/jpeg')
+            response['X-Accel-Redirect'] = f"{accel}{path}"
+        else:
+            try:
+                response = FileResponse(default_storage.open(path, 'rb'), content_type='image/jpeg')
+            except FileNotFoundError:
+                raise Http404
+        response['Cache-Control'] = IMMUTABLE_CACHE_CONTROL
+        return response
+
+
+class AsyncReadView(View):
+    """
+    Base for the async read endpoints under ``api/async/``. DRF views are
+    sync-only, so these are plain Django views that await the ORM and reuse
+    the forms, filters, pagination and serializers of the DRF endpoints,
+    returning the same JSON. Under ASGI a request waiting on the database
+    doesn't hold a worker thread.
+    """
+    http_method_names = ['get', 'head', 'options']
+
+    async def get_payload(self, request, *args, **kwargs):
+        raise NotImplementedError
+
+    async def get(self, request, *args, **kwargs):
+        try:
+            payload = await self.get_payload(request, *args, **kwargs)
+        except APIException as e:
+            detail = e.detail if isinstance(e.detail, dict) else {'detail': e.detail}
+            return JsonResponse(detail, status=e.status_code)
+        return JsonResponse(payload)
+
+
+class AsyncAccommodationListView(AsyncReadView):
+    pagination_class = ListingCursorPagination
+
+    async def get_payload(self, request, *args, **kwargs):
+        language = validated(LocalizationForm, request.GET)['lang']
+        paginator = self.pagination_class()
+        page = await paginator.apaginate_queryset(
+            published_listings(request.GET, localized=bool(language)), request)
+        if language:
+            results = LocalizedListingSerializer(page, many=True, context={'language': language}).data
+        else:
+            results = AccommodationListingSerializer(page, many=True).data
+        return {'next': paginator.get_next_link(), 'results': results}
+
+
+class AsyncGeoSearchView(AsyncReadView):
+    form_class = None
+    serializer_class = None
+
+    def get_queryset(self):
+        raise NotImplementedError
+
+    async def get_payload(self, request, *args, **kwargs):
+        params = validated(self.form_class, request.GET)
+        limit = params.get('limit') or DEFAULT_GEO_LIMIT
+        results = [obj async for obj in self.search(self.get_queryset(), params)[:limit]]
+        return {'results': self.serializer_class(results, many=True).data}
+
+
+class AsyncAccommodationGeoView(AsyncGeoSearchView):
+    serializer_class = AccommodationGeoSerializer
+
+    def get_queryset(self):
+        return published_accommodations(self.request.GET)
+
+
+class AsyncLocationGeoView(AsyncGeoSearchView):
+    serializer_class = LocationGeoSerializer
+
+    def get_queryset(self):
+        return Location.objects.only(*LOCATION_GEO_FIELDS)
+
+
+class AsyncAccommodationNearbyView(NearbyMixin, AsyncAccommodationGeoView):
+    pass
+
+
+class AsyncAccommodationWithinView(WithinMixin, AsyncAccommodationGeoView):
+    pass
+
+
+class AsyncLocationNearbyView(NearbyMixin, AsyncLocationGeoView):
+    pass
+
+
+class AsyncLocationWithinView(WithinMixin, AsyncLocationGeoView):
+    pass
+
+
+class AsyncLocationStatsView(AsyncReadView):
+    async def get_payload(self, request, location_id, *args, **kwargs):
+        try:
+            stats = await LocationStats.objects.select_related('location_id').aget(
+                location_id=location_id)
+        except LocationStats.DoesNotExist:
+            raise Http404
+        return LocationStatsSerializer(stats).data